@@ -0,0 +1,129 @@
+import os
+import ssl
+import sys
+import time
+import asyncio
+import datetime
+import argparse
+import tempfile
+import statistics
+
+import openai
+import requests
+import openai.api_requestor
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+from utilitarios_llm.servidor_stub import StubOpenAIServer
+from utilitarios_llm.clientes import configure_shared_session, shared_aiohttp_session
+
+#Mede a latência por requisição com e sem reuso de conexões, contra o servidor stub local:
+# - sync sem pool: uma sessão (e portanto uma conexão TCP/TLS) nova por requisição
+# - sync com pool: sessão compartilhada de utilitarios_llm/clientes.py
+# - async sem pool: uma sessão aiohttp nova por requisição (comportamento padrão da biblioteca openai)
+# - async com pool: shared_aiohttp_session
+#Com --tls o stub usa um certificado autoassinado, para incluir o custo do handshake TLS (como na API real).
+#Exemplo: python benchmarks/benchmark_conexoes.py --requests 200 --tls
+
+def self_signed_context(directory: str) -> ssl.SSLContext:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.utcnow()
+    certificate = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number()).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+def summary(name: str, latencies: list, server: StubOpenAIServer, connections_before: int) -> str:
+    latencies_ms: list = sorted(latency * 1000 for latency in latencies)
+    p95: float = latencies_ms[int(len(latencies_ms) * 0.95) - 1]
+    return (f"{name:<16}{statistics.mean(latencies_ms):>10.2f}{statistics.median(latencies_ms):>10.2f}{p95:>10.2f}"
+            f"{server.connections - connections_before:>12}")
+
+def run_sync(server: StubOpenAIServer, requests_count: int, pooled: bool, verify: bool) -> list:
+    if pooled:
+        session = configure_shared_session(api_base=server.api_base)
+        session.verify = verify
+        session.trust_env = verify
+    else:
+        def new_session() -> requests.Session:
+            session = requests.Session()
+            session.verify = verify
+            #Sem trust_env, um REQUESTS_CA_BUNDLE no ambiente não sobrepõe o verify=False do certificado autoassinado
+            session.trust_env = verify
+            return session
+        openai.requestssession = new_session
+
+    latencies: list = []
+    for i in range(requests_count):
+        if not pooled and hasattr(openai.api_requestor._thread_context, "session"):
+            #A biblioteca openai guarda a sessão por thread; removê-la força uma sessão (e conexão) nova
+            del openai.api_requestor._thread_context.session
+        start = time.perf_counter()
+        openai.Completion.create(model="text-davinci-003", prompt=f"prompt {i}")
+        latencies.append(time.perf_counter() - start)
+
+    if hasattr(openai.api_requestor._thread_context, "session"):
+        del openai.api_requestor._thread_context.session
+    return latencies
+
+async def run_async(requests_count: int, pooled: bool, verify: bool) -> list:
+    import aiohttp
+
+    async def timed(i: int) -> float:
+        start = time.perf_counter()
+        await openai.Completion.acreate(model="text-davinci-003", prompt=f"prompt {i}")
+        return time.perf_counter() - start
+
+    latencies: list = []
+    if pooled:
+        async with shared_aiohttp_session() as session:
+            session.connector._ssl = None if verify else False
+            for i in range(requests_count):
+                latencies.append(await timed(i))
+    else:
+        for i in range(requests_count):
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=None if verify else False)) as session:
+                token = openai.aiosession.set(session)
+                latencies.append(await timed(i))
+                openai.aiosession.reset(token)
+    return latencies
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de reuso de conexões HTTP com o servidor stub")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--tls", action="store_true", help="usa HTTPS com certificado autoassinado")
+    args = parser.parse_args()
+
+    openai.api_key = "sk-stub"
+    if args.tls:
+        import urllib3
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    with tempfile.TemporaryDirectory() as directory:
+        context = self_signed_context(directory) if args.tls else None
+        with StubOpenAIServer(ssl_context=context) as server:
+            openai.api_base = server.api_base
+            print(f"{args.requests} requisições sequenciais para {server.api_base}")
+            print(f"{'cenário':<16}{'média ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'conexões':>12}")
+            for name, pooled in (("sync sem pool", False), ("sync com pool", True)):
+                before = server.connections
+                print(summary(name, run_sync(server, args.requests, pooled, verify=not args.tls), server, before))
+            for name, pooled in (("async sem pool", False), ("async com pool", True)):
+                before = server.connections
+                print(summary(name, asyncio.run(run_async(args.requests, pooled, verify=not args.tls)), server, before))
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import tracemalloc
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+from utilitarios_llm.conversas import ChatMessage, ConversationStore
+
+#Benchmark do ConversationStore (utilitarios_llm/conversas.py):
+# - memória: bytes por ChatMessage com __slots__ vs a classe antiga do quickstart (com __dict__)
+# - turno: adicionar as 2 mensagens de um turno e ler as últimas mensagens para o prompt, em sessões com histórico
+#   curto e longo, no store vs um arquivo JSON por sessão (lido e regravado inteiro a cada turno)
+# - LRU: recent() de sessões em memória vs sessões lidas do disco
+# - escrita concorrente: mensagens adicionadas por segundo por várias threads, com 1 shard e com --shards shards
+#Exemplo: python benchmarks/benchmark_conversas.py --turns 2000 --threads 8
+class DictChatMessage:
+    def __init__(self, who: str, msg: str):
+        self.who = who
+        self.msg = msg
+
+def measure_memory(count: int):
+    for name, cls in (("ChatMessage antigo (__dict__)", DictChatMessage), ("ChatMessage (__slots__)", ChatMessage)):
+        tracemalloc.start()
+        messages: list = [cls("Me", f"message {i}") for i in range(count)]
+        size: int = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{name:<32} {size / len(messages):>10.0f} bytes/mensagem")
+
+def json_turn(directory: str, session_id: str, message: str, limit: int) -> list:
+    path: str = os.path.join(directory, f"{session_id}.json")
+    history: list = []
+    if os.path.exists(path):
+        with open(path) as f:
+            history = json.load(f)
+    history += [["Me", message], ["Bot", "reply"]]
+    with open(path, "w") as f:
+        json.dump(history, f)
+    return history[-limit:]
+
+def store_turn(store: ConversationStore, session_id: str, message: str, limit: int) -> list:
+    store.extend(session_id, [("Me", message), ("Bot", "reply")])
+    return store.recent(session_id, limit)
+
+def measure_turns(args, directory: str):
+    store = ConversationStore(os.path.join(directory, "store"), shards=args.shards)
+    json_dir: str = os.path.join(directory, "json")
+    os.makedirs(json_dir)
+    for length in (10, args.long_history):
+        session_id: str = f"historico-{length}"
+        store.extend(session_id, [("Me", f"m{i}") for i in range(length)])
+        with open(os.path.join(json_dir, f"{session_id}.json"), "w") as f:
+            json.dump([["Me", f"m{i}"] for i in range(length)], f)
+
+        for name, turn in (("arquivo JSON", lambda: json_turn(json_dir, session_id, "hi", 20)),
+                           ("ConversationStore", lambda: store_turn(store, session_id, "hi", 20))):
+            start: float = time.perf_counter()
+            for _ in range(args.turns):
+                turn()
+            elapsed: float = time.perf_counter() - start
+            print(f"{name:<20} histórico {length:>6}: {elapsed / args.turns * 1e6:>10.1f} µs/turno")
+
+    #LRU: as mesmas sessões lidas com o LRU maior e menor que o número de sessões
+    for cache_size in (args.sessions, 1):
+        lru = ConversationStore(os.path.join(directory, "store"), cache_size=cache_size)
+        session_ids: list = [f"lru-{i}" for i in range(args.sessions)]
+        for session_id in session_ids:
+            lru.extend(session_id, [("Me", f"m{i}") for i in range(lru.hot_messages)])
+        start = time.perf_counter()
+        for session_id in session_ids * 10:
+            lru.recent(session_id)
+        elapsed = time.perf_counter() - start
+        print(f"recent() cache_size={cache_size:<5} {elapsed / (len(session_ids) * 10) * 1e6:>10.1f} µs/leitura "
+              f"(hits {lru.hits}, misses {lru.misses})")
+        lru.close()
+    store.close()
+
+def measure_concurrency(args, directory: str):
+    for shards in (1, args.shards):
+        store = ConversationStore(os.path.join(directory, f"concorrente-{shards}"), shards=shards)
+
+        def worker(n: int):
+            for i in range(args.turns):
+                store.append(f"sessao-{n}-{i % args.sessions}", "Me", f"message {i}")
+
+        threads: list = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        print(f"{shards:>3} shard(s), {args.threads} threads: {args.threads * args.turns / elapsed:>10,.0f} mensagens/s")
+        store.close()
+
+def main(args):
+    measure_memory(args.messages)
+    print()
+    with tempfile.TemporaryDirectory() as directory:
+        measure_turns(args, directory)
+        print()
+        measure_concurrency(args, directory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do armazenamento persistente de conversas")
+    parser.add_argument("--turns", type=int, default=1000, help="turnos por cenário (e mensagens por thread)")
+    parser.add_argument("--long-history", type=int, default=5000, help="mensagens da sessão com histórico longo")
+    parser.add_argument("--sessions", type=int, default=200, help="sessões do cenário do LRU e por thread")
+    parser.add_argument("--messages", type=int, default=100000, help="mensagens do cenário de memória")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--shards", type=int, default=16)
+    main(parser.parse_args())
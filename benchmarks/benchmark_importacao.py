@@ -0,0 +1,140 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+import statistics
+import subprocess
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.join(current_dir, "..")
+
+#Tempo de inicialização (cold start) dos pontos de entrada, medido em processos novos:
+# - wall: tempo total do processo python (interpretador + imports), mediana de --runs execuções
+# - imports: soma do tempo de importação dos módulos de primeiro nível, segundo o python -X importtime
+# - top: os módulos que mais pesam, pelo tempo acumulado (incluindo o que importam) e pelo tempo próprio
+#Os cenários *.menu medem o que roda antes do menu aparecer; os demais, o que é carregado ao escolher uma opção.
+#Os resultados são gravados em JSON (por padrão benchmarks/resultados/importacao-<commit>.json); --compare mostra a
+#diferença em relação a um resultado anterior.
+#Exemplo: python benchmarks/benchmark_importacao.py --runs 5 --compare benchmarks/resultados/importacao-abc1234.json
+SCENARIOS: dict = {
+    "quickstart.menu": "import quickstart",
+    "cookbook01.menu": "import cookbook01",
+    "selector.menu": "import selector",
+    "quickstart.option": "import quickstart; import utilitarios_llm.clientes, utilitarios_llm.cache_respostas",
+    "quickstart.agent": "import quickstart; import utilitarios_llm.clientes, utilitarios_llm.agente",
+    "selector.option": "import selector; import utilitarios_llm.indice_exemplos, utilitarios_llm.selecao_exemplos",
+    "langchain": "import langchain",
+    #O que a thread de prefetch_api_keys carrega em segundo plano
+    "api_keys.prefetch": "import gerenciador_api_keys.recupera_api_key; import cryptography.fernet",
+}
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+def git_commit() -> tuple:
+    try:
+        commit: str = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty: bool = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root_dir, capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+def environment() -> dict:
+    env: dict = dict(os.environ)
+    paths: list = [root_dir, os.path.join(root_dir, "quickstart"), os.path.join(root_dir, "cookbook_01")]
+    env["PYTHONPATH"] = os.pathsep.join(paths + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    return env
+
+#Executa o código em um processo novo e retorna (segundos, linhas do -X importtime)
+def run(code: str, importtime: bool) -> tuple:
+    command: list = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    start: float = time.perf_counter()
+    result = subprocess.run(command, env=environment(), capture_output=True, text=True)
+    elapsed: float = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{code!r} falhou:\n{result.stderr[-2000:]}")
+    return elapsed, result.stderr.splitlines()
+
+#[(módulo, tempo próprio em µs, tempo acumulado em µs, nível)]
+def parse_importtime(lines: list) -> list:
+    modules: list = []
+    for line in lines:
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules.append((name, int(own), int(cumulative), len(indent) // 2))
+    return modules
+
+def measure(name: str, code: str, args) -> dict:
+    #A primeira execução compila o bytecode dos módulos; ela não entra na medição
+    run(code, importtime=False)
+    walls: list = [run(code, importtime=False)[0] for _ in range(args.runs)]
+    modules: list = parse_importtime(run(code, importtime=True)[1])
+    top_level: list = [module for module in modules if module[3] == 0]
+    return {
+        "wall_ms": round(statistics.median(walls) * 1000, 1),
+        "wall_min_ms": round(min(walls) * 1000, 1),
+        "imports_ms": round(sum(module[2] for module in top_level) / 1000, 1),
+        "modules": len(modules),
+        "top_cumulative": [
+            {"module": module, "ms": round(cumulative / 1000, 1)}
+            for module, _, cumulative, _ in sorted(modules, key=lambda module: -module[2])[:args.top]
+        ],
+        "top_self": [
+            {"module": module, "ms": round(own / 1000, 1)}
+            for module, own, _, _ in sorted(modules, key=lambda module: -module[1])[:args.top]
+        ],
+    }
+
+def print_results(results: dict, baseline: dict = None, top: int = 0):
+    header: str = f"{'cenário':<22}{'wall ms':>10}{'imports ms':>12}{'módulos':>9}"
+    if baseline:
+        header += f"{'Δwall':>9}"
+    print(header)
+    for name, result in results.items():
+        line: str = f"{name:<22}{result['wall_ms']:>10.1f}{result['imports_ms']:>12.1f}{result['modules']:>9}"
+        previous: dict = (baseline or {}).get(name)
+        if previous and previous["wall_ms"]:
+            line += f"{(result['wall_ms'] - previous['wall_ms']) / previous['wall_ms'] * 100:>+8.1f}%"
+        print(line)
+        for entry in result["top_cumulative"][:top]:
+            print(f"    {entry['ms']:>9.1f} ms  {entry['module']}")
+
+def main(args):
+    commit, dirty = git_commit()
+    scenarios: dict = {name: code for name, code in SCENARIOS.items() if re.search(args.scenarios, name)}
+    results: dict = {}
+    for name, code in scenarios.items():
+        print(f"medindo {name}...", file=sys.stderr)
+        results[name] = measure(name, code, args)
+
+    report: dict = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {"runs": args.runs},
+        "scenarios": results,
+    }
+    baseline: dict = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["scenarios"]
+    print_results(results, baseline, args.show_top)
+
+    output: str = args.output or os.path.join(current_dir, "resultados", f"importacao-{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"resultados gravados em {output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tempo de importação (cold start) dos pontos de entrada, com python -X importtime")
+    parser.add_argument("--scenarios", default=".", help="regex para filtrar os cenários (ex: menu)")
+    parser.add_argument("--runs", type=int, default=5, help="execuções por cenário para a mediana do tempo total")
+    parser.add_argument("--top", type=int, default=15, help="módulos mais pesados guardados no JSON")
+    parser.add_argument("--show-top", type=int, default=5, help="módulos mais pesados mostrados por cenário")
+    parser.add_argument("--output", help="arquivo JSON de saída")
+    parser.add_argument("--compare", help="arquivo JSON de um resultado anterior")
+    main(parser.parse_args())
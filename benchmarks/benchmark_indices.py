@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+from utilitarios_llm.indice_exemplos import INDEX_KINDS, create_faiss_index
+
+#Compara os tipos de índice do PersistentExampleIndex (ivf, ivfpq, hnsw) com a busca exata (flat):
+#tempo de treino e de inserção, latência por consulta (p50/p95) e recall@k em relação ao resultado do flat.
+#Por padrão usa vetores aleatórios normalizados; com --vectors usa os embeddings reais de um EmbeddingStore (vectors.f32).
+#Exemplo: python benchmarks/benchmark_indices.py --size 50000 --nprobe 16 --ef-search 128
+
+def load_vectors(args) -> np.ndarray:
+    if args.vectors:
+        vectors = np.fromfile(args.vectors, dtype=np.float32).reshape(-1, args.dim)[:args.size].copy()
+    else:
+        rng = np.random.default_rng(42)
+        vectors = rng.standard_normal((args.size, args.dim), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def recall_at_k(result_ids: np.ndarray, truth_ids: np.ndarray) -> float:
+    hits: int = sum(len(set(result) & set(truth)) for result, truth in zip(result_ids, truth_ids))
+    return hits / truth_ids.size
+
+def run(kind: str, vectors: np.ndarray, queries: np.ndarray, truth_ids: np.ndarray, args) -> dict:
+    params: dict = {
+        "nlist": args.nlist, "nprobe": args.nprobe, "pq_m": args.pq_m,
+        "hnsw_m": args.hnsw_m, "hnsw_ef_search": args.ef_search,
+    }
+    index = create_faiss_index(vectors.shape[1], kind, params)
+
+    start = time.perf_counter()
+    if not index.is_trained:
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), min(args.train_size, len(vectors)), replace=False)]
+        index.train(sample)
+    train_time: float = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+    add_time: float = time.perf_counter() - start
+
+    #Uma consulta por vez, como no example selector
+    latencies: list = []
+    result_ids: list = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), args.k)
+        latencies.append(time.perf_counter() - start)
+        result_ids.append(ids[0])
+
+    return {
+        "kind": kind,
+        "train_s": train_time,
+        "add_s": add_time,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "recall": recall_at_k(np.array(result_ids), truth_ids),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de recall@k e latência dos índices de exemplos")
+    parser.add_argument("--size", type=int, default=20000, help="número de vetores na base")
+    parser.add_argument("--dim", type=int, default=1536, help="dimensão (1536 = text-embedding-ada-002)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--vectors", help="arquivo vectors.f32 de um EmbeddingStore")
+    parser.add_argument("--kinds", default=",".join(INDEX_KINDS))
+    parser.add_argument("--train-size", type=int, default=10000)
+    parser.add_argument("--nlist", type=int, default=100)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--pq-m", type=int, default=16)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, default=64)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    #Consultas próximas (mas não iguais) a vetores da base, como em uma busca real por exemplos semelhantes
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)] + rng.normal(0, 0.01, (args.queries, vectors.shape[1])).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    flat = create_faiss_index(vectors.shape[1], "flat")
+    flat.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+    _, truth_ids = flat.search(queries, args.k)
+
+    print(f"{len(vectors)} vetores de dimensão {vectors.shape[1]}, {args.queries} consultas, k={args.k}")
+    print(f"{'índice':<8}{'treino (s)':>12}{'inserção (s)':>14}{'p50 (ms)':>10}{'p95 (ms)':>10}{'recall@k':>10}")
+    for kind in args.kinds.split(","):
+        result: dict = run(kind, vectors, queries, truth_ids, args)
+        print(f"{result['kind']:<8}{result['train_s']:>12.3f}{result['add_s']:>14.3f}"
+              f"{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['recall']:>10.3f}")
@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import argparse
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+from utilitarios_llm.templates import CachedFewShotPromptTemplate, format_many, get_prompt_template
+
+from langchain.prompts import FewShotPromptTemplate, PromptTemplate
+
+#Formatações por segundo dos templates de prompt, antes (PromptTemplate do langchain) e depois (utilitarios_llm/templates.py):
+# - new+format: cria o PromptTemplate e formata a cada chamada, como era feito em quickstart e cookbook01
+# - format: formata um PromptTemplate já criado
+# - registry: get_prompt_template + format a cada chamada
+# - format_many: formata a lista inteira de uma vez
+# - few-shot: FewShotPromptTemplate com exemplos fixos vs CachedFewShotPromptTemplate
+#Exemplo: python benchmarks/benchmark_templates.py --calls 50000
+TEMPLATE: str = "What are 5 vacation destinations for someone who likes to eat {food}"
+EXAMPLE_TEMPLATE: str = "Example Input: {input}\nExample Output: {output}"
+EXAMPLES: list = [
+    {"input": "pirate", "output": "ship"},
+    {"input": "pilot", "output": "plane"},
+    {"input": "driver", "output": "car"},
+    {"input": "tree", "output": "ground"},
+    {"input": "bird", "output": "nest"},
+]
+
+def measure(name: str, calls: int, fn) -> float:
+    start = time.perf_counter()
+    fn()
+    elapsed: float = time.perf_counter() - start
+    rate: float = calls / elapsed
+    print(f"{name:<32} {rate:>14,.0f} formats/s")
+    return rate
+
+def few_shot_kwargs(example_prompt) -> dict:
+    return {
+        "examples": EXAMPLES, "example_prompt": example_prompt,
+        "prefix": "Give the location an item is usually found in", "suffix": "Input: {noun}\nOutput:",
+        "input_variables": ["noun"],
+    }
+
+def main(args):
+    foods: list = [f"food {i}" for i in range(args.calls)]
+    inputs: list = [{"food": food} for food in foods]
+
+    print("PromptTemplate")
+    before = measure("new+format (langchain)", args.calls, lambda: [
+        PromptTemplate(input_variables=["food"], template=TEMPLATE).format(food=food) for food in foods
+    ])
+    prompt = PromptTemplate(input_variables=["food"], template=TEMPLATE)
+    measure("format (langchain)", args.calls, lambda: [prompt.format(food=food) for food in foods])
+    after = measure("registry+format", args.calls, lambda: [
+        get_prompt_template(TEMPLATE, ["food"]).format(food=food) for food in foods
+    ])
+    many = measure("format_many", args.calls, lambda: format_many(get_prompt_template(TEMPLATE, ["food"]), inputs))
+    print(f"speedup: {after / before:.1f}x per call, {many / before:.1f}x with format_many")
+
+    print()
+    print("FewShotPromptTemplate")
+    nouns: list = [f"noun {i}" for i in range(args.calls // 5)]
+    few_shot = FewShotPromptTemplate(**few_shot_kwargs(PromptTemplate(input_variables=["input", "output"], template=EXAMPLE_TEMPLATE)))
+    before = measure("format (langchain)", len(nouns), lambda: [few_shot.format(noun=noun) for noun in nouns])
+    cached = CachedFewShotPromptTemplate(**few_shot_kwargs(get_prompt_template(EXAMPLE_TEMPLATE, ["input", "output"])))
+    assert cached.format(noun="x") == few_shot.format(noun="x")
+    after = measure("format (cached examples)", len(nouns), lambda: [cached.format(noun=noun) for noun in nouns])
+    print(f"speedup: {after / before:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de formatações por segundo dos templates de prompt")
+    parser.add_argument("--calls", type=int, default=20000)
+    main(parser.parse_args())
@@ -0,0 +1,249 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import builtins
+import argparse
+import datetime
+import tempfile
+import importlib.util
+import subprocess
+import tracemalloc
+import contextlib
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.join(current_dir, "..")
+sys.path.append(root_dir)
+from utilitarios_llm.servidor_stub import StubOpenAIServer
+
+#Executa todas as opções de menu (LangChainTest.test_* de quickstart.py e cookbook01.py, e o use_selector de selector.py)
+#contra o servidor stub local, sem chaves e sem internet (a SerpAPI também é simulada pelo stub).
+#Para cada cenário: latência p50/p95/p99, throughput (execuções por segundo), requisições ao stub por execução e
+#alocações (pico de memória e blocos retidos, medidos com tracemalloc numa execução separada).
+#Os resultados são gravados em JSON (por padrão benchmarks/resultados/<commit>.json); --compare mostra a diferença
+#em relação a um resultado anterior.
+#Os caches persistentes (respostas, embeddings, índice de exemplos) ficam numa pasta temporária. Os caches de respostas e
+#das tools do agent são limpos antes de cada execução, a não ser com --warm-cache.
+#Exemplo: python benchmarks/executa_benchmarks.py --latency 0.05 --tokens-per-second 100 --error-rate 0.05 --compare benchmarks/resultados/abc1234.json
+SELECTOR_INPUT: str = "plane"
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def git_commit() -> tuple:
+    try:
+        commit: str = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty: bool = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root_dir, capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+def percentile(values: list, fraction: float) -> float:
+    ordered: list = sorted(values)
+    position: float = (len(ordered) - 1) * fraction
+    lower: int = int(position)
+    upper: int = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+#Cenários: nome -> função sem argumentos
+def build_scenarios(args, server: StubOpenAIServer) -> dict:
+    from utilitarios_llm.clientes import create_model_clients
+    from utilitarios_llm.cache_embeddings import CachedEmbeddings
+
+    quickstart = load_module("quickstart_app", os.path.join(root_dir, "quickstart", "quickstart.py"))
+    cookbook = load_module("cookbook01_app", os.path.join(root_dir, "cookbook_01", "cookbook01.py"))
+    selector = load_module("selector_app", os.path.join(root_dir, "cookbook_01", "selector.py"))
+
+    clients = create_model_clients(os.environ["OPENAI_API_KEY"], api_base=server.api_base)
+    #O cache de embeddings só entra com --warm-cache; sem ele, test_text_embedding mede sempre as chamadas à API
+    embeddings = CachedEmbeddings(clients.embeddings) if args.warm_cache else clients.embeddings
+    tests: list = [
+        ("quickstart", quickstart.LangChainTest(clients.llm, stream=args.stream)),
+        ("cookbook01", cookbook.LangChainTest(clients.chat, embeddings, clients.llm, stream=args.stream)),
+    ]
+
+    scenarios: dict = {}
+    for prefix, test in tests:
+        for name in sorted(dir(test)):
+            if name.startswith("test_"):
+                scenarios[f"{prefix}.{name}"] = getattr(test, name)
+    scenarios["selector.use_selector"] = lambda: selector.use_selector(clients.llm)
+    scenarios["selector.use_selector_persistent"] = lambda: selector.use_selector(
+        clients.llm, os.path.join(os.environ["BENCHMARK_WORK_DIR"], "indice_exemplos")
+    )
+    return {name: fn for name, fn in scenarios.items() if re.search(args.scenarios, name)}
+
+def clear_caches():
+    from utilitarios_llm.agente import get_tool_cache
+    from utilitarios_llm.cache_respostas import get_response_cache
+
+    get_response_cache().clear()
+    get_tool_cache().clear()
+
+@contextlib.contextmanager
+def quiet(verbose: bool):
+    if verbose:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def run_once(fn, args) -> tuple:
+    if not args.warm_cache:
+        clear_caches()
+    start: float = time.perf_counter()
+    try:
+        with quiet(args.verbose):
+            fn()
+        error: str = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return time.perf_counter() - start, error
+
+def measure_allocations(fn, args) -> dict:
+    if not args.warm_cache:
+        clear_caches()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    try:
+        with quiet(args.verbose):
+            fn()
+    except Exception:
+        pass
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained: list = after.compare_to(before, "filename")
+    return {
+        "peak_kb": round(peak / 1024, 1),
+        "retained_kb": round(sum(stat.size_diff for stat in retained) / 1024, 1),
+        "retained_blocks": sum(stat.count_diff for stat in retained),
+    }
+
+def run_scenario(name: str, fn, args, server: StubOpenAIServer) -> dict:
+    for _ in range(args.warmup):
+        run_once(fn, args)
+
+    latencies: list = []
+    errors: list = []
+    requests_before: int = server.requests
+    searches_before: int = server.searches
+    start: float = time.perf_counter()
+    for _ in range(args.iterations):
+        elapsed, error = run_once(fn, args)
+        latencies.append(elapsed)
+        if error:
+            errors.append(error)
+    total: float = time.perf_counter() - start
+
+    result: dict = {
+        "iterations": args.iterations,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "throughput_per_s": round(args.iterations / total, 3),
+        "requests_per_iteration": round((server.requests - requests_before) / args.iterations, 2),
+        "searches_per_iteration": round((server.searches - searches_before) / args.iterations, 2),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+    if not args.no_alloc:
+        result["allocations"] = measure_allocations(fn, args)
+    return result
+
+def print_results(results: dict, baseline: dict = None):
+    header: str = f"{'cenário':<52}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'exec/s':>9}{'req':>6}{'pico KB':>10}{'erros':>7}"
+    if baseline:
+        header += f"{'Δp50':>9}{'Δp95':>9}"
+    print(header)
+    for name, result in results.items():
+        line: str = (
+            f"{name:<52}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+            f"{result['throughput_per_s']:>9.2f}{result['requests_per_iteration']:>6.1f}"
+            f"{result.get('allocations', {}).get('peak_kb', 0):>10.0f}{result['errors']:>7}"
+        )
+        previous: dict = (baseline or {}).get(name)
+        if previous:
+            for key in ("p50_ms", "p95_ms"):
+                change: float = (result[key] - previous[key]) / previous[key] * 100 if previous[key] else 0.0
+                line += f"{change:>+8.1f}%"
+        print(line)
+        if result["first_error"]:
+            print(f"    {result['first_error'][:150]}")
+
+def main(args):
+    commit, dirty = git_commit()
+    work_dir: str = tempfile.mkdtemp(prefix="benchmark_llm_")
+    #Precisa ser definido antes de importar os módulos, que leem essas variáveis na importação
+    os.environ["BENCHMARK_WORK_DIR"] = work_dir
+    os.environ["LLM_CACHE_PATH"] = os.path.join(work_dir, "llm_responses.sqlite")
+    os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(work_dir, "embeddings")
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    os.environ["SERPAPI_API_KEY"] = "stub"
+
+    import serpapi
+    from utilitarios_llm.agendador import configure_scheduler
+
+    server = StubOpenAIServer(
+        latency=args.latency, tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, search_latency=args.search_latency,
+    )
+    with server:
+        serpapi.SerpApiClient.BACKEND = server.base_url
+        #Backoff curto: os erros injetados são repetidos sem dominar o tempo medido
+        configure_scheduler(base_delay=args.retry_delay, max_delay=args.retry_delay * 8)
+        original_input = builtins.input
+        builtins.input = lambda prompt="": SELECTOR_INPUT
+        try:
+            scenarios: dict = build_scenarios(args, server)
+            results: dict = {}
+            for name, fn in scenarios.items():
+                print(f"executando {name}...", file=sys.stderr)
+                results[name] = run_scenario(name, fn, args, server)
+        finally:
+            builtins.input = original_input
+
+    report: dict = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "verbose")},
+        "scenarios": results,
+    }
+    baseline: dict = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["scenarios"]
+    print_results(results, baseline)
+
+    output: str = args.output or os.path.join(current_dir, "resultados", f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"resultados gravados em {output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark das opções de menu contra o servidor stub local")
+    parser.add_argument("--scenarios", default=".", help="regex para filtrar os cenários (ex: quickstart)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="latência por requisição, em segundos")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="velocidade de geração dos tokens")
+    parser.add_argument("--completion-tokens", type=int, default=32, help="tokens extras em cada resposta")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de requisições com erro 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fração de requisições com erro 429")
+    parser.add_argument("--search-latency", type=float, default=None, help="latência da SerpAPI simulada")
+    parser.add_argument("--retry-delay", type=float, default=0.05, help="atraso base do backoff do agendador")
+    parser.add_argument("--stream", action="store_true", help="executa os testes com streaming")
+    parser.add_argument("--warm-cache", action="store_true", help="não limpa os caches entre execuções")
+    parser.add_argument("--no-alloc", action="store_true", help="não mede alocações (tracemalloc)")
+    parser.add_argument("--output", help="arquivo JSON de saída")
+    parser.add_argument("--compare", help="arquivo JSON de um resultado anterior")
+    parser.add_argument("--verbose", action="store_true", help="mostra a saída dos testes")
+    main(parser.parse_args())
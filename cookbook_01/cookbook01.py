@@ -1,27 +1,48 @@
+from __future__ import annotations
+
 import os
 import sys
+import argparse
+from typing import TYPE_CHECKING
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, ".."))
-from gerenciador_api_keys.recupera_api_key import get_api_key
-
-from langchain import PromptTemplate
-from langchain.llms import OpenAI
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage, AIMessage, Document
-from langchain.embeddings import OpenAIEmbeddings
+from gerenciador_api_keys.recupera_api_key import prefetch_api_keys
+from utilitarios_llm.lote import add_batch_arguments, run_batch_from_args
+from utilitarios_llm.servidor import add_server_arguments, run_server_from_args, test_operations, worker_directory
+
+#Os módulos que dependem do langchain são importados dentro das funções que os usam, para que o menu apareça sem
+#esperar a importação do langchain (ver quickstart/quickstart.py e benchmarks/benchmark_importacao.py)
+if TYPE_CHECKING:
+    from langchain import PromptTemplate
+    from langchain.llms import OpenAI
+    from langchain.chat_models import ChatOpenAI
+    from langchain.schema import AIMessage
+    from langchain.embeddings.base import Embeddings
+    from utilitarios_llm.historico_chat import ChatHistoryManager
+    from utilitarios_llm.cache_semantico import SemanticResponseCache
 
 #Schemas - TEXT (Igual ao primeiro teste de quickstart)
 
 #Schemas - CHAT
 #A função abaixo mostra uma mecanica possível para um chatbot com armazenamento do histórico da conversa
-def basic_chat(chat: ChatOpenAI, initial_context:str, message: str) -> list:
+#Com stream=True a resposta é impressa token a token, seguida do tempo até o primeiro token e do tempo total
+def basic_chat(chat: ChatOpenAI, initial_context:str, message: str, stream: bool = False) -> list:
+    from langchain.schema import HumanMessage, SystemMessage
+    from utilitarios_llm.streaming import StreamingTimingHandler, streaming_model
+
     chat_history: list = [
         SystemMessage(content=initial_context),
         HumanMessage(content=message)
     ]
 
-    response: AIMessage = chat(chat_history)
+    if stream:
+        handler = StreamingTimingHandler()
+        response: AIMessage = streaming_model(chat)(chat_history, callbacks=[handler])
+        print()
+        print(handler.report())
+    else:
+        response: AIMessage = chat(chat_history)
     chat_history.append(response)
 
     return chat_history
@@ -30,6 +51,8 @@ def basic_chat(chat: ChatOpenAI, initial_context:str, message: str) -> list:
 #Várias chamadas do método podem ser encadeadas para dar continuidade a um chat, enviando todo o histórico a cada vez
 #Esse protocolo é necessário pois o chat é "stateless", a IA não tem como armazenar por conta própria o histórico
 def chat_from_history(chat: ChatOpenAI, chat_history: list, new_message:str) -> list:
+    from langchain.schema import HumanMessage
+
     #Create a copy of chat_history
     new_chat = chat_history.copy()
     new_chat.append(HumanMessage(content=new_message, example=False))
@@ -38,8 +61,22 @@ def chat_from_history(chat: ChatOpenAI, chat_history: list, new_message:str) ->
 
     return new_chat
 
+#Versão da função acima para conversas longas: o histórico fica em um ChatHistoryManager, que recebe as mensagens
+#novas no próprio objeto (sem copiar a lista a cada turno) e envia ao modelo somente o que cabe no orçamento de tokens.
+#As mensagens mais antigas são descartadas ou resumidas, conforme a estratégia do ChatHistoryManager.
+def chat_from_bounded_history(chat: ChatOpenAI, history: ChatHistoryManager, new_message: str) -> AIMessage:
+    from langchain.schema import HumanMessage
+
+    history.append(HumanMessage(content=new_message, example=False))
+    response: AIMessage = chat(history.context())
+    history.append(response)
+
+    return response
+
 #Schemas - DOCUMENT
 def use_document():
+    from langchain.schema import Document
+
     document:Document = Document(page_content="This is my document. It is full of text that I've gathered from other places",
          metadata={
              'my_document_id' : 234234,
@@ -51,13 +88,18 @@ def use_document():
 #Language Model - Explorado anteriormente - responder perguntas simples
 #Chat Model - explorado acima
 #Text Embedding Model
-def use_text_embedding(embeddings: OpenAIEmbeddings):
+#embeddings pode ser um CachedEmbeddings (utilitarios_llm/cache_embeddings.py): textos já embedados são lidos do disco
+def use_text_embedding(embeddings: Embeddings):
     text = "Hi! It's time for the beach"
     text_embedding = embeddings.embed_query(text)
     print(f"Your embedding is length {len(text_embedding)}")
     print(f"Here's a sample: {text_embedding[:5]}...")
 
-def use_prompt(davinci_llm: OpenAI):
+#use_cache controla o cache persistente de respostas (utilitarios_llm/cache_respostas.py):
+#None = somente chamadas determinísticas (temperature 0) usam o cache, True = usa sempre, False = nunca usa.
+def use_prompt(davinci_llm: OpenAI, use_cache: bool = None, stream: bool = False):
+    from utilitarios_llm.cache_respostas import response_cache_scope
+    from utilitarios_llm.streaming import StreamingTimingHandler, streaming_model
 
 
     # I like to use three double quotation marks for my prompts because it's easier to read
@@ -69,44 +111,74 @@ def use_prompt(davinci_llm: OpenAI):
 
     print(prompt)
 
-    response: str = davinci_llm(prompt)
+    if stream:
+        handler = StreamingTimingHandler()
+        with response_cache_scope(use_cache):
+            response: str = streaming_model(davinci_llm)(prompt, callbacks=[handler])
+        #Se a resposta veio do cache não há streaming, então ela é impressa de uma vez
+        if handler.calls:
+            print()
+        else:
+            print(response)
+        print(handler.report())
+        return
+
+    with response_cache_scope(use_cache):
+        response: str = davinci_llm(prompt)
 
     print(response)
 
-def use_prompt_template(davinci_llm: OpenAI):
-    
-    # Notice "location" below, that is a placeholder for another value later
-    template = """
+# Notice "location" below, that is a placeholder for another value later
+TRAVEL_TEMPLATE: str = """
     I really want to travel to {location}. What should I do there?
 
     Respond in one short sentence
     """
 
-    prompt = PromptTemplate(
-        input_variables=["location"],
-        template=template,
-    )
+#Com o cache semântico (semantic_cache, ou o instalado com LLM_SEMANTIC_CACHE=1), um destino parecido com um já
+#consultado ("Rome" e "Roma") reaproveita a resposta, a não ser com use_cache=False (ver utilitarios_llm/cache_semantico.py)
+def use_prompt_template(davinci_llm: OpenAI, location: str = "Rome", use_cache: bool = None,
+                        semantic_cache: SemanticResponseCache = None) -> str:
+    from utilitarios_llm.cache_respostas import response_cache_scope
+    from utilitarios_llm.cache_semantico import get_semantic_cache
+    from utilitarios_llm.templates import get_prompt_template
 
-    final_prompt = prompt.format(location='Rome')
+    #get_prompt_template cria o PromptTemplate uma única vez e o reaproveita nas chamadas seguintes
+    prompt: PromptTemplate = get_prompt_template(TRAVEL_TEMPLATE, ["location"])
+
+    final_prompt = prompt.format(location=location)
 
     print (f"Final Prompt: {final_prompt}")
     print ("-----------")
-    print (f"LLM Output: {davinci_llm(final_prompt)}")
+    semantic_cache = semantic_cache or get_semantic_cache()
+    with response_cache_scope(use_cache):
+        if semantic_cache is None or use_cache is False:
+            llm_output: str = davinci_llm(final_prompt)
+        else:
+            llm_output = semantic_cache.complete(davinci_llm, final_prompt, namespace=TRAVEL_TEMPLATE)
+
+    print (f"LLM Output: {llm_output}")
+    return llm_output
 
 class LangChainTest:
 
-    def __init__(self, chat: ChatOpenAI, embeddings: OpenAIEmbeddings, davinci_llm: OpenAI):
+    def __init__(self, chat: ChatOpenAI, embeddings: Embeddings, davinci_llm: OpenAI, stream: bool = False):
         self.chat = chat
         self.embeddings = embeddings
         self.davinci_llm = davinci_llm
+        self.stream = stream
     
     def test_basic_chat(self):
         #É possível antes de iniciar qualquer chat, dar o contexto sobre qual o papel que o bot deve desempenhar
         initial_context:str = "You are a nice AI bot that helps a user figure out what to eat in one short sentence"
         first_message:str = "I like tomatoes, what should I eat?"
-        print(basic_chat(self.chat, initial_context, first_message))
+        chat_history = basic_chat(self.chat, initial_context, first_message, stream=self.stream)
+        if not self.stream:
+            print(chat_history)
 
     def test_chat_from_history(self):
+        from langchain.schema import HumanMessage, SystemMessage, AIMessage
+
         #O histórico do chat poderia ser lido de um banco de dados
         chat_history:list = [
             SystemMessage(content="You are a nice AI bot that helps a user figure out where to travel in one short sentence"),
@@ -122,54 +194,146 @@ class LangChainTest:
         #Imprime somente a última pergunta e a última resposta do bot
         print(current_chat[-2:])
     
+    def test_chat_from_bounded_history(self):
+        from langchain.schema import HumanMessage, SystemMessage, AIMessage
+        from utilitarios_llm.historico_chat import ChatHistoryManager
+
+        #Orçamento pequeno de propósito, para que as mensagens mais antigas sejam resumidas já nos primeiros turnos
+        history = ChatHistoryManager(max_tokens=200, strategy="summarize", summarizer=self.chat, messages=[
+            SystemMessage(content="You are a nice AI bot that helps a user figure out where to travel in one short sentence"),
+            HumanMessage(content="I like the beaches where should I go?"),
+            AIMessage(content="You should go to Nice, France")
+        ])
+
+        for message in ["What else should I do when I´m there?", "Any night life suggestions?", "And where should I go next?"]:
+            response = chat_from_bounded_history(self.chat, history, message)
+            print(f"Human: {message}")
+            print(f"AI: {response.content}")
+            print(f"Tokens enviados no próximo turno: {history.context_tokens}")
+
     def test_text_embedding(self):
         use_text_embedding(self.embeddings)
 
     def test_prompt(self):
-        use_prompt(self.davinci_llm)
+        use_prompt(self.davinci_llm, stream=self.stream)
     
     def test_prompt_template(self):
         use_prompt_template(self.davinci_llm)
 
+#Histórico no formato [{"role": "system" | "human" | "ai", "content": "..."}], usado no modo lote
+def messages_from_dicts(messages: list) -> list:
+    from langchain.schema import HumanMessage, SystemMessage, AIMessage
+
+    message_types: dict = {"system": SystemMessage, "human": HumanMessage, "ai": AIMessage}
+    return [message_types[message["role"]](content=message["content"]) for message in messages]
+
+def _complete(davinci_llm: OpenAI, prompt: str, use_cache: bool = None) -> str:
+    from utilitarios_llm.cache_respostas import response_cache_scope
+
+    with response_cache_scope(use_cache):
+        return davinci_llm(prompt)
+
+#Operações disponíveis no modo lote (ver utilitarios_llm/lote.py): os campos de cada registro são os parâmetros da função
+def batch_operations(chat: ChatOpenAI, embeddings: Embeddings, davinci_llm: OpenAI) -> dict:
+    return {
+        "basic_chat": lambda initial_context, message: basic_chat(chat, initial_context, message)[-1].content,
+        "chat_from_history": lambda history, message: chat_from_history(chat, messages_from_dicts(history), message)[-1].content,
+        "text_embedding": lambda text: embeddings.embed_query(text),
+        "prompt": lambda prompt, use_cache=None: _complete(davinci_llm, prompt, use_cache),
+        "prompt_template": lambda location, use_cache=None: use_prompt_template(davinci_llm, location, use_cache),
+    }
+
+#Operações do modo servidor (ver utilitarios_llm/servidor.py), criadas uma vez em cada worker: as do modo lote e os
+#test_* do LangChainTest, todas com os mesmos clients
+def server_operations() -> dict:
+    from utilitarios_llm.clientes import create_model_clients
+    from utilitarios_llm.cache_embeddings import CachedEmbeddings
+    from utilitarios_llm.cache_semantico import SEMANTIC_CACHE_DIR, install_semantic_cache_from_env
+
+    clients = create_model_clients(os.environ["OPENAI_API_KEY"], chat_temperature=.7)
+    embeddings = CachedEmbeddings(clients.embeddings)
+    #O embedding store é compartilhado pelos workers, mas o índice do cache semântico aceita um único processo escritor
+    install_semantic_cache_from_env(embeddings, directory=worker_directory(SEMANTIC_CACHE_DIR))
+    operations: dict = batch_operations(clients.chat, embeddings, clients.llm)
+    operations.update(test_operations(LangChainTest(clients.chat, embeddings, clients.llm)))
+    return operations
+
 if __name__ == "__main__":
 
-    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY", get_api_key("openai"))
+    #Sem argumentos, mostra o menu; com --batch, executa os registros do arquivo (ex: {"op": "basic_chat", "initial_context": "...", "message": "..."});
+    #com --serve, atende as operações por HTTP (ex: POST /basic_chat {"initial_context": "...", "message": "..."})
+    parser = argparse.ArgumentParser(description="Exemplos do cookbook 01 do langchain")
+    add_batch_arguments(parser, batch_operations(None, None, None))
+    add_server_arguments(parser)
+    args = parser.parse_args()
 
-    openai_api_key:str = os.environ["OPENAI_API_KEY"] 
-    chat = ChatOpenAI(temperature=.7, openai_api_key=openai_api_key)
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-    davinci_llm = OpenAI(model_name="text-davinci-003", openai_api_key=openai_api_key)
+    #A api key, se não estiver na variável de ambiente, é descriptografada em segundo plano enquanto o menu é exibido
+    api_keys = prefetch_api_keys({"OPENAI_API_KEY": "openai"})
 
     option: int = None
 
-    while(True):
+    while(not args.batch and args.serve is None):
         option_str: str = input("""
         1. Basic Chat
         2. Chat from history
         3. Text Embedding
         4. Prompt with da vinci,
         5. Prompt Template with da vinci
+        6. Chat from history with a token budget
         Enter option: 
         """)
 
         try:
             option: int = int(option_str)
-            if option in [1, 2, 3, 4, 5]:
+            if option in [1, 2, 3, 4, 5, 6]:
                 break
             else:
                 print("Invalid option")
         except ValueError:
             print("Invalid option")
 
-    llm_test = LangChainTest(chat, embeddings, davinci_llm)
+    api_keys.export()
+    #Os workers são criados antes de qualquer import do langchain e criam os próprios clients
+    if args.serve is not None:
+        run_server_from_args(args, server_operations)
+        sys.exit()
+
+    from utilitarios_llm.clientes import create_model_clients
+    from utilitarios_llm.cache_embeddings import CachedEmbeddings
+    from utilitarios_llm.cache_semantico import install_semantic_cache_from_env
+
+    openai_api_key:str = os.environ["OPENAI_API_KEY"] 
+    #Os três clients compartilham uma única sessão HTTP com pool de conexões keep-alive (ver utilitarios_llm/clientes.py)
+    clients = create_model_clients(openai_api_key, chat_temperature=.7)
+    chat = clients.chat
+    embeddings = CachedEmbeddings(clients.embeddings)
+    davinci_llm = clients.llm
+    #LLM_SEMANTIC_CACHE=1 liga o cache semântico na opção 5 (ver utilitarios_llm/cache_semantico.py)
+    semantic_cache = install_semantic_cache_from_env(embeddings)
+
+    if args.batch:
+        run_batch_from_args(args, batch_operations(chat, embeddings, davinci_llm))
+        sys.exit()
+
+    #LLM_STREAMING=1 mostra as respostas token a token, à medida que chegam
+    llm_test = LangChainTest(chat, embeddings, davinci_llm, stream=os.environ.get("LLM_STREAMING") == "1")
 
     options = {
         1: llm_test.test_basic_chat,
         2: llm_test.test_chat_from_history,
         3: llm_test.test_text_embedding,
         4: llm_test.test_prompt,
-        5: llm_test.test_prompt_template
+        5: llm_test.test_prompt_template,
+        6: llm_test.test_chat_from_bounded_history
 
     }
 
-    options[option]()
\ No newline at end of file
+    options[option]()
+
+    if semantic_cache is not None:
+        print(f"Semantic cache: {semantic_cache.stats()}")
+
+    #LLM_METRICS=1 mostra as métricas das chamadas feitas (duração, tokens, custo, caches)
+    if os.environ.get("LLM_METRICS") == "1":
+        from utilitarios_llm.metricas import export_json
+        print(export_json())
\ No newline at end of file
@@ -1,27 +1,76 @@
+from __future__ import annotations
+
 import os
 import sys
+import argparse
+import threading
+from typing import TYPE_CHECKING
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, ".."))
-from gerenciador_api_keys.recupera_api_key import get_api_key
-
-from langchain.prompts.example_selector import SemanticSimilarityExampleSelector
-from langchain.vectorstores import FAISS
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.prompts import FewShotPromptTemplate, PromptTemplate
-from langchain.llms import OpenAI
+from gerenciador_api_keys.recupera_api_key import prefetch_api_keys
+from utilitarios_llm.lote import add_batch_arguments, run_batch_from_args
+
+#O langchain e o faiss (via utilitarios_llm/indice_exemplos.py) são importados dentro das funções que os usam, enquanto a
+#api key é descriptografada em segundo plano (ver quickstart/quickstart.py e benchmarks/benchmark_importacao.py)
+if TYPE_CHECKING:
+    from langchain.prompts import PromptTemplate
+    from langchain.llms import OpenAI
+    from utilitarios_llm.indice_exemplos import PersistentSemanticExampleSelector
+    from utilitarios_llm.templates import CachedFewShotPromptTemplate
+
+#Para bases grandes de exemplos, montar o índice FAISS do zero a cada execução (como faz from_examples) é lento.
+#O PersistentExampleIndex guarda o índice em disco e o carrega pronto nas próximas execuções; a cada execução somente os
+#exemplos novos são embedados e adicionados, e os que saíram da lista são removidos do índice.
+#index_kind permite trocar a busca exata (flat) por um índice aproximado (ivf, ivfpq ou hnsw) para bases muito grandes.
+#Os índices ivf e ivfpq são treinados com uma amostra dos exemplos na criação. Ver benchmarks/benchmark_indices.py.
+def build_persistent_example_selector(examples: list, index_dir: str, openai_api_key: str, k: int = 2,
+                                      index_kind: str = "flat", index_params: dict = None) -> PersistentSemanticExampleSelector:
+    from langchain.embeddings import OpenAIEmbeddings
+    from utilitarios_llm.cache_embeddings import CachedEmbeddings
+    from utilitarios_llm.indice_exemplos import PersistentExampleIndex, PersistentSemanticExampleSelector
+
+    index = PersistentExampleIndex(
+        index_dir, CachedEmbeddings(OpenAIEmbeddings(openai_api_key=openai_api_key)),
+        index_kind=index_kind, index_params=index_params
+    )
+    if len(index) == 0 and index.index_kind in ("ivf", "ivfpq"):
+        #Com menos exemplos do que o treino dos clusters precisa (os 5 exemplos deste arquivo, por exemplo), a busca
+        #exata é usada: para bases pequenas ela é mais rápida e não precisa de treino
+        if len(examples) < index.min_training_size():
+            print(f"{len(examples)} exemplos não bastam para treinar o índice {index.index_kind} "
+                  f"(mínimo {index.min_training_size()}); usando o índice flat")
+            index.rebuild("flat")
+        else:
+            index.train(examples)
+    index.sync(examples)
+    index.save()
+    return PersistentSemanticExampleSelector(index, k=k)
+
+# Examples of locations that nouns are found
+EXAMPLES: list = [
+    {"input": "pirate", "output": "ship"},
+    {"input": "pilot", "output": "plane"},
+    {"input": "driver", "output": "car"},
+    {"input": "tree", "output": "ground"},
+    {"input": "bird", "output": "nest"},
+]
+
+#Se index_dir for informado, o índice dos exemplos é persistido nessa pasta (ver build_persistent_example_selector)
+#Se max_example_tokens for informado, em vez de sempre k=2 exemplos entram no prompt os exemplos mais similares que
+#couberem nesse número de tokens (ver utilitarios_llm/selecao_exemplos.py)
+#O prompt retornado pode ser reaproveitado em várias chamadas a find_location (ex: no modo lote)
+def build_similar_prompt(index_dir: str = None, index_kind: str = "flat", max_example_tokens: int = None,
+                         examples: list = None) -> CachedFewShotPromptTemplate:
+    from langchain.prompts.example_selector import SemanticSimilarityExampleSelector
+    from langchain.vectorstores import FAISS
+    from langchain.embeddings import OpenAIEmbeddings
+    from utilitarios_llm.cache_embeddings import CachedEmbeddings
+    from utilitarios_llm.templates import CachedFewShotPromptTemplate, get_prompt_template
+    from utilitarios_llm.selecao_exemplos import TokenBudgetExampleSelector
 
-def use_selector(llm_davinci: OpenAI):
     openai_api_key:str = os.environ["OPENAI_API_KEY"] 
-
-    # Examples of locations that nouns are found
-    examples = [
-        {"input": "pirate", "output": "ship"},
-        {"input": "pilot", "output": "plane"},
-        {"input": "driver", "output": "car"},
-        {"input": "tree", "output": "ground"},
-        {"input": "bird", "output": "nest"},
-    ]
+    examples = examples or EXAMPLES
 
     # SemanticSimilarityExampleSelector will select examples that are similar to your input by semantic meaning
 
@@ -32,27 +81,39 @@ def use_selector(llm_davinci: OpenAI):
     #Para isso se usa o SemanticSimilarityExampleSelector, que é uma classe que seleciona exemplos semelhantes ao input do usuário.
     #Parametriza-se a classe com a base de exemplos, uma engine de embeddings, uma vector store e o número de exemplos que devem ser gerados
     #no prompt final que será enviado para o LLM.
-    example_selector = SemanticSimilarityExampleSelector.from_examples(
-        # Examples é uma lista de dictionaries em que tanto as chaves quanto os valores são strings.
-        # Cada exemplo é um dicionário com duas chaves: input e output.
-        # O input é o exemplo que será passado para o llm, e o output é a resposta esperada.
-        # o prompt template que será utilizado deverá usar as mesmas chaves para referenciar os valores.
-        examples=examples, 
+    if index_dir:
+        example_selector = build_persistent_example_selector(examples, index_dir, openai_api_key, k=2, index_kind=index_kind)
+    else:
+        example_selector = SemanticSimilarityExampleSelector.from_examples(
+            # Examples é uma lista de dictionaries em que tanto as chaves quanto os valores são strings.
+            # Cada exemplo é um dicionário com duas chaves: input e output.
+            # O input é o exemplo que será passado para o llm, e o output é a resposta esperada.
+            # o prompt template que será utilizado deverá usar as mesmas chaves para referenciar os valores.
+            examples=examples, 
         
-        # Precisa passar uma engine de embeddings para fazer busca por similaridade a partir dos exemplos.
-        embeddings=OpenAIEmbeddings(openai_api_key=openai_api_key), 
+            # Precisa passar uma engine de embeddings para fazer busca por similaridade a partir dos exemplos.
+            # O CachedEmbeddings guarda em disco os embeddings já calculados, então a cada execução somente os exemplos
+            # novos (ou alterados) são enviados à OpenAI, todos juntos em uma única chamada.
+            embeddings=CachedEmbeddings(OpenAIEmbeddings(openai_api_key=openai_api_key)), 
         
-        # VectorStore class
-        # FAISS - Facebook AI Similarity Search. Representa a Vector Store a ser utilizada.
-        # Uma alternativa é o Chroma. A classe de vector store armazenará os vectors de cada exemplo em memória.
-        vectorstore_cls=FAISS, 
+            # VectorStore class
+            # FAISS - Facebook AI Similarity Search. Representa a Vector Store a ser utilizada.
+            # Uma alternativa é o Chroma. A classe de vector store armazenará os vectors de cada exemplo em memória.
+            vectorstore_cls=FAISS, 
         
-        # This is the number of examples to produce.
-        k=2
-    )
+            # This is the number of examples to produce.
+            k=2
+        )
+
+    example_prompt: PromptTemplate = get_prompt_template("Example Input: {input}\nExample Output: {output}", ["input", "output"])
+    if max_example_tokens:
+        #O seletor por orçamento usa a mesma base de exemplos (o índice persistente ou a vector store criada acima)
+        store = example_selector.index if index_dir else example_selector.vectorstore
+        example_selector = TokenBudgetExampleSelector(store, example_prompt, max_tokens=max_example_tokens)
 
     #FewShotPromptTemplate é um tipo específico de template justamente para enviar, junto ao prompt, algums exemplos (Chamados shot examples)
-    similar_prompt = FewShotPromptTemplate(
+    #A versão com cache (utilitarios_llm/templates.py) renderiza cada exemplo uma única vez e reaproveita o texto nos próximos format
+    similar_prompt = CachedFewShotPromptTemplate(
         # Opcionalmente pode-se passar a esse tipo de prompt um seletor de exemplos, e este poderá selecionar os exemplos mais apropriados
         # para o input do usuário. Uma alternativa menos desejável seria passar os exemplos hardcoded.
         #Usando-se o SemanticSimilarityExampleSelector é possível utiilzar o poder da similarity search em uma base vetorial. 
@@ -62,10 +123,7 @@ def use_selector(llm_davinci: OpenAI):
         # Com base nesse template, o prompt (String) final enviado ao LLM conterá a quantidade k de exemplos (Configurada no selector)
         # sendo cada exemplo formatado de acordo com o template abaixo.
         # Conclusão: As input variables devem ser coerentes com as chaves dos exemplos passados. No caso, input e output.
-        example_prompt= PromptTemplate(
-            input_variables=["input", "output"],
-            template="Example Input: {input}\nExample Output: {output}",
-        ),
+        example_prompt=example_prompt,
         
         # Os parâmetros abaixo podem auxiliar a dar contexto ao LLM sobre os exemplos passados.
         #no caso abaixo "explica-se" ao LLM que a relação entre input e output é: Onde o input é usualmente encontrado?
@@ -76,9 +134,16 @@ def use_selector(llm_davinci: OpenAI):
         # Quais variáveis deverão ser passadas na chamada de format deste prompt.
         input_variables=["noun"]
     )
+    return similar_prompt
+
+def find_location(llm_davinci: OpenAI, similar_prompt: CachedFewShotPromptTemplate, noun: str) -> str:
+    return llm_davinci(similar_prompt.format(noun=noun))
+
+def use_selector(llm_davinci: OpenAI, index_dir: str = None, index_kind: str = "flat", max_example_tokens: int = None):
+    similar_prompt = build_similar_prompt(index_dir, index_kind, max_example_tokens)
 
     print('-' * 30)
-    for example in examples:
+    for example in EXAMPLES:
         print(example['input'], " is usually found in ", example['output'])
     print('-' * 30)
 
@@ -95,12 +160,45 @@ def use_selector(llm_davinci: OpenAI):
     llm_response = llm_davinci(prompt)
     print(llm_response)
 
+#Operações disponíveis no modo lote (ver utilitarios_llm/lote.py). O prompt (e o índice de exemplos) é criado uma vez,
+#na primeira chamada, e compartilhado por todos os registros.
+def batch_operations(llm_davinci: OpenAI, index_dir: str = None, index_kind: str = "flat", max_example_tokens: int = None) -> dict:
+    prompts: list = []
+    lock = threading.Lock()
+
+    def use_selector_record(noun: str) -> str:
+        with lock:
+            if not prompts:
+                prompts.append(build_similar_prompt(index_dir, index_kind, max_example_tokens))
+        return find_location(llm_davinci, prompts[0], noun)
+
+    return {"use_selector": use_selector_record}
+
 
 if __name__ == "__main__":
 
-    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY", get_api_key("openai"))
-    openai_api_key:str = os.environ["OPENAI_API_KEY"] 
+    #Sem argumentos, pergunta a palavra; com --batch, executa os registros do arquivo (ex: {"noun": "pilot"})
+    parser = argparse.ArgumentParser(description="Few-shot com seleção de exemplos por similaridade")
+    add_batch_arguments(parser, batch_operations(None))
+    parser.set_defaults(op="use_selector")
+    args = parser.parse_args()
+
+    #A descriptografia da api key acontece em segundo plano enquanto o langchain é importado
+    api_keys = prefetch_api_keys({"OPENAI_API_KEY": "openai"})
+    #Alias para não redefinir o OpenAI importado acima para as anotações (TYPE_CHECKING)
+    from langchain.llms import OpenAI as OpenAILLM
 
-    llm = OpenAI(model_name="text-davinci-003", openai_api_key=openai_api_key)
+    api_keys.export()
+    openai_api_key:str = os.environ["OPENAI_API_KEY"] 
 
-    use_selector(llm)
+    llm = OpenAILLM(model_name="text-davinci-003", openai_api_key=openai_api_key)
+
+    #Defina EXAMPLE_INDEX_DIR para usar o índice de exemplos persistido em disco, e EXAMPLE_INDEX_KIND para escolher o tipo
+    #EXAMPLE_TOKEN_BUDGET troca o número fixo de exemplos por um orçamento de tokens
+    max_example_tokens: str = os.environ.get("EXAMPLE_TOKEN_BUDGET")
+    selector_args: tuple = (os.environ.get("EXAMPLE_INDEX_DIR"), os.environ.get("EXAMPLE_INDEX_KIND", "flat"),
+                            int(max_example_tokens) if max_example_tokens else None)
+    if args.batch:
+        run_batch_from_args(args, batch_operations(llm, *selector_args))
+    else:
+        use_selector(llm, *selector_args)
@@ -1,30 +1,120 @@
 import os
+import sys
+import json
+import time
 import base64
+import tempfile
+from contextlib import contextmanager
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
 
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+from gerenciador_api_keys.recupera_api_key import KEYSTORE_VERSION, decrypt_keystore, invalidate_api_key_cache
+
 def encrypt_api_key_using_key(crypto_key:bytes, api_key:bytes) -> bytes:
     fernet = Fernet(base64.urlsafe_b64encode(crypto_key))
     encrypted_password = fernet.encrypt(api_key)
     return encrypted_password
 
+def encrypt_keystore_using_key(crypto_key:bytes, keys: dict) -> bytes:
+    content: dict = {
+        "version": KEYSTORE_VERSION,
+        "updated_at": int(time.time()),
+        "keys": keys
+    }
+    return encrypt_api_key_using_key(crypto_key, json.dumps(content, sort_keys=True).encode())
+
+#Lock exclusivo entre processos em <keystore>.lock, para que duas atualizações simultâneas não percam entradas
+#(cada uma lê, altera e regrava o keystore inteiro)
+@contextmanager
+def _keystore_lock(path_to_keystore: str):
+    with open(f"{path_to_keystore}.lock", "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            #LK_LOCK tenta por 10 segundos; repete até conseguir
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+#Adiciona ou rotaciona entradas do keystore (ex: {"openai": "sk-..."}), preservando as demais.
+#O arquivo é gravado em um temporário único na mesma pasta e depois substituído, para que um leitor nunca veja um
+#keystore pela metade. A leitura, a alteração e a gravação acontecem dentro do _keystore_lock.
+def update_keystore(path_to_key_file:str, path_to_keystore:str, entries: dict) -> dict:
+    with open(path_to_key_file, "rb") as f:
+        crypto_key: bytes = f.read()
+
+    with _keystore_lock(path_to_keystore):
+        keys: dict = {}
+        if os.path.exists(path_to_keystore):
+            keys = decrypt_keystore(path_to_key_file, path_to_keystore)
+        keys.update(entries)
+
+        directory: str = os.path.dirname(os.path.abspath(path_to_keystore))
+        fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path_to_keystore)}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(encrypt_keystore_using_key(crypto_key, keys))
+            os.replace(temp_path, path_to_keystore)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    invalidate_api_key_cache(path_to_encrypted_api_key=path_to_keystore)
+    return keys
+
 if __name__ == "__main__":
     path_to_existing_key:str = input("Entre o caminho completo da chave criptográfica: (key na pasta atual) ")
     if path_to_existing_key == "":
         path_to_existing_key = os.path.join(os.getcwd(), "key")
 
-    api_key_to_encrypt:str = input("Cole (botão direito) a api key: ")
-    path_to_store_api_key:str = input("Entre o caminho da pasta onde deseja salvar a api key criptografada (pasta atual): ")
-    if path_to_store_api_key == "":
-        path_to_store_api_key = os.getcwd()
+    opcao = input("Digite 1 para gerar um arquivo individual (api_key) ou 2 para adicionar/rotacionar uma entrada do keystore (1): ")
 
-    with open(path_to_existing_key, "rb") as f:
-        crypto_key: bytes = f.read()
+    if opcao == "" or opcao == "1":
+        api_key_to_encrypt:str = input("Cole (botão direito) a api key: ")
+        path_to_store_api_key:str = input("Entre o caminho da pasta onde deseja salvar a api key criptografada (pasta atual): ")
+        if path_to_store_api_key == "":
+            path_to_store_api_key = os.getcwd()
+
+        with open(path_to_existing_key, "rb") as f:
+            crypto_key: bytes = f.read()
+
+        encrypted_api_key: bytes = encrypt_api_key_using_key(crypto_key, api_key_to_encrypt.encode())
+        
+        with open(f"{path_to_store_api_key}/api_key", "wb") as f:
+            f.write(encrypted_api_key)
+
+        print(f"API key criptografada e armazenada em {path_to_store_api_key}/api_key")
+
+    elif opcao == "2":
+        path_to_keystore:str = input("Caminho do keystore (pasta atual/keystore): ")
+        if path_to_keystore == "":
+            path_to_keystore = os.path.join(os.getcwd(), "keystore")
+
+        prefix:str = input("Prefixo do provedor (ex: openai, serp): ")
+        api_key_to_encrypt:str = input("Cole (botão direito) a api key: ")
+
+        keys: dict = update_keystore(path_to_existing_key, path_to_keystore, {prefix: api_key_to_encrypt})
 
-    encrypted_api_key: bytes = encrypt_api_key_using_key(crypto_key, api_key_to_encrypt.encode())
-    
-    with open(f"{path_to_store_api_key}/api_key", "wb") as f:
-        f.write(encrypted_api_key)
+        print(f"Keystore {path_to_keystore} atualizado. Provedores armazenados: {', '.join(sorted(keys))}")
 
-    print(f"API key criptografada e armazenada em {path_to_store_api_key}/api_key")
+    else:
+        raise ValueError("Opção inválida")
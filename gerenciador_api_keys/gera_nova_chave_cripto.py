@@ -1,16 +1,16 @@
 import os
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
+import sys
 
-def generate_key(passphrase: bytes) -> bytes:
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+from gerenciador_api_keys.recupera_api_key import PBKDF2_ITERATIONS
+from gerenciador_api_keys.recupera_api_key import generate_key as derive_key
+
+#A derivação em si (PBKDF2HMAC/SHA-256) fica em recupera_api_key.generate_key, para que a geração e a recuperação
+#da chave usem sempre os mesmos parâmetros, inclusive o número de iterações.
+def generate_key(passphrase: bytes, iterations: int = None) -> bytes:
     salt = os.urandom(16)  # generate a random salt
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000  # adjust the number of iterations as needed
-    )
-    key = kdf.derive(passphrase)
+    key = derive_key(passphrase, salt, iterations or PBKDF2_ITERATIONS)
     return key, salt
 
 if __name__ == "__main__":
@@ -19,11 +19,14 @@ if __name__ == "__main__":
         file_location = os.getcwd()
         
     passphrase = input("Entre uma senha/passphrase (poderá ser usada junto com o salt caso perca a chave): ").encode()
-    key, salt = generate_key(passphrase)
+    iterations_str:str = input(f"Número de iterações do PBKDF2 ({PBKDF2_ITERATIONS}): ")
+    iterations:int = int(iterations_str) if iterations_str != "" else PBKDF2_ITERATIONS
+
+    key, salt = generate_key(passphrase, iterations)
     with open(f"{file_location}/key", "wb") as f:
         f.write(key)
     with open(f"{file_location}/salt", "wb") as f:
         f.write(salt)
     
     print(f"Arquivos de chave e 'salt' gerados com sucesso na pasta {file_location}")
-
+    print(f"Iterações usadas: {iterations} (guarde esse valor junto com o salt para poder recuperar a chave pela passphrase)")
@@ -1,10 +1,23 @@
 import os
+import json
+import time
 import base64
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
+import hashlib
+import threading
+from collections import OrderedDict
+
+#O pacote cryptography é importado dentro das funções que o usam: importá-lo leva dezenas de ms, e com
+#prefetch_api_keys essa importação acontece em segundo plano, junto com a descriptografia
+
+#Número de iterações do PBKDF2. É compartilhado com gera_nova_chave_cripto.generate_key, e pode ser ajustado por deployment
+#pela variável de ambiente PBKDF2_ITERATIONS. Atenção: a chave só pode ser derivada novamente com o mesmo número de iterações
+#usado na sua geração.
+PBKDF2_ITERATIONS: int = int(os.environ.get("PBKDF2_ITERATIONS", "100000"))
+
+def generate_key(passphrase: bytes, salt: bytes, iterations: int = None) -> bytes:
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives import hashes
 
-def generate_key(passphrase: bytes, salt: bytes) -> bytes:
     # print(f"Usando passphrase: {passphrase}")
     # print(f"Usando salt: {salt}")
 
@@ -12,18 +25,63 @@ def generate_key(passphrase: bytes, salt: bytes) -> bytes:
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=100000  # adjust the number of iterations as needed
+        iterations=iterations or PBKDF2_ITERATIONS
     )
     key = kdf.derive(passphrase)
     return key
 
-def decrypt_api_key_using_passphrase(passphrase:bytes, salt:bytes, api_key:bytes) -> bytes:
-    derived_key = generate_key(passphrase, salt)
+#Cache LRU das chaves derivadas pelo PBKDF2, que é propositalmente caro (dezenas de ms de CPU por derivação).
+#A chave do cache usa o hash SHA-256 da passphrase, para não manter a passphrase em si na memória do processo.
+#O tamanho máximo pode ser configurado pela variável de ambiente DERIVED_KEY_CACHE_SIZE.
+DERIVED_KEY_CACHE_SIZE: int = int(os.environ.get("DERIVED_KEY_CACHE_SIZE", "16"))
+
+_derived_key_cache: OrderedDict = OrderedDict()
+_derived_key_cache_lock = threading.Lock()
+
+def generate_key_cached(passphrase: bytes, salt: bytes, iterations: int = None) -> bytes:
+    iterations = iterations or PBKDF2_ITERATIONS
+    cache_key = (hashlib.sha256(passphrase).digest(), salt, iterations)
+
+    with _derived_key_cache_lock:
+        key = _derived_key_cache.get(cache_key)
+        if key is not None:
+            _derived_key_cache.move_to_end(cache_key)
+            return key
+
+    #A derivação é feita fora do lock para não bloquear outras threads que usam passphrases/salts diferentes
+    key = generate_key(passphrase, salt, iterations)
+
+    with _derived_key_cache_lock:
+        _derived_key_cache[cache_key] = key
+        _derived_key_cache.move_to_end(cache_key)
+        while len(_derived_key_cache) > DERIVED_KEY_CACHE_SIZE:
+            _derived_key_cache.popitem(last=False)
+
+    return key
+
+def clear_derived_key_cache():
+    with _derived_key_cache_lock:
+        _derived_key_cache.clear()
+
+def decrypt_api_key_using_passphrase(passphrase:bytes, salt:bytes, api_key:bytes, iterations: int = None) -> bytes:
+    from cryptography.fernet import Fernet
+
+    derived_key = generate_key_cached(passphrase, salt, iterations)
     fernet = Fernet(base64.urlsafe_b64encode(derived_key))
     decrypted_password = fernet.decrypt(api_key)
     return decrypted_password
 
+#Descriptografa várias api keys (ex: o conteúdo de openai_api_key e serp_api_key) com uma única derivação da chave
+def decrypt_api_keys_using_passphrase(passphrase:bytes, salt:bytes, api_keys: list, iterations: int = None) -> list:
+    from cryptography.fernet import Fernet
+
+    derived_key = generate_key_cached(passphrase, salt, iterations)
+    fernet = Fernet(base64.urlsafe_b64encode(derived_key))
+    return [fernet.decrypt(api_key) for api_key in api_keys]
+
 def decrypt_api_key_using_key(crypto_key:bytes, api_key:bytes) -> bytes:
+    from cryptography.fernet import Fernet
+
     fernet = Fernet(base64.urlsafe_b64encode(crypto_key))
     decrypted_password = fernet.decrypt(api_key)
     return decrypted_password
@@ -37,19 +95,139 @@ def decrypt_api_key(path_to_key_file:str, path_to_encrypted_api_key:str) -> str:
     result:bytes = decrypt_api_key_using_key(crypto_key, encrypted_api_key)
     return result.decode()
 
-def get_api_key(prefix: str) -> str:
+#Cache em memória (por processo) das api keys já descriptografadas, para evitar ler os arquivos e montar um novo Fernet
+#a cada chamada de get_api_key. A chave do cache é (caminho do arquivo de chave, caminho do arquivo criptografado) e o valor
+#guarda o mtime dos dois arquivos no momento da leitura. Se algum dos arquivos mudar (rotação de chave), a entrada é recarregada
+#automaticamente, mesmo antes de expirar o TTL.
+#O TTL padrão (em segundos) pode ser configurado pela variável de ambiente API_KEY_CACHE_TTL. TTL <= 0 desliga o cache.
+API_KEY_CACHE_TTL: float = float(os.environ.get("API_KEY_CACHE_TTL", "300"))
+
+_api_key_cache: dict = {}
+_api_key_cache_lock = threading.Lock()
+
+def _files_mtime(*paths: str) -> tuple:
+    return tuple(os.stat(path).st_mtime_ns for path in paths)
+
+def _get_cached(path_to_key_file: str, path_to_encrypted_file: str, loader, ttl: float = None):
+    if ttl is None:
+        ttl = API_KEY_CACHE_TTL
+
+    if ttl <= 0:
+        return loader(path_to_key_file, path_to_encrypted_file)
+
+    cache_key = (os.path.abspath(path_to_key_file), os.path.abspath(path_to_encrypted_file))
+
+    #O lock é mantido durante a leitura para que várias threads pedindo a mesma chave ao mesmo tempo façam uma única descriptografia
+    with _api_key_cache_lock:
+        mtimes = _files_mtime(*cache_key)
+        entry = _api_key_cache.get(cache_key)
+        if entry is not None:
+            value, cached_mtimes, loaded_at = entry
+            if cached_mtimes == mtimes and time.monotonic() - loaded_at < ttl:
+                return value
+
+        value = loader(path_to_key_file, path_to_encrypted_file)
+        _api_key_cache[cache_key] = (value, mtimes, time.monotonic())
+        return value
+
+def invalidate_api_key_cache(path_to_key_file: str = None, path_to_encrypted_api_key: str = None):
+    #Sem parâmetros limpa o cache inteiro. Com parâmetros, remove somente as entradas que usam os arquivos informados.
+    with _api_key_cache_lock:
+        if path_to_key_file is None and path_to_encrypted_api_key is None:
+            _api_key_cache.clear()
+            return
+
+        key_path = os.path.abspath(path_to_key_file) if path_to_key_file else None
+        encrypted_path = os.path.abspath(path_to_encrypted_api_key) if path_to_encrypted_api_key else None
+        for cache_key in list(_api_key_cache):
+            if key_path not in (None, cache_key[0]):
+                continue
+            if encrypted_path not in (None, cache_key[1]):
+                continue
+            del _api_key_cache[cache_key]
+
+def get_cached_api_key(path_to_key_file:str, path_to_encrypted_api_key:str, ttl: float = None) -> str:
+    return _get_cached(path_to_key_file, path_to_encrypted_api_key, decrypt_api_key, ttl)
+
+#Keystore: um único arquivo criptografado (Fernet) contendo as api keys de todos os provedores, no lugar de um arquivo
+#por provedor ({prefix}_api_key). O conteúdo descriptografado é um JSON versionado:
+#{"version": 1, "updated_at": <timestamp>, "keys": {"openai": "...", "serp": "..."}}
+#A escrita/rotação de entradas fica em criptografa_api_key.update_keystore.
+KEYSTORE_VERSION: int = 1
+
+def decrypt_keystore_using_key(crypto_key:bytes, keystore:bytes) -> dict:
+    content: dict = json.loads(decrypt_api_key_using_key(crypto_key, keystore))
+    version = content.get("version")
+    if version != KEYSTORE_VERSION:
+        raise ValueError(f"Versão de keystore não suportada: {version}")
+    return content["keys"]
+
+def decrypt_keystore(path_to_key_file:str, path_to_keystore:str) -> dict:
+    with open(path_to_key_file, "rb") as f:
+        crypto_key = f.read()
+    with open(path_to_keystore, "rb") as f:
+        keystore = f.read()
+
+    return decrypt_keystore_using_key(crypto_key, keystore)
+
+#O keystore inteiro é descriptografado uma única vez e mantido no mesmo cache das api keys, sendo recarregado
+#quando o arquivo do keystore ou o da chave mudar. Todos os prefixos são servidos a partir da memória.
+def load_keystore(path_to_key_file:str, path_to_keystore:str, ttl: float = None) -> dict:
+    return _get_cached(path_to_key_file, path_to_keystore, decrypt_keystore, ttl)
+
+def get_api_key(prefix: str, ttl: float = None) -> str:
     current_dir = os.path.dirname(os.path.abspath(__file__))
     # print(__file__) #/home/celestino_wsl/dev/otimizai/langchain/workspace/quickstart/../gerenciador_api_keys/recupera_api_key.py
     # print(os.path.abspath(__file__)) #/home/celestino_wsl/dev/otimizai/langchain/workspace/gerenciador_api_keys/recupera_api_key.py
     # print(os.path.dirname(os.path.abspath(__file__))) #/home/celestino_wsl/dev/otimizai/langchain/workspace/gerenciador_api_keys/recupera_api_key.py
 
     path_to_key_file = os.environ.get('CRYPTO_KEY_FILE', os.path.join(current_dir, "key"))
+    path_to_keystore = os.environ.get('API_KEYSTORE_FILE', os.path.join(current_dir, "keystore"))
+
+    #Se existir um keystore contendo o prefixo, ele tem prioridade sobre os arquivos individuais
+    if os.path.exists(path_to_keystore):
+        keys: dict = load_keystore(path_to_key_file, path_to_keystore, ttl)
+        if prefix in keys:
+            return keys[prefix]
+
     path_to_encrypted_api_key = os.environ.get('ENCRYPTED_API_KEY_FILE', os.path.join(current_dir, f"{prefix}_api_key"))
 
     # print(f"Usando arquivo de chave criptográfica: {path_to_key_file}")
     # print(f"Usando arquivo de api key criptografada: {path_to_encrypted_api_key}")
 
-    return decrypt_api_key(path_to_key_file, path_to_encrypted_api_key)
+    return get_cached_api_key(path_to_key_file, path_to_encrypted_api_key, ttl)
+
+#Descriptografa em segundo plano as api keys que ainda não estão nas variáveis de ambiente, por exemplo enquanto o
+#menu é exibido. keys: variável de ambiente -> prefixo (ex: {"OPENAI_API_KEY": "openai"}).
+#export() espera a thread terminar e preenche as variáveis de ambiente; o erro de uma key só é levantado quando ela é exportada.
+class ApiKeyPrefetch:
+
+    def __init__(self, keys: dict, ttl: float = None):
+        self.keys: dict = {env_var: prefix for env_var, prefix in keys.items() if not os.environ.get(env_var)}
+        self.ttl = ttl
+        self.values: dict = {}
+        self.errors: dict = {}
+        self.thread = threading.Thread(target=self._load, name="api-key-prefetch", daemon=True)
+        self.thread.start()
+
+    def _load(self):
+        for env_var, prefix in self.keys.items():
+            try:
+                self.values[env_var] = get_api_key(prefix, self.ttl)
+            except Exception as e:
+                self.errors[env_var] = e
+
+    #Sem parâmetros exporta todas as keys
+    def export(self, *env_vars: str):
+        self.thread.join()
+        for env_var in env_vars or tuple(self.keys):
+            if env_var in self.errors:
+                raise self.errors[env_var]
+            if env_var in self.values:
+                os.environ.setdefault(env_var, self.values[env_var])
+
+def prefetch_api_keys(keys: dict, ttl: float = None) -> ApiKeyPrefetch:
+    return ApiKeyPrefetch(keys, ttl)
 
 
 if __name__ == "__main__":
@@ -76,12 +254,15 @@ if __name__ == "__main__":
         if path_to_encrypted_api_key == "":
             path_to_encrypted_api_key = os.path.join(os.getcwd(), "api_key")
 
+        iterations_str:str = input(f"Número de iterações usado na geração da chave ({PBKDF2_ITERATIONS}): ")
+        iterations:int = int(iterations_str) if iterations_str != "" else PBKDF2_ITERATIONS
+
         with open(path_to_salt, "rb") as f:
             salt = f.read()
         with open(path_to_encrypted_api_key, "rb") as f:
             encrypted_api_key = f.read()
 
-        decrypted_api_key:str = decrypt_api_key_using_passphrase(passphrase, salt, encrypted_api_key).decode()
+        decrypted_api_key:str = decrypt_api_key_using_passphrase(passphrase, salt, encrypted_api_key, iterations).decode()
 
     else:
         raise ValueError("Opção inválida")
@@ -1,46 +1,90 @@
+from __future__ import annotations
+
 import os
 import sys
+import argparse
+from typing import TYPE_CHECKING
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, ".."))
-from gerenciador_api_keys.recupera_api_key import get_api_key
-
-from langchain.llms import OpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain, ConversationChain
-from langchain.agents import load_tools
-from langchain.agents import initialize_agent
-from langchain.agents import AgentType
-
+from gerenciador_api_keys.recupera_api_key import prefetch_api_keys
+from utilitarios_llm.lote import add_batch_arguments, run_batch_from_args
+from utilitarios_llm.servidor import add_server_arguments, run_server_from_args, test_operations, worker_directory
+from utilitarios_llm.conversas import ChatMessage, ConversationStore
+
+#Importar o langchain leva alguns segundos (o pacote carrega agents, chains, vector stores...), então os módulos que
+#dependem dele são importados dentro das funções que os usam: o menu aparece na hora, e cada opção só carrega o que
+#precisa. Os imports abaixo servem somente para as anotações de tipo. Ver benchmarks/benchmark_importacao.py.
+if TYPE_CHECKING:
+    from langchain.llms import OpenAI
+    from langchain.prompts import PromptTemplate
+    from langchain.chains import ConversationChain
+    from utilitarios_llm.cache_semantico import SemanticResponseCache
+    from utilitarios_llm.streaming import StreamingTimingHandler
+
+
+#use_cache controla o cache persistente de respostas (utilitarios_llm/cache_respostas.py):
+#None = somente chamadas determinísticas (temperature 0) usam o cache, True = usa sempre, False = nunca usa.
+#stream=True imprime os tokens à medida que chegam e, ao final, o tempo até o primeiro token e o tempo total.
+def answer_simple_question(llm: OpenAI, question:str, use_cache: bool = None, stream: bool = False) -> str:
+    from utilitarios_llm.cache_respostas import response_cache_scope
+    from utilitarios_llm.streaming import StreamingTimingHandler, copy_model, streaming_model
+
+    llm = copy_model(llm, temperature=0.9)
+
+    if not stream:
+        with response_cache_scope(use_cache):
+            return llm(question)
+
+    handler = StreamingTimingHandler()
+    with response_cache_scope(use_cache):
+        answer: str = streaming_model(llm)(question, callbacks=[handler])
+    #Se a resposta veio do cache não há streaming, então ela é impressa de uma vez
+    if handler.calls:
+        print()
+    else:
+        print(answer)
+    print(handler.report())
+    return answer
 
-def answer_simple_question(llm: OpenAI, question:str) -> str:
-    llm.temperature = 0.9
+#O template é validado e compilado uma única vez e reaproveitado em todas as chamadas (ver utilitarios_llm/templates.py)
+PLACES_TO_EAT_TEMPLATE: str = "What are 5 vacation destinations for someone who likes to eat {food}"
 
-    return llm(question)
+#Com o cache semântico (semantic_cache, ou o instalado com LLM_SEMANTIC_CACHE=1), prompts parecidos com um já
+#respondido ("steak" e "steaks") reaproveitam a resposta (ver utilitarios_llm/cache_semantico.py).
+#Instalar o cache semântico já é a opção por reaproveitar respostas, então ele é usado mesmo com temperature > 0,
+#a não ser com use_cache=False.
+def get_places_to_eat_using_prompt_template(llm: OpenAI, food: str, use_cache: bool = None,
+                                            semantic_cache: SemanticResponseCache = None) -> str:
+    from utilitarios_llm.cache_respostas import response_cache_scope
+    from utilitarios_llm.cache_semantico import get_semantic_cache
+    from utilitarios_llm.streaming import copy_model
+    from utilitarios_llm.templates import get_prompt_template
 
-def get_places_to_eat_using_prompt_template(llm: OpenAI, food: str) -> str:
-    llm.temperature = 0.9
+    llm = copy_model(llm, temperature=0.9)
 
-    prompt_template: PromptTemplate = PromptTemplate(
-        input_variables=["food"],
-        template="What are 5 vacation destinations for someone who likes to eat {food}",
-    )
+    prompt_template: PromptTemplate = get_prompt_template(PLACES_TO_EAT_TEMPLATE, ["food"])
 
     prompt: str = prompt_template.format(food=food)
 
-    return llm(prompt)
+    semantic_cache = semantic_cache or get_semantic_cache()
+    with response_cache_scope(use_cache):
+        if semantic_cache is None or use_cache is False:
+            return llm(prompt)
+        return semantic_cache.complete(llm, prompt, namespace=PLACES_TO_EAT_TEMPLATE)
 
 #Uma chain é uma combinação de um modelo de linguagem e um template de prompt
 #É util para fazer várias chamadas sequenciais a um mesmo prompt de forma mais simples
 #Usando-se a técnica anterior de usar um template de prompt, seria necessário fazer
 #uma chamada a format e depois uma chamada a llm para cada item da lista.
 def get_places_to_eat_using_chain(llm: OpenAI, foods_array: list) -> str:
-    llm.temperature = 0.9
+    from langchain.chains import LLMChain
+    from utilitarios_llm.streaming import copy_model
+    from utilitarios_llm.templates import get_prompt_template
 
-    prompt_template: PromptTemplate = PromptTemplate(
-        input_variables=["food"],
-        template="What are 5 vacation destinations for someone who likes to eat {food}",
-    )
+    llm = copy_model(llm, temperature=0.9)
+
+    prompt_template: PromptTemplate = get_prompt_template(PLACES_TO_EAT_TEMPLATE, ["food"])
 
     chain: LLMChain = LLMChain(llm=llm, prompt=prompt_template)
 
@@ -51,77 +95,211 @@ def get_places_to_eat_using_chain(llm: OpenAI, foods_array: list) -> str:
     
     return result
 
-def get_current_info_using_agent(llm: OpenAI, questions: str) -> str:
-    llm.temperature = 0
+#Versão em lotes: o endpoint de completion da OpenAI aceita vários prompts em uma mesma requisição.
+#chain.apply usa o generate do LLM, que envia os prompts em sub-lotes de llm.batch_size prompts por requisição.
+#Aqui os inputs são agrupados em lotes de batch_size, e cada lote é enviado como uma única chamada à API.
+#As gerações retornadas vêm na mesma ordem dos prompts, então basta concatená-las para ter uma resposta por input.
+#O batch_size vale somente para esta chamada: a chain usa uma cópia do llm, e o llm recebido não é alterado.
+def get_places_to_eat_using_chain_batch(llm: OpenAI, foods_array: list, batch_size: int = 20) -> list:
+    from langchain.chains import LLMChain
+    from utilitarios_llm.streaming import copy_model
+    from utilitarios_llm.templates import get_prompt_template
+
+    if batch_size < 1:
+        raise ValueError(f"batch_size deve ser >= 1: {batch_size}")
+
+    llm = copy_model(llm, temperature=0.9, batch_size=batch_size)
+
+    prompt_template: PromptTemplate = get_prompt_template(PLACES_TO_EAT_TEMPLATE, ["food"])
+
+    chain: LLMChain = LLMChain(llm=llm, prompt=prompt_template)
+
+    result: list = []
+    for start in range(0, len(foods_array), batch_size):
+        batch: list = foods_array[start:start + batch_size]
+        print(f"Using chain to check good places to eat {', '.join(batch)} in a single request")
+        outputs: list = chain.apply([{"food": food} for food in batch])
+        result.extend(output[chain.output_key] for output in outputs)
 
-    tools = load_tools(["serpapi", "llm-math"], llm=llm)
-    agent = initialize_agent(tools, llm, agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION, verbose=True)
-    result = agent.run(questions)
     return result
 
-class ChatMessage:
-    def __init__(self, who: str, msg: str):
-        self.who = who
-        self.msg = msg
-    
+#Resultado de um item processado pela chain concorrente: guarda o input, a resposta ou o erro ocorrido,
+#de forma que a falha de um item não interrompa o processamento dos demais.
+class ChainItemResult:
+    def __init__(self, item: str, output: str = None, error: Exception = None):
+        self.item = item
+        self.output = output
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
     def __str__(self):
-        return f"{self.who}: {self.msg}"
-    
-def have_conversation(llm: OpenAI) -> list:
+        if self.ok:
+            return f"{self.item}: {self.output}"
+        return f"{self.item}: ERRO - {self.error!r}"
+
+#Versão assíncrona da função acima. No lugar de chamar chain.run item a item, dispara as chamadas com chain.arun
+#de forma concorrente, limitadas a max_concurrency chamadas simultâneas (para não estourar o rate limit da API).
+#A latência total passa a ser próxima de (len(foods_array) / max_concurrency) chamadas, e não mais len(foods_array).
+#Os resultados são retornados na mesma ordem da lista de entrada, um ChainItemResult por item.
+async def aget_places_to_eat_using_chain(llm: OpenAI, foods_array: list, max_concurrency: int = 10) -> list:
+    import asyncio
+    from langchain.chains import LLMChain
+    from utilitarios_llm.streaming import copy_model
+    from utilitarios_llm.templates import get_prompt_template
+
+    #Com max_concurrency < 1 o semáforo nunca seria liberado e as chamadas esperariam para sempre
+    if max_concurrency < 1:
+        raise ValueError(f"max_concurrency deve ser >= 1: {max_concurrency}")
+
+    llm = copy_model(llm, temperature=0.9)
+
+    prompt_template: PromptTemplate = get_prompt_template(PLACES_TO_EAT_TEMPLATE, ["food"])
+
+    chain: LLMChain = LLMChain(llm=llm, prompt=prompt_template)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_item(food: str) -> ChainItemResult:
+        async with semaphore:
+            print(f"Using async chain to check good places to eat {food}")
+            try:
+                return ChainItemResult(food, output=await chain.arun(food))
+            except Exception as e:
+                return ChainItemResult(food, error=e)
+
+    #asyncio.gather preserva a ordem das corotinas passadas, independentemente da ordem em que terminam
+    return await asyncio.gather(*(run_item(food) for food in foods_array))
+
+#Com temperature 0 as chamadas ao LLM são determinísticas, então por padrão passam pelo cache de respostas.
+#O agent e as tools (serpapi e llm-math) são criados uma vez por processo e as observações das tools ficam em cache
+#(ver utilitarios_llm/agente.py). tools permite trocar as tools padrão, por exemplo por create_stub_search_tool nos testes.
+def get_current_info_using_agent(llm: OpenAI, questions: str, use_cache: bool = None, tools: list = None) -> str:
+    from utilitarios_llm.cache_respostas import response_cache_scope
+    from utilitarios_llm.agente import get_agent
+
+    agent = get_agent(llm, ("serpapi", "llm-math"), tools=tools, llm_params={"temperature": 0})
+    with response_cache_scope(use_cache):
+        result = agent.run(questions)
+    return result
+
+def _bot_reply(conversation: ConversationChain, message: str, handler: StreamingTimingHandler) -> ChatMessage:
+    if handler is None:
+        reply = ChatMessage("Bot", conversation.predict(input=message))
+        print(reply)
+        return reply
+
+    #Os tokens são impressos pelo StreamingTimingHandler durante o predict.
+    #O handler é passado no predict, e não no construtor da chain: no langchain os callbacks do construtor valem
+    #somente para a própria chain e não chegam ao LLM.
+    #Se a resposta veio do cache não há streaming, então ela é impressa de uma vez.
+    calls: int = len(handler.calls)
+    print("Bot: ", end="", flush=True)
+    reply = ChatMessage("Bot", conversation.predict(input=message, callbacks=[handler]))
+    if len(handler.calls) > calls:
+        print()
+    else:
+        print(reply.msg)
+    return reply
+
+#Memória da ConversationChain. Com session_id, as mensagens são gravadas no ConversationStore (por padrão o store do
+#processo, em CONVERSATION_STORE_DIR) e a conversa continua de onde parou, em qualquer processo; o modelo recebe
+#somente as últimas max_messages mensagens. Sem session_id, a memória fica só no processo, como antes.
+def _conversation_memory(session_id: str = None, store: ConversationStore = None, max_messages: int = None):
+    from langchain.memory import ConversationBufferMemory
 
-    llm.temperature = 0
+    if session_id is None:
+        return ConversationBufferMemory()
 
-    conversation = ConversationChain(llm=llm, verbose=True)
+    from utilitarios_llm.conversas import get_conversation_store
+    from utilitarios_llm.historico_chat import StoredChatMessageHistory
+
+    history = StoredChatMessageHistory(store or get_conversation_store(), session_id, max_messages)
+    return ConversationBufferMemory(chat_memory=history)
+
+#Com stream=True as respostas do bot são impressas token a token (o verbose da chain é desligado para não misturar as saídas)
+#session_id e store: ver _conversation_memory
+def have_conversation(llm: OpenAI, use_cache: bool = None, stream: bool = False, session_id: str = None,
+                      store: ConversationStore = None) -> list:
+    from utilitarios_llm.cache_respostas import response_cache_scope
+
+    with response_cache_scope(use_cache):
+        return _have_conversation(llm, stream, _conversation_memory(session_id, store))
+
+def _have_conversation(llm: OpenAI, stream: bool = False, memory=None) -> list:
+    from langchain.chains import ConversationChain
+    from utilitarios_llm.streaming import StreamingTimingHandler, copy_model, streaming_model
+
+    llm = copy_model(llm, temperature=0)
+
+    handler = StreamingTimingHandler() if stream else None
+    if stream:
+        conversation = ConversationChain(llm=streaming_model(llm), memory=memory)
+    else:
+        conversation = ConversationChain(llm=llm, memory=memory, verbose=True)
     chat_history = []
 
     next_message: ChatMessage = ChatMessage("Me", "Hi there!")
     chat_history.append(next_message)
     print(next_message)
 
-    output = conversation.predict(input=next_message.msg)
-    next_message = ChatMessage("Bot", output)
+    next_message = _bot_reply(conversation, next_message.msg, handler)
     chat_history.append(next_message)
-    print(next_message)
 
     next_message = ChatMessage("Me", "I'm doing well! Just having a conversation with an AI.")
     chat_history.append(next_message)
     print(next_message)
 
-    output = conversation.predict(input=next_message.msg)
-    next_message = ChatMessage("Bot", output)
+    next_message = _bot_reply(conversation, next_message.msg, handler)
     chat_history.append(next_message)
-    print(next_message)
 
     next_message = ChatMessage("Me", "What was the first think I said to you?")
     chat_history.append(next_message)
     print(next_message)
 
-    output = conversation.predict(input=next_message.msg)
-    next_message = ChatMessage("Bot", output)
+    next_message = _bot_reply(conversation, next_message.msg, handler)
     chat_history.append(next_message)
-    print(next_message)
 
     next_message = ChatMessage("Me", "What is an alternative phrase for the first thing I said to you?")
     chat_history.append(next_message)
     print(next_message)
 
-    output = conversation.predict(input=next_message.msg)
-    next_message = ChatMessage("Bot", output)
+    next_message = _bot_reply(conversation, next_message.msg, handler)
     chat_history.append(next_message)
-    print(next_message)
+
+    if stream:
+        print(handler.report())
 
     return chat_history
 
+#Um turno de uma conversa gravada no ConversationStore: adiciona a mensagem à sessão e retorna a resposta do bot.
+#Cada turno pode ser atendido por um processo diferente, já que o histórico é lido do store.
+def continue_conversation(llm: OpenAI, session_id: str, message: str, use_cache: bool = None,
+                          store: ConversationStore = None, max_messages: int = None) -> str:
+    from langchain.chains import ConversationChain
+    from utilitarios_llm.cache_respostas import response_cache_scope
+    from utilitarios_llm.streaming import copy_model
+
+    llm = copy_model(llm, temperature=0)
+
+    conversation = ConversationChain(llm=llm, memory=_conversation_memory(session_id, store, max_messages))
+    with response_cache_scope(use_cache):
+        return conversation.predict(input=message)
+
 class LangChainTest:
 
-    def __init__(self, llm: OpenAI):
+    def __init__(self, llm: OpenAI, stream: bool = False, session_id: str = None):
         self.llm = llm
+        self.stream = stream
+        self.session_id = session_id
     
     def test_answer_simple_question(self):
         question = "What are 5 vacation destinations for someone who likes to eat pasta?"
         print(f"Asking simple question: {question}")
-        answer = answer_simple_question(self.llm, question)
-        print(answer)
+        answer = answer_simple_question(self.llm, question, stream=self.stream)
+        if not self.stream:
+            print(answer)
 
     def test_places_to_eat_using_prompt_template(self):
         print("Checking where to eat steak using prompt")
@@ -136,57 +314,145 @@ class LangChainTest:
             print()
             print(f"Places to eat {foods[i]}: {answers[i]}") 
 
+    def test_places_to_eat_using_async_chain(self):
+        print("Checking where to eat burritos, sushi, pizza and ramen using concurrent chain calls")
+        import asyncio
+
+        foods: list = ["burritos", "sushi", "pizza", "ramen"]
+        results = asyncio.run(aget_places_to_eat_using_chain(self.llm, foods, max_concurrency=4))
+        for result in results:
+            print()
+            print(result)
+
+    def test_places_to_eat_using_chain_batch(self):
+        print("Checking where to eat burritos, sushi, pizza and ramen using batched chain calls")
+        foods: list = ["burritos", "sushi", "pizza", "ramen"]
+        answers = get_places_to_eat_using_chain_batch(self.llm, foods, batch_size=2)
+        for i in range(0, len(answers)):
+            print()
+            print(f"Places to eat {foods[i]}: {answers[i]}")
+
     def test_agent(self):
+        from utilitarios_llm.calculadora import get_math_tool_stats
+
         question = "Who is the current king of England? What is the largest prime number that is smallest than his age?"
-        print("Using agent to get current info about {question}")
-        result = get_current_info_using_agent(llm, question) 
+        print(f"Using agent to get current info about {question}")
+        result = get_current_info_using_agent(self.llm, question)
         print(result)
+        print(get_math_tool_stats())
 
     def test_conversation(self):
         print("Having a conversation with an AI")
-        chat_history = have_conversation(self.llm)
+        chat_history = have_conversation(self.llm, stream=self.stream, session_id=self.session_id)
         print()
         print("Finished conversation, printing chat history:")
         for message in chat_history:
             print(message)
 
+#Operações disponíveis no modo lote (ver utilitarios_llm/lote.py): os campos de cada registro são os parâmetros da função.
+#Os registros rodam em várias threads com o mesmo llm: cada função usa uma cópia do llm com os próprios parâmetros
+#(temperature, batch_size...), e nunca altera o llm compartilhado.
+def batch_operations(llm: OpenAI) -> dict:
+    return {
+        "answer_simple_question": lambda question, use_cache=None: answer_simple_question(llm, question, use_cache),
+        "places_to_eat_using_prompt_template": lambda food, use_cache=None: get_places_to_eat_using_prompt_template(llm, food, use_cache),
+        "places_to_eat_using_chain": lambda foods: get_places_to_eat_using_chain(llm, foods),
+        "places_to_eat_using_chain_batch": lambda foods, batch_size=20: get_places_to_eat_using_chain_batch(llm, foods, batch_size),
+        "current_info_using_agent": lambda questions, use_cache=None: get_current_info_using_agent(llm, questions, use_cache),
+        "conversation": lambda session_id, message, use_cache=None: continue_conversation(llm, session_id, message, use_cache),
+    }
+
+#Operações do modo servidor (ver utilitarios_llm/servidor.py), criadas uma vez em cada worker: as do modo lote e os
+#test_* do LangChainTest, todas com o mesmo client
+def server_operations() -> dict:
+    from utilitarios_llm.clientes import create_model_clients
+    from utilitarios_llm.cache_semantico import SEMANTIC_CACHE_DIR, install_semantic_cache_from_env
+
+    clients = create_model_clients(os.environ["OPENAI_API_KEY"], llm_temperature=0.9)
+    #O embedding store é compartilhado pelos workers, mas o índice do cache semântico aceita um único processo escritor
+    install_semantic_cache_from_env(clients.embeddings, directory=worker_directory(SEMANTIC_CACHE_DIR))
+    llm: OpenAI = clients.llm
+    operations: dict = batch_operations(llm)
+    operations.update(test_operations(LangChainTest(llm, session_id=os.environ.get("CONVERSATION_SESSION_ID"))))
+    return operations
+
 if __name__ == "__main__":
 
-    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY", get_api_key("openai"))
-    os.environ["SERPAPI_API_KEY"] = os.environ.get("SERPAPI_API_KEY", get_api_key("serp"))
+    #Sem argumentos, mostra o menu; com --batch, executa os registros do arquivo (ex: {"op": "places_to_eat_using_chain", "foods": ["sushi"]});
+    #com --serve, atende as operações por HTTP (ex: POST /places_to_eat_using_chain {"foods": ["sushi"]})
+    parser = argparse.ArgumentParser(description="Exemplos do quickstart do langchain")
+    add_batch_arguments(parser, batch_operations(None))
+    add_server_arguments(parser)
+    args = parser.parse_args()
 
-    llm: OpenAI = OpenAI(temperature=0.9)
+    #As api keys que não estão nas variáveis de ambiente são descriptografadas em segundo plano enquanto o menu é exibido
+    api_keys = prefetch_api_keys({"OPENAI_API_KEY": "openai", "SERPAPI_API_KEY": "serp"})
 
     option: int = None
 
-    while(True):
+    while(not args.batch and args.serve is None):
         option_str: str = input("""
         1. Answer simple question
         2. Get places to eat using prompt template
         3. Get places to eat using chain
         4. Use agent to get current info from the internet and do math calculations
         5. Have a conversation with an AI
+        6. Get places to eat using concurrent (async) chain calls
+        7. Get places to eat using batched chain calls
 
         Enter option: 
         """)
 
         try:
             option: int = int(option_str)
-            if option in [1, 2, 3, 4, 5]:
+            if option in [1, 2, 3, 4, 5, 6, 7]:
                 break
             else:
                 print("Invalid option")
         except ValueError:
             print("Invalid option")
 
-    llm_test = LangChainTest(llm)
+    api_keys.export()
+    #Os workers são criados antes de qualquer import do langchain e criam os próprios clients
+    if args.serve is not None:
+        run_server_from_args(args, server_operations)
+        sys.exit()
+
+    from utilitarios_llm.clientes import create_model_clients
+    from utilitarios_llm.cache_semantico import install_semantic_cache_from_env
+
+    #O client usa a sessão HTTP compartilhada, com pool de conexões keep-alive (ver utilitarios_llm/clientes.py)
+    clients = create_model_clients(os.environ["OPENAI_API_KEY"], llm_temperature=0.9)
+    llm: OpenAI = clients.llm
+    #LLM_SEMANTIC_CACHE=1 liga o cache semântico na opção 2 (ver utilitarios_llm/cache_semantico.py)
+    semantic_cache = install_semantic_cache_from_env(clients.embeddings)
+
+    if args.batch:
+        run_batch_from_args(args, batch_operations(llm))
+        sys.exit()
+
+    #LLM_STREAMING=1 mostra as respostas token a token, à medida que chegam
+    #CONVERSATION_SESSION_ID=<id> grava a conversa da opção 5 no ConversationStore, e a próxima execução continua a conversa
+    llm_test = LangChainTest(
+        llm, stream=os.environ.get("LLM_STREAMING") == "1", session_id=os.environ.get("CONVERSATION_SESSION_ID")
+    )
 
     options = {
         1: llm_test.test_answer_simple_question,
         2: llm_test.test_places_to_eat_using_prompt_template,
         3: llm_test.test_places_to_eat_using_chain,
         4: llm_test.test_agent,
-        5: llm_test.test_conversation
+        5: llm_test.test_conversation,
+        6: llm_test.test_places_to_eat_using_async_chain,
+        7: llm_test.test_places_to_eat_using_chain_batch
     }
 
-    options[option]()
\ No newline at end of file
+    options[option]()
+
+    if semantic_cache is not None:
+        print(f"Semantic cache: {semantic_cache.stats()}")
+
+    #LLM_METRICS=1 mostra as métricas das chamadas feitas (duração, tokens, custo, caches)
+    if os.environ.get("LLM_METRICS") == "1":
+        from utilitarios_llm.metricas import export_json
+        print(export_json())
\ No newline at end of file
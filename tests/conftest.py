@@ -0,0 +1,147 @@
+import os
+import sys
+import zlib
+import importlib.util
+import threading
+from typing import Any, List, Mapping, Optional
+
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.join(current_dir, "..")
+sys.path.append(root_dir)
+
+from langchain.llms.base import LLM
+from langchain.chat_models.base import SimpleChatModel
+from langchain.embeddings.base import Embeddings
+
+#Registro das chamadas compartilhado entre o LLM e as cópias dele (o copy do pydantic cria listas novas)
+class CallLog:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: list = []
+
+    def append(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+#LLM falso para os testes: responde "<prefixo>: <prompt>" e conta as chamadas, sem acessar a rede.
+#temperature faz parte dos parâmetros (llm.dict()), como no OpenAI, para os caches que dependem dela; batch_size existe
+#como no OpenAI, para as operações que o ajustam.
+class CountingLLM(LLM):
+    temperature: float = 0.0
+    batch_size: int = 20
+    prefix: str = "answer"
+    calls: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "counting"
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return {"temperature": self.temperature, "prefix": self.prefix}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None) -> str:
+        self.calls.append((prompt, self.temperature))
+        return f"{self.prefix}: {prompt}"
+
+@pytest.fixture
+def counting_llm():
+    return CountingLLM(calls=CallLog())
+
+#Chat model falso: responde reply (ou "<prefixo>: <última mensagem>") e guarda as mensagens de cada chamada
+class CountingChatModel(SimpleChatModel):
+    prefix: str = "answer"
+    reply: str = None
+    calls: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "counting-chat"
+
+    def _call(self, messages: list, stop: Optional[List[str]] = None, run_manager=None) -> str:
+        self.calls.append(messages)
+        return self.reply if self.reply is not None else f"{self.prefix}: {messages[-1].content}"
+
+    async def _agenerate(self, messages: list, stop: Optional[List[str]] = None, run_manager=None):
+        return self._generate(messages, stop=stop)
+
+@pytest.fixture
+def counting_chat():
+    return CountingChatModel(calls=CallLog())
+
+#Cache de respostas do processo num arquivo temporário, sem tocar no langchain.llm_cache do ambiente
+@pytest.fixture
+def response_cache(tmp_path, monkeypatch):
+    import langchain
+    from utilitarios_llm import cache_respostas
+
+    cache = cache_respostas.LLMResponseCache(str(tmp_path / "respostas.sqlite"))
+    monkeypatch.setattr(cache_respostas, "_response_cache", cache)
+    monkeypatch.setattr(langchain, "llm_cache", None)
+    yield cache
+    cache.connection.close()
+
+#Embeddings falso: saco de palavras (cada palavra num dos dim componentes, pelo hash), normalizado.
+#Textos com as mesmas palavras têm similaridade 1, e textos sem palavras em comum, 0. Conta os textos embedados.
+class WordEmbeddings(Embeddings):
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+        self.texts: list = []
+
+    def _embed(self, text: str) -> list:
+        vector = [0.0] * self.dim
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % self.dim] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list) -> list:
+        self.texts.extend(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        self.texts.append(text)
+        return self._embed(text)
+
+@pytest.fixture
+def word_embeddings():
+    return WordEmbeddings()
+
+#Os scripts (quickstart/quickstart.py...) não são pacotes; são carregados pelo caminho, uma vez por sessão de testes
+def load_script(name: str, *path: str):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(root_dir, *path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope="session")
+def quickstart():
+    return load_script("quickstart_app", "quickstart", "quickstart.py")
+
+#Servidor local que imita a API da OpenAI (utilitarios_llm/servidor_stub.py). Os clients criados com
+#create_model_clients(api_base=stub_server.api_base) mudam a configuração global da biblioteca openai, que é restaurada
+#ao final do teste
+@pytest.fixture
+def stub_server(monkeypatch):
+    import openai
+    from utilitarios_llm.servidor_stub import StubOpenAIServer
+
+    monkeypatch.setattr(openai, "api_base", openai.api_base)
+    monkeypatch.setattr(openai, "requestssession", getattr(openai, "requestssession", None), raising=False)
+    server = StubOpenAIServer()
+    server.start()
+    yield server
+    server.stop()
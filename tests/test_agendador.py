@@ -0,0 +1,239 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from utilitarios_llm.agendador import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RequestScheduler
+
+class RateLimitError(Exception):
+    http_status = 429
+    headers = {}
+
+def make_scheduler(**kwargs) -> RequestScheduler:
+    return RequestScheduler(**{"requests_per_minute": 1e6, "tokens_per_minute": 1e9, "base_delay": 0.001, **kwargs})
+
+#Ocupa as vagas do agendador com chamadas que esperam o evento release
+def hold_slots(scheduler: RequestScheduler, count: int, release: threading.Event) -> list:
+    started = threading.Barrier(count + 1)
+
+    def blocked():
+        started.wait(5)
+        release.wait(5)
+
+    threads = [threading.Thread(target=scheduler.call, args=(blocked,)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    return threads
+
+def wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+def test_chamadas_interativas_passam_na_frente_das_de_lote():
+    scheduler = make_scheduler(max_concurrency=1)
+    release = threading.Event()
+    holders = hold_slots(scheduler, 1, release)
+    order = []
+
+    threads = [threading.Thread(target=scheduler.call, args=(order.append, "lote"), kwargs={"priority": PRIORITY_BATCH})]
+    threads[0].start()
+    wait_until(lambda: len(scheduler.waiting) == 1)
+    threads.append(threading.Thread(target=scheduler.call, args=(order.append, "chat"), kwargs={"priority": PRIORITY_INTERACTIVE}))
+    threads[1].start()
+    wait_until(lambda: len(scheduler.waiting) == 2)
+
+    release.set()
+    for thread in holders + threads:
+        thread.join(5)
+    assert order == ["chat", "lote"]
+    assert scheduler.in_flight == 0
+
+def test_erro_de_rate_limit_e_repetido():
+    scheduler = make_scheduler(max_retries=3)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError()
+        return "ok"
+
+    assert scheduler.call(flaky) == "ok"
+    assert len(attempts) == 3
+    assert scheduler.retries == 2
+    assert scheduler.in_flight == 0
+
+def test_erro_nao_repetivel_e_relancado_na_hora():
+    scheduler = make_scheduler()
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise ValueError("erro")
+
+    with pytest.raises(ValueError):
+        scheduler.call(broken)
+    assert len(attempts) == 1
+    assert scheduler.in_flight == 0
+
+def test_desiste_depois_de_max_retries():
+    scheduler = make_scheduler(max_retries=2)
+    attempts = []
+
+    def always_limited():
+        attempts.append(1)
+        raise RateLimitError()
+
+    with pytest.raises(RateLimitError):
+        scheduler.call(always_limited)
+    assert len(attempts) == 3
+
+#Regressão: cancelar um acall que esperava vaga matava a thread do dispatcher (InvalidStateError no set_result),
+#deixava in_flight preso e todas as chamadas seguintes esperavam para sempre
+def test_acall_cancelado_na_fila_nao_trava_o_agendador():
+    scheduler = make_scheduler(max_concurrency=1)
+    release = threading.Event()
+    holders = hold_slots(scheduler, 1, release)
+
+    async def answer():
+        return "ok"
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.acall(answer), 0.05)
+        release.set()
+        return await asyncio.wait_for(scheduler.acall(answer), 5)
+
+    assert asyncio.run(main()) == "ok"
+    for thread in holders:
+        thread.join(5)
+    assert scheduler.dispatcher.is_alive()
+    assert scheduler.in_flight == 0
+    assert scheduler.waiting == []
+
+#Cancelamentos em qualquer ponto (antes, durante ou logo depois da admissão) sempre devolvem a vaga
+def test_cancelamentos_concorrentes_liberam_as_vagas():
+    scheduler = make_scheduler(max_concurrency=2)
+
+    async def slow():
+        await asyncio.sleep(0.01)
+
+    async def main():
+        for i in range(200):
+            tasks = [asyncio.ensure_future(scheduler.acall(slow)) for _ in range(3)]
+            for _ in range(i % 4):
+                await asyncio.sleep(0)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return await asyncio.wait_for(scheduler.acall(slow), 5)
+
+    asyncio.run(main())
+    wait_until(lambda: scheduler.in_flight == 0)
+    assert scheduler.dispatcher.is_alive()
+
+def test_call_interrompido_na_fila_libera_a_vaga():
+    scheduler = make_scheduler(max_concurrency=1)
+    release = threading.Event()
+    holders = hold_slots(scheduler, 1, release)
+
+    admitted = scheduler._admit(PRIORITY_BATCH, 0)
+    scheduler._abandon(admitted)
+    release.set()
+    for thread in holders:
+        thread.join(5)
+    assert scheduler.call(lambda: "ok") == "ok"
+    assert scheduler.in_flight == 0
+
+class RecordingRunManager:
+
+    def __init__(self):
+        self.tokens = []
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.tokens.append(token)
+
+#Uma tentativa que já emitiu tokens não é repetida: a repetição emitiria os tokens de novo
+def test_chamada_com_tokens_emitidos_nao_e_repetida():
+    scheduler = make_scheduler(max_retries=3)
+    run_manager = RecordingRunManager()
+    attempts = []
+
+    def stream_then_fail(run_manager=None):
+        attempts.append(1)
+        run_manager.on_llm_new_token("parcial")
+        raise RateLimitError()
+
+    with pytest.raises(RateLimitError):
+        scheduler.call(stream_then_fail, run_manager=run_manager)
+    assert len(attempts) == 1
+    assert run_manager.tokens == ["parcial"]
+
+def test_chamada_sem_tokens_emitidos_e_repetida():
+    scheduler = make_scheduler(max_retries=3)
+    run_manager = RecordingRunManager()
+    attempts = []
+
+    def fail_then_stream(run_manager=None):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RateLimitError()
+        run_manager.on_llm_new_token("completo")
+        return "ok"
+
+    assert scheduler.call(fail_then_stream, run_manager=run_manager) == "ok"
+    assert run_manager.tokens == ["completo"]
+
+def test_retry_after_e_limitado_a_max_delay():
+    scheduler = make_scheduler(max_delay=0.05)
+    error = RateLimitError()
+    error.headers = {"retry-after": "3600"}
+    assert scheduler._backoff(0, error) == 0.05
+    error.headers = {"Retry-After": "0.01"}
+    assert scheduler._backoff(0, error) == 0.01
+
+@pytest.fixture
+def scheduled_clients(stub_server, monkeypatch):
+    from utilitarios_llm import agendador
+    from utilitarios_llm.clientes import create_model_clients
+
+    scheduler = make_scheduler(max_retries=20, max_delay=0.05)
+    monkeypatch.setattr(agendador, "_scheduler", scheduler)
+    return scheduler, create_model_clients("sk-test", api_base=stub_server.api_base, metrics=False)
+
+#De ponta a ponta: o servidor local responde 429 (com Retry-After) e as chamadas são repetidas pelo agendador
+def test_429_do_servidor_e_repetido_pelo_agendador(stub_server, scheduled_clients):
+    scheduler, clients = scheduled_clients
+    stub_server.rate_limit_rate = 0.4
+    stub_server.retry_after = 0.01
+    answers: list = [clients.llm(f"question {i}") for i in range(10)]
+    assert all(answer.startswith(" Stub answer") for answer in answers)
+    assert stub_server.rate_limited > 0
+    assert scheduler.retries == stub_server.rate_limited
+    assert stub_server.requests == 10 + stub_server.rate_limited
+
+def test_retry_after_longo_do_servidor_nao_passa_de_max_delay(stub_server, scheduled_clients):
+    scheduler, clients = scheduled_clients
+    stub_server.max_requests_per_second = 1
+    stub_server.retry_after = 3600
+    start: float = time.monotonic()
+    clients.llm("first")
+    clients.llm("second")
+    #Sem o limite, a segunda chamada esperaria uma hora; com ele, repete a cada 0.05s até o servidor aceitar (~1s)
+    assert time.monotonic() - start < 5
+    assert scheduler.retries == stub_server.rate_limited > 0
+
+def test_429_acima_de_max_retries_chega_ao_chamador(stub_server, scheduled_clients):
+    import openai
+
+    scheduler, clients = scheduled_clients
+    scheduler.max_retries = 2
+    stub_server.rate_limit_rate = 1.0
+    stub_server.retry_after = 0
+    with pytest.raises(openai.error.RateLimitError):
+        clients.llm("question")
+    assert stub_server.rate_limited == 3
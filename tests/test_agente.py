@@ -0,0 +1,114 @@
+import time
+import threading
+from typing import Any
+
+import pytest
+from langchain.schema import AgentAction, AgentFinish
+from langchain.tools import Tool
+
+from conftest import CountingLLM
+from utilitarios_llm import agendador, cache_respostas
+from utilitarios_llm.agente import MultiActionOutputParser, ToolResultCache, cached_tool, create_agent
+
+#LLM falso que devolve as respostas de responses em sequência (a última se repete)
+class ScriptedLLM(CountingLLM):
+    responses: Any = None
+
+    def _call(self, prompt: str, stop=None, run_manager=None) -> str:
+        index: int = len(self.calls)
+        super()._call(prompt)
+        return self.responses[min(index, len(self.responses) - 1)]
+
+TWO_ACTIONS: str = (
+    " I need two independent facts.\nAction: Search\nAction Input: capital of France\n"
+    "Action: Lookup\nAction Input: \"population of Paris\""
+)
+FINAL: str = " I now know the final answer\nFinal Answer: Paris"
+
+#Tool lenta que registra, da thread em que roda, a prioridade e o estado do response_cache_scope
+def slow_tool(name: str, seen: list, delay: float = 0.3) -> Tool:
+    def run(query: str) -> str:
+        seen.append((name, query, threading.current_thread().name, agendador._priority.get(), cache_respostas._use_cache.get()))
+        time.sleep(delay)
+        return f"{name} result for {query}"
+
+    return Tool(name=name, description=f"{name} tool", func=run)
+
+def test_parser_aceita_varias_acoes():
+    actions = MultiActionOutputParser().parse(TWO_ACTIONS)
+    assert [(action.tool, action.tool_input) for action in actions] == [
+        ("Search", "capital of France"), ("Lookup", "population of Paris")
+    ]
+    #O log de cada ação é somente o seu trecho, na ordem
+    assert "".join(action.log for action in actions) == TWO_ACTIONS
+    assert "Lookup" not in actions[0].log
+
+def test_parser_com_uma_acao_ou_resposta_final():
+    action = MultiActionOutputParser().parse(" think\nAction: Search\nAction Input: x")
+    assert isinstance(action, AgentAction) and (action.tool, action.tool_input) == ("Search", "x")
+    finish = MultiActionOutputParser().parse(FINAL)
+    assert isinstance(finish, AgentFinish) and finish.return_values["output"] == "Paris"
+
+def test_acoes_do_mesmo_passo_rodam_em_paralelo():
+    seen: list = []
+    llm = ScriptedLLM(calls=[], responses=[TWO_ACTIONS, FINAL])
+    agent = create_agent(llm, [slow_tool("Search", seen), slow_tool("Lookup", seen)], verbose=False)
+    start: float = time.monotonic()
+    assert agent.run("What is the capital of France and its population?") == "Paris"
+    assert time.monotonic() - start < 0.55
+    assert sorted(name for name, *_ in seen) == ["Lookup", "Search"]
+    assert all(thread.startswith("agent-tool") for _, _, thread, *_ in seen)
+    #As duas observações chegam ao prompt do passo seguinte
+    assert "Search result for capital of France" in llm.calls[1][0]
+    assert "Lookup result for population of Paris" in llm.calls[1][0]
+
+def test_acoes_repetidas_no_passo_rodam_uma_vez():
+    seen: list = []
+    repeated: str = " x\nAction: Search\nAction Input: a\nAction: Search\nAction Input: a"
+    agent = create_agent(ScriptedLLM(calls=[], responses=[repeated, FINAL]), [slow_tool("Search", seen, 0)], verbose=False)
+    agent.run("q")
+    assert len(seen) == 1
+
+#Regressão: as tools executadas no pool de threads perdiam as ContextVars de quem chamou
+def test_tools_em_paralelo_herdam_o_contexto_de_quem_chamou(response_cache):
+    seen: list = []
+    agent = create_agent(ScriptedLLM(calls=[], responses=[TWO_ACTIONS, FINAL]),
+                         [slow_tool("Search", seen, 0), slow_tool("Lookup", seen, 0)], verbose=False)
+    with agendador.request_priority(agendador.PRIORITY_INTERACTIVE), cache_respostas.response_cache_scope(False):
+        agent.run("q")
+    assert [(priority, use_cache) for *_, priority, use_cache in seen] == [(agendador.PRIORITY_INTERACTIVE, False)] * 2
+
+def test_cache_de_tools_normaliza_o_input():
+    cache = ToolResultCache(ttl=60)
+    cache.put("Search", "  capital   of France ", "Paris")
+    assert cache.get("Search", "capital of France") == "Paris"
+    assert cache.get("Search", "capital of\nFrance") == "Paris"
+    assert cache.get("Lookup", "capital of France") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_cache_de_tools_expira_e_limita_as_entradas():
+    cache = ToolResultCache(ttl=0.05, max_entries=2)
+    cache.put("Search", "a", "1")
+    time.sleep(0.1)
+    assert cache.get("Search", "a") is None
+    cache = ToolResultCache(ttl=60, max_entries=2)
+    for query in ("a", "b", "c"):
+        cache.put("Search", query, query)
+    assert cache.get("Search", "a") is None and cache.get("Search", "c") == "c"
+
+def test_cached_tool_reaproveita_as_observacoes_e_nao_guarda_erros():
+    seen: list = []
+    cache = ToolResultCache(ttl=60)
+    tool = cached_tool(slow_tool("Search", seen, 0), cache)
+    assert tool.run("capital of France") == tool.run(" capital of  France") == "Search result for capital of France"
+    assert len(seen) == 1
+
+    def failing(query: str) -> str:
+        seen.append(query)
+        raise RuntimeError("falhou")
+
+    tool = cached_tool(Tool(name="Broken", description="broken", func=failing), cache)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            tool.run("x")
+    assert seen[1:] == ["x", "x"]
@@ -0,0 +1,138 @@
+import os
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from utilitarios_llm.cache_embeddings import CachedEmbeddings, EmbeddingStore
+
+def test_somente_textos_novos_sao_embedados(tmp_path, word_embeddings):
+    cached = CachedEmbeddings(word_embeddings, EmbeddingStore(str(tmp_path)))
+    first = cached.embed_documents(["a b", "c d"])
+    assert word_embeddings.texts == ["a b", "c d"]
+
+    second = cached.embed_documents(["c d", "e f", "a b", "e f"])
+    #"e f" repetido no mesmo lote é embedado uma única vez, e os demais vêm do store
+    assert word_embeddings.texts == ["a b", "c d", "e f"]
+    np.testing.assert_allclose(second[0], first[1], rtol=1e-6)
+    np.testing.assert_allclose(second[2], first[0], rtol=1e-6)
+    assert second[1] == second[3]
+
+def test_embed_query_usa_o_mesmo_store(tmp_path, word_embeddings):
+    cached = CachedEmbeddings(word_embeddings, EmbeddingStore(str(tmp_path)))
+    cached.embed_documents(["a b"])
+    cached.embed_query("a b")
+    cached.embed_query("x y")
+    cached.embed_query("x y")
+    assert word_embeddings.texts == ["a b", "x y"]
+
+def test_store_reaberto_le_os_vetores_do_disco(tmp_path, word_embeddings):
+    cached = CachedEmbeddings(word_embeddings, EmbeddingStore(str(tmp_path)))
+    vectors = cached.embed_documents(["a b", "c d"])
+
+    reopened = CachedEmbeddings(word_embeddings, EmbeddingStore(str(tmp_path)))
+    np.testing.assert_allclose(reopened.embed_documents(["c d", "a b"]), vectors[::-1], rtol=1e-6)
+    assert word_embeddings.texts == ["a b", "c d"]
+
+#Processo interrompido entre a gravação dos vetores e a do índice: a linha sem índice é descartada na abertura
+def test_store_trunca_escrita_incompleta(tmp_path, word_embeddings):
+    store = EmbeddingStore(str(tmp_path))
+    store.add_many(["k1", "k2"], [word_embeddings._embed("a"), word_embeddings._embed("b")])
+    with open(os.path.join(str(tmp_path), "index.txt"), "w") as f:
+        f.write("k1\n")
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert len(reopened) == 1
+    assert "k2" not in reopened
+    assert os.path.getsize(reopened.vectors_path) == reopened.dim * 4
+
+def test_modelos_diferentes_nao_compartilham_vetores(tmp_path, word_embeddings):
+    store = EmbeddingStore(str(tmp_path))
+    CachedEmbeddings(word_embeddings, store).embed_documents(["a b"])
+    other = CachedEmbeddings(word_embeddings, store)
+    other.model_name = "outro-modelo"
+    other.embed_documents(["a b"])
+    assert word_embeddings.texts == ["a b", "a b"]
+
+def test_lote_com_textos_repetidos(tmp_path, word_embeddings):
+    from utilitarios_llm.metricas import CACHE_REQUESTS
+
+    cached = CachedEmbeddings(word_embeddings, EmbeddingStore(str(tmp_path)))
+    cached.embed_documents(["text 0", "text 1"])
+    hits: float = CACHE_REQUESTS.get(cache="embedding", result="hit")
+    misses: float = CACHE_REQUESTS.get(cache="embedding", result="miss")
+
+    #2 textos no store, repetidos, e 1000 textos novos, cada um repetido 3 vezes
+    texts: list = ["text 0", "text 1"] * 5 + [f"text {i}" for i in range(2, 1002)] * 3
+    vectors: list = cached.embed_documents(texts)
+    assert len(vectors) == len(texts)
+    assert word_embeddings.texts[2:] == [f"text {i}" for i in range(2, 1002)]
+    assert len(cached.store) == 1002
+    assert all(vectors[i] == vectors[i + 1000] for i in range(10, 1010))
+    assert CACHE_REQUESTS.get(cache="embedding", result="hit") - hits == 10
+    assert CACHE_REQUESTS.get(cache="embedding", result="miss") - misses == 1000
+
+def test_add_many_ignora_chaves_repetidas(tmp_path, word_embeddings):
+    store = EmbeddingStore(str(tmp_path))
+    vector: list = word_embeddings._embed("a")
+    store.add_many(["k1", "k2", "k1", "k2"], [vector] * 4)
+    store.add_many(["k2", "k3"], [vector] * 2)
+    assert len(store) == 3
+    assert os.path.getsize(store.vectors_path) == 3 * store.dim * 4
+    with open(store.index_path) as f:
+        assert f.read().split() == ["k1", "k2", "k3"]
+
+#Vetor que identifica a chave, para conferir que cada linha do índice aponta para o vetor da sua chave
+def _vector(key: str) -> list:
+    return [float(int(key[1:])), float(len(key))]
+
+#Processo do modo servidor: cada worker abre o próprio store no mesmo diretório e grava em lotes pequenos, com chaves
+#próprias e chaves compartilhadas com os outros workers
+def _add_in_process(directory: str, worker: int):
+    store = EmbeddingStore(directory)
+    for batch in range(20):
+        keys: list = [f"w{worker * 1000 + batch * 10 + i}" for i in range(10)] + [f"s{batch * 10 + i}" for i in range(10)]
+        store.add_many(keys, [_vector(key) for key in keys])
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="precisa de fork")
+def test_varios_processos_gravando_no_mesmo_store(tmp_path):
+    directory: str = str(tmp_path)
+    context = multiprocessing.get_context("fork")
+    processes: list = [context.Process(target=_add_in_process, args=(directory, n)) for n in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    store = EmbeddingStore(directory)
+    keys: list = [f"w{n * 1000 + i}" for n in range(4) for i in range(200)] + [f"s{i}" for i in range(200)]
+    #As chaves compartilhadas são gravadas uma única vez, e os dois arquivos têm o mesmo número de linhas
+    assert len(store) == store.count == 1000
+    assert os.path.getsize(store.vectors_path) == 1000 * store.dim * 4
+    np.testing.assert_array_equal(store.get_many(keys), [_vector(key) for key in keys])
+
+#Outro processo (aqui, outro store no mesmo diretório) gravou depois da abertura: as linhas dele são lidas antes da gravação
+def test_store_le_as_linhas_gravadas_por_outro_escritor(tmp_path):
+    first, second = EmbeddingStore(str(tmp_path)), EmbeddingStore(str(tmp_path))
+    first.add_many(["k1", "k2"], [_vector("k1"), _vector("k2")])
+    assert second.get_many(["k2"])[0].tolist() == _vector("k2")
+    second.add_many(["k2", "k3"], [_vector("k2"), _vector("k3")])
+    first.add_many(["k4"], [_vector("k4")])
+    with open(first.index_path) as f:
+        assert f.read().split() == ["k1", "k2", "k3", "k4"]
+    np.testing.assert_array_equal(EmbeddingStore(str(tmp_path)).get_many(["k1", "k2", "k3", "k4"]),
+                                  [_vector(key) for key in ["k1", "k2", "k3", "k4"]])
+
+#Escritor interrompido no meio da gravação do índice: o trecho de linha é descartado antes da próxima gravação
+def test_linha_incompleta_no_indice(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.add_many(["k1"], [_vector("k1")])
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.asarray([_vector("k2")], dtype=np.float32).tobytes())
+    with open(store.index_path, "a") as f:
+        f.write("k")
+    store.add_many(["k3"], [_vector("k3")])
+    with open(store.index_path) as f:
+        assert f.read().split() == ["k1", "k3"]
+    assert EmbeddingStore(str(tmp_path)).get_many(["k3"])[0].tolist() == _vector("k3")
@@ -0,0 +1,97 @@
+import threading
+
+import langchain
+
+from utilitarios_llm.cache_respostas import install_response_cache, response_cache_scope
+
+def test_chamada_deterministica_usa_o_cache(response_cache, counting_llm):
+    with response_cache_scope():
+        assert counting_llm("oi") == "answer: oi"
+        assert counting_llm("oi") == "answer: oi"
+    assert len(counting_llm.calls) == 1
+
+def test_temperature_maior_que_zero_so_usa_o_cache_quando_pedido(response_cache, counting_llm):
+    counting_llm.temperature = 0.9
+    with response_cache_scope():
+        counting_llm("oi")
+        counting_llm("oi")
+    assert len(counting_llm.calls) == 2
+    with response_cache_scope(True):
+        counting_llm("oi")
+        counting_llm("oi")
+    assert len(counting_llm.calls) == 3
+
+def test_use_cache_false_ignora_o_cache(response_cache, counting_llm):
+    with response_cache_scope():
+        counting_llm("oi")
+    with response_cache_scope(False):
+        counting_llm("oi")
+    assert len(counting_llm.calls) == 2
+
+def test_escopo_restaura_o_llm_cache_anterior(response_cache, counting_llm):
+    previous = object()
+    langchain.llm_cache = previous
+    with response_cache_scope():
+        assert langchain.llm_cache is response_cache
+        with response_cache_scope(False):
+            assert langchain.llm_cache is response_cache
+        assert langchain.llm_cache is response_cache
+    assert langchain.llm_cache is previous
+
+def test_chamadas_fora_do_escopo_nao_usam_o_cache(response_cache, counting_llm):
+    with response_cache_scope():
+        counting_llm("oi")
+    counting_llm("oi")
+    assert len(counting_llm.calls) == 2
+    assert langchain.llm_cache is None
+
+#Outra thread chamando o LLM enquanto um escopo está aberto não passa pelo cache
+def test_outra_thread_fora_do_escopo_nao_usa_o_cache(response_cache, counting_llm):
+    inside = threading.Event()
+    done = threading.Event()
+
+    def scope():
+        with response_cache_scope():
+            counting_llm("oi")
+            inside.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=scope)
+    thread.start()
+    inside.wait(5)
+    counting_llm("oi")
+    done.set()
+    thread.join()
+    assert len(counting_llm.calls) == 2
+
+def test_escopos_concorrentes_restauram_o_llm_cache_no_ultimo(response_cache, counting_llm):
+    barrier = threading.Barrier(8)
+
+    def scope():
+        with response_cache_scope():
+            barrier.wait(5)
+            counting_llm("oi")
+
+    threads = [threading.Thread(target=scope) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert langchain.llm_cache is None
+
+def test_cache_instalado_vale_fora_do_escopo(response_cache, counting_llm):
+    assert install_response_cache() is response_cache
+    counting_llm("oi")
+    counting_llm("oi")
+    with response_cache_scope(False):
+        counting_llm("oi")
+    assert langchain.llm_cache is response_cache
+    assert len(counting_llm.calls) == 2
+
+def test_lru_limita_o_numero_de_entradas(response_cache, counting_llm):
+    response_cache.max_entries = 3
+    with response_cache_scope():
+        for i in range(5):
+            counting_llm(f"prompt {i}")
+    count = response_cache.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    assert count == 3
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from utilitarios_llm.cache_semantico import SemanticResponseCache
+
+@pytest.fixture
+def semantic_cache(tmp_path, word_embeddings):
+    cache = SemanticResponseCache(word_embeddings, directory=str(tmp_path), threshold=0.95, audit_rate=0, save_interval=3600)
+    yield cache
+    cache.close()
+
+def test_prompt_igual_e_hit_e_prompt_diferente_e_miss(semantic_cache, counting_llm):
+    first: str = semantic_cache.complete(counting_llm, "places to eat pasta in Rome")
+    #As mesmas palavras, em outra ordem, têm similaridade 1 no WordEmbeddings
+    assert semantic_cache.complete(counting_llm, "pasta places to eat in Rome") == first
+    assert semantic_cache.complete(counting_llm, "best beaches in Brazil") == "answer: best beaches in Brazil"
+    assert len(counting_llm.calls) == 2
+    stats: dict = semantic_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+    assert stats["hit_rate"] == pytest.approx(1 / 3, abs=1e-3)
+
+def test_namespaces_e_parametros_do_llm_sao_separados(semantic_cache, counting_llm):
+    semantic_cache.complete(counting_llm, "sushi", namespace="a")
+    semantic_cache.complete(counting_llm, "sushi", namespace="b")
+    assert len(counting_llm.calls) == 2
+    hot = type(counting_llm)(temperature=0.9, calls=[])
+    semantic_cache.complete(hot, "sushi", namespace="a")
+    semantic_cache.complete(hot, "sushi", namespace="a")
+    assert hot.calls == [("sushi", 0.9)]
+
+def test_indices_sao_gravados_e_recarregados(tmp_path, word_embeddings, counting_llm):
+    cache = SemanticResponseCache(word_embeddings, directory=str(tmp_path), audit_rate=0, save_interval=3600)
+    cache.complete(counting_llm, "tacos in Mexico")
+    cache.close()
+
+    reopened = SemanticResponseCache(word_embeddings, directory=str(tmp_path), audit_rate=0, save_interval=3600)
+    assert reopened.complete(counting_llm, "tacos in Mexico") == "answer: tacos in Mexico"
+    assert len(counting_llm.calls) == 1
+    assert reopened.stats()["hits"] == 1
+    reopened.close()
+
+def test_entradas_mais_antigas_saem_acima_de_max_entries(tmp_path, word_embeddings, counting_llm):
+    cache = SemanticResponseCache(word_embeddings, directory=str(tmp_path), audit_rate=0, max_entries=10, save_interval=3600)
+    for i in range(11):
+        cache.complete(counting_llm, f"food number{i}")
+    #Acima de 10 entradas, o índice volta a 9 (90%)
+    assert cache.stats()["entries"] == 9
+    cache.complete(counting_llm, "food number10")
+    cache.complete(counting_llm, "food number0")
+    assert len(counting_llm.calls) == 12
+    cache.close()
+
+def test_auditoria_grava_os_hits_auditados(tmp_path, word_embeddings, counting_llm):
+    cache = SemanticResponseCache(word_embeddings, directory=str(tmp_path), audit_rate=1, save_interval=3600)
+    cache.complete(counting_llm, "ramen in Tokyo")
+    cache.complete(counting_llm, "Tokyo ramen in")
+    cache.close()
+
+    with open(tmp_path / "audit.jsonl", encoding="utf-8") as f:
+        records: list = [json.loads(line) for line in f]
+    assert len(records) == 1 and cache.stats()["audits"] == 1
+    record: dict = records[0]
+    assert record["prompt"] == "Tokyo ramen in" and record["matched_prompt"] == "ramen in Tokyo"
+    assert record["score"] == pytest.approx(1.0)
+    assert record["fresh_response"] == "answer: Tokyo ramen in"
+    #A auditoria chama o LLM de novo, sem passar pelo cache
+    assert len(counting_llm.calls) == 2
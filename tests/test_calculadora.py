@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from utilitarios_llm.calculadora import ExpressionError, evaluate_expression, normalize_expression
+
+@pytest.mark.parametrize("expression, expected", [
+    ("2 + 3 * 4", 14),
+    ("2^10", 1024),
+    ("sqrt(49)", 7.0),
+    ("comb(10, 3)", 120),
+    ("perm(5)", 120),
+    ("perm(5, 2)", 20),
+    ("previous_prime(74)", 73),
+    ("is_prime(sqrt(49))", True),
+    ("sum([1, 2, 3]) + len([4, 5])", 8),
+    ("largest prime number smaller than 74", 73),
+])
+def test_expressoes_validas(expression, expected):
+    assert evaluate_expression(expression) == expected
+
+#Expressões que travavam o agent (comb enorme), alocavam gigabytes ([0] * 10 ** 8) ou davam resposta errada
+#(is_prime(2.5) era True): todas devem falhar na hora com ExpressionError
+@pytest.mark.parametrize("expression", [
+    "comb(3000000, 1500000)",
+    "perm(3000000, 1500000)",
+    "perm(100000)",
+    "[0] * 10 ** 9",
+    "10 ** 9 * [0]",
+    "[1, 2] * 3",
+    "is_prime(2.5)",
+    "previous_prime(10.5)",
+    "prime_factors(7.5)",
+    "is_prime(2 ** 9941 - 1)",
+    "2 ** 9999 * 2 ** 9999 * 2 ** 9999 * 2 ** 9999 * 2 ** 9999 * 2 ** 9999 * 2 ** 9999 * 2 ** 9999 * 2 ** 9999 * 2 ** 9999 * 2 ** 9999",
+    "factorial(100000)",
+    "2 ** 100000",
+])
+def test_expressoes_caras_ou_invalidas_falham_rapido(expression):
+    start = time.perf_counter()
+    with pytest.raises(ExpressionError):
+        evaluate_expression(expression)
+    assert time.perf_counter() - start < 1
+
+def test_linguagem_natural_vira_chamada():
+    assert normalize_expression("Is 97 a prime number?") == "is_prime(97)"
+
+#Acima de 81 bits as bases fixas do Miller-Rabin não garantem a resposta: 3317044064679887385961981 é composto
+#(pseudoprimo forte para todas elas) e era reportado como primo
+def test_is_prime_so_responde_onde_o_teste_e_deterministico():
+    assert evaluate_expression("is_prime(2 ** 61 - 1)") is True
+    assert evaluate_expression("is_prime(2 ** 81 - 1)") is False
+    with pytest.raises(ExpressionError):
+        evaluate_expression("is_prime(3317044064679887385961981)")
+
+def test_primo_grande_vai_para_o_llm_math_chain():
+    from conftest import CallLog, CountingLLM
+    from utilitarios_llm.calculadora import MathToolStats, create_math_tool
+
+    llm = CountingLLM(prefix="Answer", calls=CallLog())
+    stats = MathToolStats()
+    tool = create_math_tool(llm, stats)
+    assert tool.run("is_prime(97)") == "Answer: True"
+    tool.run("is_prime(3317044064679887385961981)")
+    assert (stats.local, stats.fallbacks) == (1, 1)
+    assert len(llm.calls) == 1
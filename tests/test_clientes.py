@@ -0,0 +1,40 @@
+import threading
+
+import openai
+from langchain.schema import HumanMessage
+
+from utilitarios_llm.clientes import create_model_clients
+
+def test_clients_compartilham_uma_conexao_keep_alive(stub_server):
+    clients = create_model_clients("sk-test", api_base=stub_server.api_base, metrics=False)
+    assert openai.requestssession is clients.session
+    for i in range(3):
+        clients.llm(f"question {i}")
+        clients.chat([HumanMessage(content=f"message {i}")])
+        clients.embeddings.embed_query(f"text {i}")
+    assert stub_server.requests == 9
+    assert stub_server.connections == 1
+
+def test_threads_reaproveitam_as_conexoes_do_pool(stub_server):
+    stub_server.latency = 0.02
+    clients = create_model_clients("sk-test", api_base=stub_server.api_base, pool_size=8, metrics=False)
+    errors: list = []
+
+    def worker(n: int):
+        try:
+            for i in range(5):
+                clients.llm(f"question {n}-{i}")
+                clients.embeddings.embed_query(f"text {n}-{i}")
+        except Exception as e:
+            errors.append(e)
+
+    threads: list = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert stub_server.requests == 80
+    #Com o pool do tamanho do número de threads, no máximo uma conexão por thread, e não uma por requisição
+    assert stub_server.connections <= 8
+    assert clients.session.get_adapter(stub_server.api_base)._pool_maxsize == 8
@@ -0,0 +1,113 @@
+import json
+import threading
+
+import pytest
+from langchain.schema import AIMessage, HumanMessage
+
+from utilitarios_llm.conversas import ChatMessage, ConversationStore
+from utilitarios_llm.historico_chat import StoredChatMessageHistory
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConversationStore(str(tmp_path), shards=4, hot_messages=5)
+    yield store
+    store.close()
+
+def texts(messages) -> list:
+    return [str(message) for message in messages]
+
+def test_extend_e_append_numeram_as_mensagens_em_ordem(store):
+    store.extend("s", [("Me", "oi"), ChatMessage("Bot", "olá")])
+    message: ChatMessage = store.append("s", "Me", "tudo bem?")
+    assert message.created is not None
+    assert store.count("s") == 3
+    assert texts(store.recent("s")) == ["Me: oi", "Bot: olá", "Me: tudo bem?"]
+    assert store.count("outra") == 0 and store.recent("outra") == []
+
+def test_recent_e_history(store):
+    for i in range(12):
+        store.append("s", "Me", str(i))
+    assert texts(store.recent("s")) == [f"Me: {i}" for i in range(7, 12)]
+    assert texts(store.recent("s", limit=2)) == ["Me: 10", "Me: 11"]
+    #Acima de hot_messages as mensagens são lidas do disco
+    assert texts(store.recent("s", limit=8)) == [f"Me: {i}" for i in range(4, 12)]
+    assert store.recent("s", limit=0) == []
+    assert texts(store.history("s", batch_size=5)) == [f"Me: {i}" for i in range(12)]
+
+def test_lru_reaproveita_as_mensagens_da_sessao(store):
+    store.append("s", "Me", "a")
+    store.recent("s")
+    store.append("s", "Bot", "b")
+    assert texts(store.recent("s")) == ["Me: a", "Bot: b"]
+    assert (store.hits, store.misses) == (1, 1)
+
+def test_lru_recarrega_a_sessao_alterada_por_outro_store(store, tmp_path):
+    store.append("s", "Me", "a")
+    assert texts(store.recent("s")) == ["Me: a"]
+    other = ConversationStore(str(tmp_path))
+    try:
+        other.append("s", "Bot", "b")
+        store.append("s", "Me", "c")
+        assert texts(store.recent("s")) == ["Me: a", "Bot: b", "Me: c"]
+        other.append("s", "Bot", "d")
+        assert texts(store.recent("s")) == ["Me: a", "Bot: b", "Me: c", "Bot: d"]
+    finally:
+        other.close()
+
+def test_lru_limita_o_numero_de_sessoes(tmp_path):
+    store = ConversationStore(str(tmp_path), shards=2, cache_size=2)
+    try:
+        for session_id in ("a", "b", "c"):
+            store.append(session_id, "Me", session_id)
+            store.recent(session_id)
+        assert list(store.sessions) == ["b", "c"]
+        assert texts(store.recent("a")) == ["Me: a"]
+    finally:
+        store.close()
+
+def test_delete(store):
+    store.extend("s", [("Me", "a"), ("Bot", "b")])
+    store.recent("s")
+    store.delete("s")
+    assert store.count("s") == 0 and store.recent("s") == []
+    store.append("s", "Me", "c")
+    assert texts(store.recent("s")) == ["Me: c"]
+
+def test_appends_concorrentes_nao_perdem_mensagens(store):
+    def worker(n: int):
+        for i in range(25):
+            store.append(f"s{n % 3}", "Me", f"{n}-{i}")
+            store.recent(f"s{n % 3}")
+
+    threads: list = [threading.Thread(target=worker, args=(n,)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for session in ("s0", "s1", "s2"):
+        assert store.count(session) == 50
+        messages: list = texts(store.history(session))
+        assert len(set(messages)) == 50
+        #O LRU termina igual ao disco
+        assert texts(store.recent(session)) == messages[-5:]
+
+def test_numero_de_shards_e_gravado_no_diretorio(store, tmp_path):
+    with open(tmp_path / "store.json") as f:
+        assert json.load(f) == {"shards": 4}
+    reopened = ConversationStore(str(tmp_path))
+    assert reopened.shard_count == 4
+    reopened.close()
+    with pytest.raises(ValueError):
+        ConversationStore(str(tmp_path), shards=8)
+
+def test_stored_chat_message_history(store):
+    history = StoredChatMessageHistory(store, "s")
+    history.add_user_message("oi")
+    history.add_ai_message("olá")
+    store.append("s", "Sistema", "aviso")
+    messages: list = history.messages
+    assert isinstance(messages[0], HumanMessage) and isinstance(messages[1], AIMessage)
+    assert [message.content for message in messages] == ["oi", "olá", "aviso"]
+    assert messages[2].role == "Sistema"
+    history.clear()
+    assert history.messages == []
@@ -0,0 +1,88 @@
+import os
+import threading
+import multiprocessing
+
+import pytest
+
+from gerenciador_api_keys import criptografa_api_key, recupera_api_key
+from gerenciador_api_keys.criptografa_api_key import _keystore_lock, update_keystore
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    recupera_api_key.invalidate_api_key_cache()
+    yield
+    recupera_api_key.invalidate_api_key_cache()
+
+@pytest.fixture
+def key_file(tmp_path) -> str:
+    path: str = str(tmp_path / "key")
+    with open(path, "wb") as f:
+        f.write(os.urandom(32))
+    return path
+
+def test_update_preserva_e_rotaciona_as_entradas(tmp_path, key_file):
+    keystore: str = str(tmp_path / "keystore")
+    assert update_keystore(key_file, keystore, {"openai": "sk-1"}) == {"openai": "sk-1"}
+    update_keystore(key_file, keystore, {"serp": "serp-1"})
+    update_keystore(key_file, keystore, {"openai": "sk-2"})
+    assert recupera_api_key.decrypt_keystore(key_file, keystore) == {"openai": "sk-2", "serp": "serp-1"}
+
+def test_update_invalida_o_keystore_em_cache(tmp_path, key_file):
+    keystore: str = str(tmp_path / "keystore")
+    update_keystore(key_file, keystore, {"openai": "sk-1"})
+    assert recupera_api_key.load_keystore(key_file, keystore, ttl=60) == {"openai": "sk-1"}
+    #Mesmo que o mtime não mude (resolução do sistema de arquivos), a próxima leitura vê a rotação
+    update_keystore(key_file, keystore, {"openai": "sk-2"})
+    assert recupera_api_key.load_keystore(key_file, keystore, ttl=60) == {"openai": "sk-2"}
+
+def test_get_api_key_prefere_o_keystore(tmp_path, key_file, monkeypatch):
+    keystore: str = str(tmp_path / "keystore")
+    update_keystore(key_file, keystore, {"openai": "sk-1"})
+    monkeypatch.setenv("CRYPTO_KEY_FILE", key_file)
+    monkeypatch.setenv("API_KEYSTORE_FILE", keystore)
+    assert recupera_api_key.get_api_key("openai") == "sk-1"
+
+def test_update_nao_deixa_arquivos_temporarios(tmp_path, key_file):
+    keystore: str = str(tmp_path / "keystore")
+    for i in range(3):
+        update_keystore(key_file, keystore, {f"p{i}": str(i)})
+    assert sorted(os.listdir(tmp_path)) == ["key", "keystore", "keystore.lock"]
+
+def test_falha_na_gravacao_mantem_o_keystore_anterior(tmp_path, key_file, monkeypatch):
+    keystore: str = str(tmp_path / "keystore")
+    update_keystore(key_file, keystore, {"openai": "sk-1"})
+
+    def failing_encrypt(crypto_key, keys):
+        raise RuntimeError("falhou")
+
+    monkeypatch.setattr(criptografa_api_key, "encrypt_keystore_using_key", failing_encrypt)
+    with pytest.raises(RuntimeError):
+        update_keystore(key_file, keystore, {"openai": "sk-2"})
+    assert recupera_api_key.decrypt_keystore(key_file, keystore) == {"openai": "sk-1"}
+    assert sorted(os.listdir(tmp_path)) == ["key", "keystore", "keystore.lock"]
+
+def test_update_espera_o_lock(tmp_path, key_file):
+    keystore: str = str(tmp_path / "keystore")
+    done = threading.Event()
+    with _keystore_lock(keystore):
+        thread = threading.Thread(target=lambda: (update_keystore(key_file, keystore, {"openai": "sk-1"}), done.set()))
+        thread.start()
+        assert not done.wait(0.2)
+    thread.join(timeout=10)
+    assert done.is_set()
+
+def _update_in_process(key_file: str, keystore: str, prefix: str):
+    for i in range(5):
+        update_keystore(key_file, keystore, {f"{prefix}-{i}": str(i)})
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="precisa de fork")
+def test_updates_simultaneos_de_varios_processos_nao_perdem_entradas(tmp_path, key_file):
+    keystore: str = str(tmp_path / "keystore")
+    context = multiprocessing.get_context("fork")
+    processes: list = [context.Process(target=_update_in_process, args=(key_file, keystore, f"p{n}")) for n in range(6)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    assert len(recupera_api_key.decrypt_keystore(key_file, keystore)) == 30
@@ -0,0 +1,72 @@
+import pytest
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+from utilitarios_llm.historico_chat import ChatHistoryManager
+
+def message(i: int, words: int = 10):
+    content: str = " ".join(f"m{i}w{j}" for j in range(words))
+    return HumanMessage(content=content) if i % 2 == 0 else AIMessage(content=content)
+
+def fill(history: ChatHistoryManager, count: int, words: int = 10) -> list:
+    messages: list = [message(i, words) for i in range(count)]
+    for item in messages:
+        history.append(item)
+    return messages
+
+def test_estrategia_invalida_ou_sem_summarizer():
+    with pytest.raises(ValueError):
+        ChatHistoryManager(strategy="outra")
+    with pytest.raises(ValueError):
+        ChatHistoryManager(strategy="summarize")
+
+def test_window_descarta_as_mensagens_mais_antigas():
+    system = SystemMessage(content="You are a helpful bot")
+    history = ChatHistoryManager(max_tokens=150, messages=[system])
+    messages: list = fill(history, 30)
+    assert len(history) == 31
+    assert history.context_tokens <= 150
+    context: list = history.context()
+    #O contexto inicial é mantido, e a janela são as mensagens mais recentes, em ordem
+    assert context[0] is system
+    assert context[1:] == messages[len(messages) - len(context) + 1:]
+    assert history.summary is None
+
+def test_total_de_tokens_e_mantido_incrementalmente():
+    history = ChatHistoryManager(max_tokens=200)
+    fill(history, 25)
+    recount = ChatHistoryManager(max_tokens=10 ** 6, messages=history.context())
+    assert history.context_tokens == recount.context_tokens
+
+def test_a_ultima_mensagem_fica_mesmo_acima_do_orcamento():
+    history = ChatHistoryManager(max_tokens=50)
+    fill(history, 3)
+    big = HumanMessage(content=" ".join(f"big{j}" for j in range(200)))
+    history.append(big)
+    assert history.context() == [big]
+
+def test_summarize_resume_as_mensagens_que_saem_da_janela(counting_chat):
+    counting_chat.reply = "the human and the bot talked"
+    history = ChatHistoryManager(max_tokens=200, strategy="summarize", summarizer=counting_chat)
+    messages: list = fill(history, 30)
+    assert len(counting_chat.calls) >= 2
+    assert history.context_tokens <= 200
+    context: list = history.context()
+    assert context[0] is history.summary
+    assert history.summary.content.endswith("the human and the bot talked")
+    #Cada resumo inclui o anterior
+    assert counting_chat.calls[-1][-1].content.startswith("Previous summary: Summary of the earlier conversation")
+    assert context[1:] == messages[len(messages) - len(context) + 1:]
+
+#Regressão: quando o resumo novo não cabia no orçamento, as mensagens removidas na segunda redução da janela
+#não entravam no resumo
+def test_nenhuma_mensagem_sai_da_janela_sem_ser_resumida(counting_chat):
+    #Resumo de ~60 tokens num orçamento de 200
+    counting_chat.reply = " ".join(f"s{j}" for j in range(60))
+    history = ChatHistoryManager(max_tokens=200, strategy="summarize", summarizer=counting_chat)
+    messages: list = fill(history, 40)
+    assert history.context_tokens <= 200
+
+    summarized: str = "\n".join(call[-1].content for call in counting_chat.calls)
+    outside: list = messages[:history.start]
+    assert outside
+    assert all(item.content in summarized for item in outside)
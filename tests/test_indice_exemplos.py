@@ -0,0 +1,103 @@
+import os
+import json
+
+import faiss
+import pytest
+
+from utilitarios_llm.indice_exemplos import PersistentExampleIndex
+
+WORDS: list = ["pirate", "pilot", "driver", "tree", "bird", "cook", "doctor", "farmer", "sailor", "miner",
+               "teacher", "baker", "judge", "nurse", "painter", "singer", "tailor", "waiter", "writer", "hunter"]
+
+def make_examples(words: list) -> list:
+    return [{"input": word, "output": f"{word} place"} for word in words]
+
+#Parâmetros pequenos para que 20 exemplos bastem para o treino dos ivf/ivfpq
+SMALL_PARAMS: dict = {"nlist": 4, "nprobe": 4, "pq_m": 4, "pq_bits": 2, "hnsw_m": 8}
+
+def build(directory: str, embeddings, kind: str, examples: list) -> PersistentExampleIndex:
+    index = PersistentExampleIndex(directory, embeddings, input_keys=["input"], index_kind=kind, index_params=SMALL_PARAMS)
+    if kind in ("ivf", "ivfpq"):
+        index.train(examples)
+    index.sync(examples)
+    index.save()
+    return index
+
+#Reabrir com mmap (o padrão) e alterar o índice abortava o processo (ivf) ou lançava RuntimeError (ivfpq)
+@pytest.mark.parametrize("kind", ["flat", "ivf", "ivfpq", "hnsw"])
+def test_indice_reaberto_com_mmap_aceita_alteracoes(tmp_path, word_embeddings, kind):
+    examples = make_examples(WORDS)
+    build(str(tmp_path), word_embeddings, kind, examples[:15])
+
+    index = PersistentExampleIndex(str(tmp_path), word_embeddings, input_keys=["input"])
+    assert index.index_kind == kind
+    index.sync(examples[5:])
+    index.remove_examples(examples[5:7])
+    index.save()
+
+    reopened = PersistentExampleIndex(str(tmp_path), word_embeddings, input_keys=["input"])
+    assert len(reopened) == 13
+    #No hnsw os 7 removidos continuam no faiss como tombstones
+    assert reopened.index.ntotal == (20 if kind == "hnsw" else 13)
+    #O ivfpq compara vetores comprimidos, então o exemplo exato não é garantido
+    found = [example["input"] for example, _ in reopened.search("nurse", k=13)]
+    assert "nurse" in found and "driver" not in found
+
+#Gravar um ivf aberto com mmap gerava um arquivo que apontava para as listas do arquivo antigo
+@pytest.mark.parametrize("kind", ["ivf", "ivfpq"])
+def test_save_de_indice_mapeado_gera_arquivo_valido(tmp_path, word_embeddings, kind):
+    build(str(tmp_path), word_embeddings, kind, make_examples(WORDS))
+
+    index = PersistentExampleIndex(str(tmp_path), word_embeddings, input_keys=["input"])
+    assert index.mmapped
+    index.modified = True
+    index.save()
+    assert not index.mmapped
+
+    reopened = PersistentExampleIndex(str(tmp_path), word_embeddings, input_keys=["input"], mmap=False)
+    assert reopened.index.ntotal == len(WORDS)
+    assert "pilot" in [example["input"] for example, _ in reopened.search("pilot", k=len(WORDS))]
+
+def test_save_sem_alteracoes_nao_regrava_o_indice(tmp_path, word_embeddings):
+    build(str(tmp_path), word_embeddings, "flat", make_examples(WORDS))
+    index_path = os.path.join(str(tmp_path), "index.faiss")
+    mtime = os.stat(index_path).st_mtime_ns
+
+    index = PersistentExampleIndex(str(tmp_path), word_embeddings, input_keys=["input"])
+    index.sync(make_examples(WORDS))
+    index.save()
+    assert os.stat(index_path).st_mtime_ns == mtime
+
+#No hnsw o exemplo removido fica como tombstone; adicioná-lo de novo não pode duplicar o id no IndexIDMap2
+def test_hnsw_exemplo_removido_e_adicionado_nao_duplica_o_id(tmp_path, word_embeddings):
+    examples = make_examples(WORDS)
+    index = build(str(tmp_path), word_embeddings, "hnsw", examples)
+    index.remove_examples(examples[:3])
+    assert index.tombstones == 3
+
+    index.add_examples(examples[:3])
+    assert index.tombstones == 0
+    assert index.index.ntotal == len(WORDS)
+    ids = faiss.vector_to_array(index.index.id_map)
+    assert len(set(ids)) == len(ids)
+    assert [example["input"] for example, _ in index.search("pirate", k=2)].count("pirate") == 1
+
+#Diretórios gravados antes do meta.json: o tipo vem do índice no disco, e não do index_kind informado
+@pytest.mark.parametrize("kind", ["flat", "ivf", "hnsw"])
+def test_diretorio_sem_meta_usa_o_tipo_do_indice(tmp_path, word_embeddings, kind):
+    build(str(tmp_path), word_embeddings, kind, make_examples(WORDS))
+    os.remove(os.path.join(str(tmp_path), "meta.json"))
+
+    other = "ivfpq" if kind != "ivfpq" else "flat"
+    index = PersistentExampleIndex(str(tmp_path), word_embeddings, input_keys=["input"], index_kind=other)
+    assert index.index_kind == kind
+    index.sync(make_examples(WORDS[:-1]))
+    index.save()
+    with open(os.path.join(str(tmp_path), "meta.json")) as f:
+        assert json.load(f)["index_kind"] == kind
+
+def test_ivf_com_poucos_exemplos_pede_amostra_maior(tmp_path, word_embeddings):
+    index = PersistentExampleIndex(str(tmp_path), word_embeddings, index_kind="ivf")
+    assert index.min_training_size() == 100
+    with pytest.raises(ValueError):
+        index.train(make_examples(WORDS[:5]))
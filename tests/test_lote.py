@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+from utilitarios_llm import conversas
+from utilitarios_llm.conversas import ConversationStore
+from utilitarios_llm.lote import BatchRunner
+
+@pytest.fixture
+def conversation_store(tmp_path, monkeypatch):
+    store = ConversationStore(str(tmp_path / "conversas"), shards=2)
+    monkeypatch.setattr(conversas, "_store", store)
+    yield store
+    store.close()
+
+def run_batch(operations: dict, records: list, workers: int = 8) -> list:
+    output = io.StringIO()
+    lines = [json.dumps(record) for record in records]
+    BatchRunner(operations, workers=workers, report_interval=0, report_stream=io.StringIO()).run(lines, output)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+#Regressão: as operações alteravam llm.temperature (e batch_size) no llm compartilhado pelas threads do lote, e as
+#chamadas da conversa (temperature 0) chegavam a rodar com 0.9
+def test_operacoes_misturadas_em_paralelo_usam_os_proprios_parametros(quickstart, counting_llm, response_cache,
+                                                                     conversation_store, capsys):
+    counting_llm.temperature = 0.5
+    counting_llm.batch_size = 20
+    records: list = []
+    for i in range(40):
+        records.append({"id": f"q{i}", "op": "answer_simple_question", "question": f"question {i}"})
+        records.append({"id": f"c{i}", "op": "conversation", "session_id": f"s{i}", "message": f"message {i}"})
+    for i in range(10):
+        records.append({"id": f"b{i}", "op": "places_to_eat_using_chain_batch", "foods": [f"food {i}", "rice"], "batch_size": 1})
+
+    results = run_batch(quickstart.batch_operations(counting_llm), records)
+    assert all(result["ok"] for result in results), [result for result in results if not result["ok"]]
+    assert len(results) == len(records)
+
+    assert len(counting_llm.calls) == 40 + 40 + 20
+    for prompt, temperature in counting_llm.calls:
+        expected: float = 0 if "Human: message" in prompt else 0.9
+        assert temperature == expected, (prompt, temperature)
+    #O llm compartilhado não é alterado
+    assert counting_llm.temperature == 0.5
+    assert counting_llm.batch_size == 20
+
+def test_conversa_do_lote_continua_a_sessao(quickstart, counting_llm, response_cache, conversation_store, capsys):
+    operations = quickstart.batch_operations(counting_llm)
+    run_batch(operations, [{"op": "conversation", "session_id": "sessao", "message": "primeira"}])
+    run_batch(operations, [{"op": "conversation", "session_id": "sessao", "message": "segunda"}])
+    assert conversation_store.count("sessao") == 4
+    assert "primeira" in counting_llm.calls[-1][0]
+
+def test_checkpoint_pula_os_registros_concluidos(tmp_path, capsys):
+    calls: list = []
+    operations = {"echo": lambda value: calls.append(value) or value}
+    checkpoint = str(tmp_path / "checkpoint.txt")
+    records = [{"id": str(i), "op": "echo", "value": i} for i in range(5)]
+
+    output = io.StringIO()
+    BatchRunner(operations, workers=2, checkpoint_path=checkpoint, report_stream=io.StringIO()).run(
+        [json.dumps(record) for record in records[:3]], output)
+    BatchRunner(operations, workers=2, checkpoint_path=checkpoint, report_stream=io.StringIO()).run(
+        [json.dumps(record) for record in records], output)
+    assert sorted(calls) == [0, 1, 2, 3, 4]
@@ -0,0 +1,96 @@
+import json
+import uuid
+import urllib.error
+import urllib.request
+
+import pytest
+from langchain.schema import Generation, LLMResult
+
+from utilitarios_llm import metricas
+from utilitarios_llm.metricas import MetricsCallbackHandler, MetricsRegistry, estimate_cost, export_json, export_prometheus
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Chamadas")
+    calls.inc(model="gpt-4", status="ok")
+    calls.inc(2, model="gpt-4", status="ok")
+    calls.inc(model='say "hi"\n', status="error")
+    duration = registry.histogram("duration_seconds", "Duração", buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.7, 3.0):
+        duration.observe(seconds, model="gpt-4")
+    return registry
+
+def test_formato_texto_do_prometheus(registry):
+    assert export_prometheus(registry).splitlines() == [
+        "# HELP calls_total Chamadas",
+        "# TYPE calls_total counter",
+        'calls_total{model="gpt-4",status="ok"} 3.0',
+        'calls_total{model="say \\"hi\\"\\n",status="error"} 1.0',
+        "# HELP duration_seconds Duração",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{le="0.1",model="gpt-4"} 1',
+        'duration_seconds_bucket{le="1.0",model="gpt-4"} 3',
+        'duration_seconds_bucket{le="+Inf",model="gpt-4"} 4',
+        'duration_seconds_sum{model="gpt-4"} 4.25',
+        'duration_seconds_count{model="gpt-4"} 4',
+    ]
+    assert export_prometheus(registry).endswith("\n")
+
+def test_formato_json(registry):
+    assert json.loads(export_json(registry)) == {
+        "calls_total": [
+            {"labels": {"model": "gpt-4", "status": "ok"}, "value": 3.0},
+            {"labels": {"model": 'say "hi"\n', "status": "error"}, "value": 1.0},
+        ],
+        "duration_seconds": [{"labels": {"model": "gpt-4"}, "count": 4, "sum": 4.25, "mean": 1.0625}],
+    }
+
+def test_reset_mantem_as_metricas_registradas(registry):
+    registry.reset()
+    assert export_prometheus(registry).splitlines() == [
+        "# HELP calls_total Chamadas", "# TYPE calls_total counter",
+        "# HELP duration_seconds Duração", "# TYPE duration_seconds histogram",
+    ]
+    assert registry.counter("calls_total") is registry.metrics["calls_total"]
+
+def test_custo_estimado():
+    assert estimate_cost("gpt-4", 1000, 500) == pytest.approx(0.06)
+    #Versão datada usa o preço do modelo base, e o prefixo mais longo ganha (gpt-3.5-turbo-16k, não gpt-3.5-turbo)
+    assert estimate_cost("gpt-3.5-turbo-0613", 1000) == pytest.approx(0.0015)
+    assert estimate_cost("gpt-3.5-turbo-16k-0613", 1000) == pytest.approx(0.003)
+    assert estimate_cost("modelo-desconhecido", 1000) == 0.0
+
+#O mesmo evento recebido duas vezes (handler no model e no agent) é contado uma vez
+def test_handler_conta_cada_chamada_uma_vez():
+    handler = MetricsCallbackHandler()
+    calls: float = metricas.LLM_CALLS.get(model="gpt-4", kind="chat", status="ok")
+    cost: float = metricas.LLM_COST.get(model="gpt-4")
+    run_id = uuid.uuid4()
+    response = LLMResult(
+        generations=[[Generation(text="hi")]],
+        llm_output={"model_name": "gpt-4", "token_usage": {"prompt_tokens": 1000, "completion_tokens": 500}},
+    )
+    for _ in range(2):
+        handler.on_llm_start({"name": "ChatOpenAI"}, ["hello"], run_id=run_id)
+    for _ in range(2):
+        handler.on_llm_end(response, run_id=run_id)
+    assert metricas.LLM_CALLS.get(model="gpt-4", kind="chat", status="ok") - calls == 1
+    assert metricas.LLM_COST.get(model="gpt-4") - cost == pytest.approx(0.06)
+    assert [(call["type"], call["prompt_tokens"], call["completion_tokens"]) for call in handler.recent] == [("chat", 1000, 500)]
+
+def test_servidor_de_metricas():
+    metricas.record_retry("429")
+    server = metricas.start_metrics_server(port=0)
+    try:
+        base: str = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{base}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "# TYPE llm_retries_total counter" in response.read().decode()
+        with urllib.request.urlopen(f"{base}/metrics.json") as response:
+            assert json.load(response)["llm_retries_total"]
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{base}/outro")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+from typing import Any
+
+import pytest
+
+from conftest import CallLog, CountingLLM
+
+class ConcurrencyTracker:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active: int = 0
+        self.peak: int = 0
+
+#LLM assíncrono lento: registra no tracker quantas chamadas estão em andamento ao mesmo tempo
+class SlowAsyncLLM(CountingLLM):
+    delay: float = 0.05
+    fail_on: str = None
+    tracker: Any = None
+
+    async def _acall(self, prompt: str, stop=None, run_manager=None) -> str:
+        with self.tracker.lock:
+            self.tracker.active += 1
+            self.tracker.peak = max(self.tracker.peak, self.tracker.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail_on is not None and self.fail_on in prompt:
+                raise RuntimeError(f"falhou: {self.fail_on}")
+            return self._call(prompt)
+        finally:
+            with self.tracker.lock:
+                self.tracker.active -= 1
+
+@pytest.mark.parametrize("max_concurrency", [0, -1])
+def test_max_concurrency_menor_que_1_e_rejeitado(quickstart, counting_llm, max_concurrency):
+    with pytest.raises(ValueError):
+        asyncio.run(quickstart.aget_places_to_eat_using_chain(counting_llm, ["sushi"], max_concurrency))
+
+def test_chamadas_assincronas_respeitam_max_concurrency(quickstart, response_cache, capsys):
+    tracker = ConcurrencyTracker()
+    llm = SlowAsyncLLM(calls=[], tracker=tracker)
+    foods: list = [f"food{i}" for i in range(10)]
+    results: list = asyncio.run(quickstart.aget_places_to_eat_using_chain(llm, foods, max_concurrency=3))
+    assert tracker.peak == 3
+    assert [result.item for result in results] == foods
+    assert all(result.ok and result.output.endswith(f"likes to eat {result.item}") for result in results)
+
+def test_falha_de_um_item_nao_interrompe_os_demais(quickstart, response_cache, capsys):
+    llm = SlowAsyncLLM(calls=[], tracker=ConcurrencyTracker(), fail_on="food1")
+    results: list = asyncio.run(quickstart.aget_places_to_eat_using_chain(llm, ["food0", "food1", "food2"], max_concurrency=2))
+    assert [result.ok for result in results] == [True, False, True]
+    assert isinstance(results[1].error, RuntimeError)
+    assert "ERRO" in str(results[1])
+
+#Registra o número de prompts e o batch_size de cada chamada ao generate
+class BatchRecordingLLM(CountingLLM):
+    batches: Any = None
+
+    def _generate(self, prompts: list, stop=None, run_manager=None):
+        self.batches.append((len(prompts), self.batch_size, self.temperature))
+        return super()._generate(prompts, stop=stop, run_manager=run_manager)
+
+@pytest.mark.parametrize("batch_size", [0, -5])
+def test_batch_size_menor_que_1_e_rejeitado(quickstart, counting_llm, batch_size):
+    with pytest.raises(ValueError):
+        quickstart.get_places_to_eat_using_chain_batch(counting_llm, ["sushi"], batch_size)
+
+def test_inputs_sao_enviados_em_lotes_numa_copia_do_llm(quickstart, response_cache, capsys):
+    llm = BatchRecordingLLM(calls=[], batches=CallLog(), temperature=0.2, batch_size=20)
+    foods: list = [f"food{i}" for i in range(5)]
+    results: list = quickstart.get_places_to_eat_using_chain_batch(llm, foods, batch_size=2)
+    assert [result.rsplit(" ", 1)[-1] for result in results] == foods
+    #Uma chamada ao generate por lote, com o batch_size e a temperature da cópia
+    assert list(llm.batches) == [(2, 2, 0.9), (2, 2, 0.9), (1, 2, 0.9)]
+    assert (llm.batch_size, llm.temperature) == (20, 0.2)
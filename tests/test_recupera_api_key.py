@@ -0,0 +1,145 @@
+import os
+import time
+
+import pytest
+
+from gerenciador_api_keys import recupera_api_key
+from gerenciador_api_keys.criptografa_api_key import encrypt_api_key_using_key
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    recupera_api_key.invalidate_api_key_cache()
+    recupera_api_key.clear_derived_key_cache()
+    yield
+    recupera_api_key.invalidate_api_key_cache()
+    recupera_api_key.clear_derived_key_cache()
+
+@pytest.fixture
+def key_file(tmp_path) -> str:
+    path: str = str(tmp_path / "key")
+    with open(path, "wb") as f:
+        f.write(os.urandom(32))
+    return path
+
+def write_api_key(key_file: str, path: str, api_key: str, mtime_ns: int = None):
+    with open(key_file, "rb") as f:
+        crypto_key: bytes = f.read()
+    with open(path, "wb") as f:
+        f.write(encrypt_api_key_using_key(crypto_key, api_key.encode()))
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+@pytest.fixture
+def decrypt_calls(monkeypatch) -> list:
+    calls: list = []
+    decrypt = recupera_api_key.decrypt_api_key
+
+    def counting_decrypt(*paths):
+        calls.append(paths)
+        return decrypt(*paths)
+
+    monkeypatch.setattr(recupera_api_key, "decrypt_api_key", counting_decrypt)
+    return calls
+
+def test_api_key_e_descriptografada_uma_vez_dentro_do_ttl(tmp_path, key_file, decrypt_calls):
+    path: str = str(tmp_path / "openai_api_key")
+    write_api_key(key_file, path, "sk-1")
+    assert [recupera_api_key.get_cached_api_key(key_file, path, ttl=60) for _ in range(3)] == ["sk-1"] * 3
+    assert len(decrypt_calls) == 1
+
+def test_api_key_e_recarregada_depois_do_ttl(tmp_path, key_file, decrypt_calls):
+    path: str = str(tmp_path / "openai_api_key")
+    write_api_key(key_file, path, "sk-1")
+    recupera_api_key.get_cached_api_key(key_file, path, ttl=0.05)
+    time.sleep(0.1)
+    assert recupera_api_key.get_cached_api_key(key_file, path, ttl=0.05) == "sk-1"
+    assert len(decrypt_calls) == 2
+
+def test_arquivo_alterado_e_recarregado_antes_do_ttl(tmp_path, key_file, decrypt_calls):
+    path: str = str(tmp_path / "openai_api_key")
+    write_api_key(key_file, path, "sk-1", mtime_ns=1_000_000_000)
+    assert recupera_api_key.get_cached_api_key(key_file, path, ttl=60) == "sk-1"
+    #Rotação da api key: o mtime muda e a entrada é recarregada
+    write_api_key(key_file, path, "sk-2", mtime_ns=2_000_000_000)
+    assert recupera_api_key.get_cached_api_key(key_file, path, ttl=60) == "sk-2"
+    assert len(decrypt_calls) == 2
+
+def test_ttl_zero_desliga_o_cache(tmp_path, key_file, decrypt_calls):
+    path: str = str(tmp_path / "openai_api_key")
+    write_api_key(key_file, path, "sk-1")
+    recupera_api_key.get_cached_api_key(key_file, path, ttl=0)
+    recupera_api_key.get_cached_api_key(key_file, path, ttl=0)
+    assert len(decrypt_calls) == 2
+
+def test_invalidate_remove_somente_as_entradas_do_arquivo(tmp_path, key_file, decrypt_calls):
+    openai: str = str(tmp_path / "openai_api_key")
+    serp: str = str(tmp_path / "serp_api_key")
+    write_api_key(key_file, openai, "sk-1")
+    write_api_key(key_file, serp, "serp-1")
+    recupera_api_key.get_cached_api_key(key_file, openai, ttl=60)
+    recupera_api_key.get_cached_api_key(key_file, serp, ttl=60)
+    recupera_api_key.invalidate_api_key_cache(path_to_encrypted_api_key=openai)
+    recupera_api_key.get_cached_api_key(key_file, openai, ttl=60)
+    recupera_api_key.get_cached_api_key(key_file, serp, ttl=60)
+    assert [os.path.basename(paths[1]) for paths in decrypt_calls] == ["openai_api_key", "serp_api_key", "openai_api_key"]
+
+def test_get_api_key_usa_o_cache(tmp_path, key_file, decrypt_calls, monkeypatch):
+    path: str = str(tmp_path / "serp_api_key")
+    write_api_key(key_file, path, "serp-1")
+    monkeypatch.setenv("CRYPTO_KEY_FILE", key_file)
+    monkeypatch.setenv("API_KEYSTORE_FILE", str(tmp_path / "keystore"))
+    monkeypatch.setenv("ENCRYPTED_API_KEY_FILE", path)
+    assert recupera_api_key.get_api_key("serp", ttl=60) == "serp-1"
+    assert recupera_api_key.get_api_key("serp", ttl=60) == "serp-1"
+    assert len(decrypt_calls) == 1
+
+@pytest.fixture
+def derivations(monkeypatch) -> list:
+    calls: list = []
+    generate_key = recupera_api_key.generate_key
+
+    def counting_generate_key(passphrase, salt, iterations=None):
+        calls.append((salt, iterations))
+        return generate_key(passphrase, salt, iterations)
+
+    monkeypatch.setattr(recupera_api_key, "generate_key", counting_generate_key)
+    return calls
+
+def test_derivacao_do_pbkdf2_e_memoizada(derivations):
+    key: bytes = recupera_api_key.generate_key_cached(b"senha", b"salt-1", 1000)
+    assert recupera_api_key.generate_key_cached(b"senha", b"salt-1", 1000) == key
+    assert key == recupera_api_key.generate_key(b"senha", b"salt-1", 1000)
+    assert len(derivations) == 2
+    #Outra passphrase, outro salt ou outro número de iterações derivam de novo
+    recupera_api_key.generate_key_cached(b"outra", b"salt-1", 1000)
+    recupera_api_key.generate_key_cached(b"senha", b"salt-2", 1000)
+    recupera_api_key.generate_key_cached(b"senha", b"salt-1", 2000)
+    assert len(derivations) == 5
+
+def test_cache_de_derivacao_nao_guarda_a_passphrase(derivations):
+    recupera_api_key.generate_key_cached(b"senha secreta", b"salt", 1000)
+    assert all(b"senha secreta" not in cache_key for cache_key in recupera_api_key._derived_key_cache)
+
+def test_cache_de_derivacao_e_lru(derivations, monkeypatch):
+    monkeypatch.setattr(recupera_api_key, "DERIVED_KEY_CACHE_SIZE", 2)
+    for salt in (b"a", b"b", b"a", b"c"):
+        recupera_api_key.generate_key_cached(b"senha", salt, 1000)
+    assert len(derivations) == 3
+    #"b" foi o menos usado recentemente e saiu do cache
+    recupera_api_key.generate_key_cached(b"senha", b"a", 1000)
+    recupera_api_key.generate_key_cached(b"senha", b"b", 1000)
+    assert [salt for salt, _ in derivations] == [b"a", b"b", b"c", b"b"]
+
+def test_varias_api_keys_com_uma_derivacao(derivations):
+    key: bytes = recupera_api_key.generate_key(b"senha", b"salt", 1000)
+    encrypted: list = [encrypt_api_key_using_key(key, value) for value in (b"sk-1", b"serp-1")]
+    derivations.clear()
+    assert recupera_api_key.decrypt_api_keys_using_passphrase(b"senha", b"salt", encrypted, 1000) == [b"sk-1", b"serp-1"]
+    assert recupera_api_key.decrypt_api_key_using_passphrase(b"senha", b"salt", encrypted[0], 1000) == b"sk-1"
+    assert len(derivations) == 1
+
+def test_geracao_e_recuperacao_usam_as_mesmas_iteracoes(derivations):
+    from gerenciador_api_keys.gera_nova_chave_cripto import generate_key
+
+    key, salt = generate_key(b"senha")
+    assert recupera_api_key.generate_key_cached(b"senha", salt) == key
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from utilitarios_llm.servidor import InvalidRequest, Overloaded, WorkerCrashed, WorkerPool, worker_directory
+from utilitarios_llm.servidor_http import ApiServer
+
+#Operações dos workers (criados com fork, então a factory não precisa ser importável pelo worker)
+def echo(value, times: int = 1):
+    print(f"echo {value}")
+    return [value] * times
+
+def fail():
+    raise RuntimeError("falhou")
+
+#TypeError levantado dentro da operação: erro da operação (500), não da requisição
+def wrong_type(value):
+    return value + 1
+
+def sleep(seconds: float):
+    time.sleep(seconds)
+    return os.getpid()
+
+def crash():
+    os._exit(3)
+
+def directory(base: str) -> str:
+    return worker_directory(base)
+
+def operations_factory() -> dict:
+    return {"echo": echo, "fail": fail, "wrong_type": wrong_type, "sleep": sleep, "crash": crash, "directory": directory}
+
+@pytest.fixture(scope="module")
+def server():
+    server = ApiServer(operations_factory, port=0, workers=2, queue_size=2, drain_timeout=5)
+    thread = threading.Thread(target=server.serve, kwargs={"ready_timeout": 30}, daemon=True)
+    thread.start()
+    server.pool.wait_ready(30)
+    yield server
+    server.stop()
+    thread.join(timeout=15)
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(operations_factory, workers=1, queue_size=0)
+    pool.wait_ready(30)
+    yield pool
+    pool.shutdown(timeout=5)
+
+def post(server: ApiServer, op: str, params) -> tuple:
+    body: bytes = (params if isinstance(params, bytes) else json.dumps(params).encode())
+    request = urllib.request.Request(f"{server.base_url}/{op}", data=body, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_operacao_executada(server):
+    status, body = post(server, "echo", {"value": "a", "times": 2})
+    assert status == 200
+    assert body["ok"] and body["result"] == ["a", "a"]
+    assert body["output"] == "echo a\n"
+
+@pytest.mark.parametrize("params", [{}, {"value": 1, "unknown": 2}, {"times": 2}])
+def test_parametros_faltando_ou_desconhecidos_sao_400(server, params):
+    status, body = post(server, "echo", params)
+    assert status == 400
+    assert not body["ok"] and "Parâmetros inválidos para echo" in body["error"]
+
+def test_json_invalido_e_400(server):
+    assert post(server, "echo", b"[1, 2]")[0] == 400
+    assert post(server, "echo", b"{")[0] == 400
+
+def test_erro_da_operacao_e_500(server):
+    status, body = post(server, "fail", {})
+    assert status == 500 and body["error"] == "RuntimeError: falhou"
+    status, body = post(server, "wrong_type", {"value": "a"})
+    assert status == 500 and body["error"].startswith("TypeError")
+
+def test_operacao_desconhecida_e_404(server):
+    assert post(server, "unknown", {})[0] == 404
+
+def test_worker_que_morre_e_502_e_e_substituido(server):
+    status, body = post(server, "crash", {})
+    assert status == 502 and "código 3" in body["error"]
+    assert post(server, "echo", {"value": 1})[0] == 200
+    deadline: float = time.monotonic() + 10
+    while server.pool.stats()["alive"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert server.pool.stats()["alive"] == 2
+
+#Cada worker tem o próprio diretório, e o worker que substitui outro herda o diretório dele
+def test_diretorio_por_worker(pool):
+    assert worker_directory("cache") == "cache"
+    assert pool.submit("directory", {"base": "cache"}).result(timeout=30)["result"] == os.path.join("cache", "worker-0")
+    with pytest.raises(WorkerCrashed):
+        pool.submit("crash", {}).result(timeout=30)
+    assert pool.submit("directory", {"base": "cache"}).result(timeout=30)["result"] == os.path.join("cache", "worker-0")
+
+def test_cada_worker_tem_uma_posicao_no_pool():
+    pool = WorkerPool(operations_factory, workers=3, queue_size=3)
+    try:
+        pool.wait_ready(30)
+        #As requisições lentas ocupam os três workers ao mesmo tempo
+        futures: list = [pool.submit("sleep", {"seconds": 0.3}) for _ in range(3)]
+        assert len({future.result(timeout=30)["result"] for future in futures}) == 3
+        assert sorted(worker.slot for worker in pool.workers) == [0, 1, 2]
+    finally:
+        pool.shutdown(timeout=5)
+
+def test_submit_confere_os_parametros_no_worker(pool):
+    with pytest.raises(InvalidRequest):
+        pool.submit("echo", {"other": 1}).result(timeout=30)
+    with pytest.raises(InvalidRequest):
+        pool.submit("unknown", {}).result(timeout=30)
+    #O worker continua atendendo depois das requisições inválidas
+    assert pool.submit("echo", {"value": 2}).result(timeout=30)["result"] == [2]
+    assert pool.stats()["errors"] == 2
+
+def test_fila_cheia_e_503(pool):
+    future = pool.submit("sleep", {"seconds": 0.5})
+    with pytest.raises(Overloaded) as error:
+        pool.submit("echo", {"value": 1})
+    assert error.value.retry_after >= 1
+    assert future.result(timeout=30)["ok"]
+    assert pool.stats()["rejected"] == 1
+
+def test_encerramento_espera_as_requisicoes_em_andamento(pool):
+    future = pool.submit("sleep", {"seconds": 0.5})
+    pool.shutdown(timeout=10)
+    assert future.result(timeout=0)["ok"]
+    with pytest.raises(Overloaded):
+        pool.submit("echo", {"value": 1})
+
+def test_encerramento_com_tempo_esgotado_falha_as_pendentes(pool):
+    future = pool.submit("sleep", {"seconds": 30})
+    start: float = time.monotonic()
+    pool.shutdown(timeout=0.2)
+    assert time.monotonic() - start < 10
+    with pytest.raises(WorkerCrashed):
+        future.result(timeout=0)
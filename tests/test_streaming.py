@@ -0,0 +1,96 @@
+import time
+
+import pytest
+from langchain.chains import ConversationChain
+
+from conftest import CountingLLM
+from utilitarios_llm.streaming import StreamingTimingHandler, iter_stream, streaming_model
+
+#LLM falso com streaming: com streaming=True emite a resposta palavra a palavra, esperando first_token_delay antes
+#da primeira
+class StreamingLLM(CountingLLM):
+    streaming: bool = False
+    first_token_delay: float = 0.05
+
+    def _call(self, prompt: str, stop=None, run_manager=None) -> str:
+        answer: str = super()._call(prompt)
+        if self.streaming and run_manager is not None:
+            time.sleep(self.first_token_delay)
+            for word in answer.split(" "):
+                run_manager.on_llm_new_token(word + " ")
+        return answer
+
+class FailingLLM(StreamingLLM):
+
+    def _call(self, prompt: str, stop=None, run_manager=None) -> str:
+        run_manager.on_llm_new_token("partial ")
+        raise RuntimeError("falhou")
+
+@pytest.fixture
+def streaming_llm():
+    return StreamingLLM(calls=[])
+
+def test_handler_mede_o_tempo_ate_o_primeiro_token(streaming_llm):
+    tokens: list = []
+    handler = StreamingTimingHandler(on_token=tokens.append)
+    answer: str = streaming_model(streaming_llm)("one two three", callbacks=[handler])
+    assert "".join(tokens).strip() == answer == "answer: one two three"
+    assert len(handler.calls) == 1
+    call: dict = handler.calls[0]
+    assert call["tokens"] == 4
+    assert 0.05 <= call["ttft"] <= call["total"]
+    assert handler.report().startswith("[streaming] chamada 1: primeiro token em 0.")
+
+def test_uma_entrada_por_chamada_inclusive_com_erro():
+    handler = StreamingTimingHandler(on_token=None)
+    llm = FailingLLM(calls=[])
+    with pytest.raises(RuntimeError):
+        streaming_model(llm)("x", callbacks=[handler])
+    assert handler.calls[0]["tokens"] == 1
+
+def test_streaming_model_nao_altera_o_modelo_e_mantem_os_callbacks(streaming_llm):
+    handler = StreamingTimingHandler(on_token=None)
+    streaming_llm.callbacks = [handler]
+    copied = streaming_model(streaming_llm, temperature=0.5)
+    assert copied.streaming and copied.temperature == 0.5
+    assert not streaming_llm.streaming and streaming_llm.temperature == 0.0
+    #Os callbacks (exclude=True no pydantic) continuam na cópia
+    copied("a b")
+    assert handler.calls[0]["tokens"] == 3
+
+def test_sem_streaming_nao_ha_tokens(streaming_llm):
+    handler = StreamingTimingHandler(on_token=None)
+    streaming_llm("a b", callbacks=[handler])
+    assert handler.calls[0]["tokens"] == 0
+    assert handler.calls[0]["ttft"] == handler.calls[0]["total"]
+
+def test_iter_stream_devolve_os_tokens_e_o_resultado(streaming_llm):
+    stream = iter_stream(lambda handler: streaming_model(streaming_llm)("a b", callbacks=[handler]))
+    tokens: list = []
+    with pytest.raises(StopIteration) as stop:
+        while True:
+            tokens.append(next(stream))
+    assert tokens == ["answer: ", "a ", "b "]
+    assert stop.value.value == "answer: a b"
+
+def test_iter_stream_relanca_o_erro_da_chamada():
+    llm = FailingLLM(calls=[])
+    stream = iter_stream(lambda handler: streaming_model(llm)("x", callbacks=[handler]))
+    assert next(stream) == "partial "
+    with pytest.raises(RuntimeError):
+        next(stream)
+
+def test_pergunta_simples_com_streaming(quickstart, streaming_llm, response_cache, capsys):
+    answer: str = quickstart.answer_simple_question(streaming_llm, "a b", use_cache=False, stream=True)
+    output: str = capsys.readouterr().out
+    assert output.startswith("answer: a b \n[streaming] chamada 1: primeiro token em 0.")
+    assert answer == "answer: a b"
+
+#Regressão: os callbacks passados ao construtor do ConversationChain não chegavam ao LLM, e nada era transmitido
+def test_conversa_transmite_os_tokens_da_resposta(quickstart, streaming_llm, capsys):
+    conversation = ConversationChain(llm=streaming_model(streaming_llm))
+    handler = StreamingTimingHandler()
+    reply = quickstart._bot_reply(conversation, "hello", handler)
+    assert len(handler.calls) == 1 and handler.calls[0]["tokens"] > 1
+    assert capsys.readouterr().out.startswith("Bot: answer: ")
+    assert reply.who == "Bot"
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.prompts import PromptTemplate
+
+from utilitarios_llm import templates
+from utilitarios_llm.templates import CachedFewShotPromptTemplate, get_prompt_template
+
+EXAMPLE_PROMPT = PromptTemplate(input_variables=["word", "antonym"], template="Word: {word}\nAntonym: {antonym}")
+
+def few_shot(examples: list) -> CachedFewShotPromptTemplate:
+    return CachedFewShotPromptTemplate(
+        examples=examples, example_prompt=EXAMPLE_PROMPT, prefix="Give the antonym", suffix="Word: {input}\nAntonym:",
+        input_variables=["input"],
+    )
+
+def test_get_prompt_template_reaproveita_o_template():
+    first = get_prompt_template("Tell me about {topic}")
+    assert get_prompt_template("Tell me about {topic}") is first
+    assert first.format(topic="cats") == "Tell me about cats"
+
+def test_few_shot_igual_ao_do_langchain():
+    from langchain.prompts import FewShotPromptTemplate
+
+    examples: list = [{"word": "happy", "antonym": "sad"}, {"word": "tall", "antonym": "short"}]
+    expected = FewShotPromptTemplate(
+        examples=examples, example_prompt=EXAMPLE_PROMPT, prefix="Give the antonym", suffix="Word: {input}\nAntonym:",
+        input_variables=["input"],
+    ).format(input="big")
+    assert few_shot(examples).format(input="big") == expected
+
+#Os blocos são mantidos por ordem de uso: os usados há mais tempo saem primeiro
+def test_blocos_dos_exemplos_em_lru(monkeypatch):
+    monkeypatch.setattr(templates, "EXAMPLE_BLOCK_CACHE_SIZE", 2)
+    prompt = few_shot([])
+    a, b, c = ({"word": word, "antonym": word[::-1]} for word in ("a", "b", "c"))
+    for example in (a, b, a, c):
+        prompt._render_example(example)
+    assert [dict(key)["word"] for key in prompt._blocks] == ["a", "c"]
+
+#O mesmo template usado por várias threads (chain.apply com max_concurrency), com o cache de blocos menor que o
+#número de exemplos distintos, para que haja inserções e remoções concorrentes
+def test_format_concorrente(monkeypatch):
+    monkeypatch.setattr(templates, "EXAMPLE_BLOCK_CACHE_SIZE", 8)
+    examples: list = [{"word": f"w{i}", "antonym": f"a{i}"} for i in range(64)]
+    prompt = few_shot(examples)
+
+    def render(i: int) -> str:
+        return prompt._render_example(examples[i % len(examples)])
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        blocks: list = list(pool.map(render, range(20000)))
+    assert blocks == [EXAMPLE_PROMPT.format(**examples[i % len(examples)]) for i in range(20000)]
+    assert len(prompt._blocks) <= 8
+    assert prompt.format(input="big").count("Antonym:") == 65
@@ -0,0 +1,252 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from utilitarios_llm.metricas import SCHEDULER_WAIT, record_retry
+
+#Agendador central das chamadas aos modelos (LLM, chat e embeddings), para respeitar os rate limits do provedor.
+# - Dois token buckets: requisições por minuto (RPM) e tokens por minuto (TPM, estimados com o tiktoken).
+# - Fila de prioridade: quando há chamadas esperando, as interativas (chat) passam na frente dos jobs em lote (chains).
+# - Erros de rate limit (429) e indisponibilidade (503) são repetidos com backoff exponencial com jitter ("full jitter"),
+#   respeitando o Retry-After quando o servidor o informa (limitado a max_delay). Um 429 também esvazia o bucket de
+#   requisições, para que as demais chamadas desacelerem em vez de receberem 429 também.
+#As chamadas continuam sendo executadas na thread (ou no event loop) de quem chamou; o agendador só decide quando cada
+#uma pode começar. Os models de utilitarios_llm/clientes.py já passam todas as chamadas por aqui.
+#Uma chamada que já emitiu tokens (streaming) não é repetida, para que os tokens não sejam emitidos duas vezes.
+LLM_REQUESTS_PER_MINUTE: float = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "3000"))
+LLM_TOKENS_PER_MINUTE: float = float(os.environ.get("LLM_TOKENS_PER_MINUTE", "250000"))
+LLM_MAX_CONCURRENCY: int = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES: int = int(os.environ.get("LLM_MAX_RETRIES", "6"))
+
+PRIORITY_INTERACTIVE: int = 0
+PRIORITY_BATCH: int = 10
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("llm_request_priority", default=None)
+
+#Define a prioridade das chamadas feitas dentro do bloco with (sobrepõe a prioridade padrão de cada model)
+@contextmanager
+def request_priority(priority: int):
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority(default: int = PRIORITY_BATCH) -> int:
+    priority = _priority.get()
+    return default if priority is None else priority
+
+class TokenBucket:
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate: float = rate_per_minute / 60.0
+        self.capacity: float = capacity or rate_per_minute
+        self.level: float = self.capacity
+        self.updated: float = time.monotonic()
+
+    def _refill(self):
+        now: float = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    #Segundos até que amount esteja disponível (0 se já estiver)
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def drain(self):
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+def is_retryable_error(error: Exception) -> bool:
+    status = getattr(error, "http_status", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    if status in (429, 503):
+        return True
+    return type(error).__name__ in ("RateLimitError", "ServiceUnavailableError")
+
+def _retry_after(error: Exception) -> float:
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+#Repassa os callbacks ao run_manager do langchain e registra se algum token já foi emitido pela chamada
+class _StreamGuard:
+
+    def __init__(self, run_manager):
+        self.run_manager = run_manager
+        self.streamed: bool = False
+
+    def __getattr__(self, name):
+        return getattr(self.run_manager, name)
+
+    #No run_manager assíncrono o retorno é uma corotina, aguardada por quem chamou
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.streamed = True
+        return self.run_manager.on_llm_new_token(token, **kwargs)
+
+def _guard_stream(kwargs: dict) -> _StreamGuard:
+    if kwargs.get("run_manager") is None:
+        return None
+    kwargs["run_manager"] = _StreamGuard(kwargs["run_manager"])
+    return kwargs["run_manager"]
+
+class RequestScheduler:
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None, max_concurrency: int = None,
+                 max_retries: int = None, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.requests_bucket = TokenBucket(requests_per_minute or LLM_REQUESTS_PER_MINUTE)
+        self.tokens_bucket = TokenBucket(tokens_per_minute or LLM_TOKENS_PER_MINUTE)
+        self.max_concurrency: int = max_concurrency or LLM_MAX_CONCURRENCY
+        self.max_retries: int = LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.condition = threading.Condition()
+        self.waiting: list = []
+        self.sequence = itertools.count()
+        self.in_flight: int = 0
+        self.retries: int = 0
+        self.dispatcher: threading.Thread = None
+
+    def _ensure_dispatcher(self):
+        if self.dispatcher is None:
+            self.dispatcher = threading.Thread(target=self._dispatch, name="llm-scheduler", daemon=True)
+            self.dispatcher.start()
+
+    #Libera as chamadas em ordem de prioridade (e de chegada, dentro da mesma prioridade), quando há vaga e os buckets permitem
+    def _dispatch(self):
+        with self.condition:
+            while True:
+                while not self.waiting or self.in_flight >= self.max_concurrency:
+                    self.condition.wait()
+                _, _, tokens, admitted = self.waiting[0]
+                #Chamadas canceladas enquanto esperavam (ex: asyncio.wait_for) saem da fila sem ocupar vaga
+                if admitted.cancelled():
+                    heapq.heappop(self.waiting)
+                    continue
+                wait: float = max(self.requests_bucket.wait_time(1), self.tokens_bucket.wait_time(tokens))
+                if wait > 0:
+                    #Acorda antes se uma chamada de prioridade maior chegar
+                    self.condition.wait(wait)
+                    continue
+                heapq.heappop(self.waiting)
+                #Marca a chamada como admitida; False se ela foi cancelada depois da verificação acima
+                if not admitted.set_running_or_notify_cancel():
+                    continue
+                self.requests_bucket.consume(1)
+                self.tokens_bucket.consume(tokens)
+                self.in_flight += 1
+                admitted.set_result(None)
+
+    def _admit(self, priority: int, tokens: int) -> Future:
+        admitted = Future()
+        with self.condition:
+            self._ensure_dispatcher()
+            heapq.heappush(self.waiting, (priority, next(self.sequence), tokens, admitted))
+            self.condition.notify_all()
+        return admitted
+
+    def _release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    #Quem desistiu de esperar (cancelamento, timeout, KeyboardInterrupt) tira a chamada da fila; se ela já tinha sido
+    #admitida, o cancel falha e a vaga ocupada é liberada
+    def _abandon(self, admitted: Future):
+        if not admitted.cancel():
+            self._release()
+
+    def _wait_admission(self, priority: int, tokens: int):
+        admitted: Future = self._admit(priority, tokens)
+        try:
+            admitted.result()
+        except BaseException:
+            self._abandon(admitted)
+            raise
+
+    async def _await_admission(self, priority: int, tokens: int):
+        admitted: Future = self._admit(priority, tokens)
+        try:
+            await asyncio.wrap_future(admitted)
+        except BaseException:
+            self._abandon(admitted)
+            raise
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        with self.condition:
+            self.retries += 1
+            self.requests_bucket.drain()
+        record_retry(str(getattr(error, "http_status", None) or type(error).__name__))
+        #O Retry-After do servidor também é limitado a max_delay
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(max(retry_after, 0.0), self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _should_retry(self, error: Exception, attempt: int, guard: _StreamGuard) -> bool:
+        return is_retryable_error(error) and attempt < self.max_retries and not (guard is not None and guard.streamed)
+
+    def call(self, fn, *args, priority: int = PRIORITY_BATCH, tokens: int = 0, **kwargs):
+        guard: _StreamGuard = _guard_stream(kwargs)
+        for attempt in itertools.count():
+            start: float = time.perf_counter()
+            self._wait_admission(priority, tokens)
+            SCHEDULER_WAIT.observe(time.perf_counter() - start, priority=priority)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt, guard):
+                    raise
+                delay: float = self._backoff(attempt, e)
+            finally:
+                self._release()
+            time.sleep(delay)
+
+    async def acall(self, coroutine_fn, *args, priority: int = PRIORITY_BATCH, tokens: int = 0, **kwargs):
+        guard: _StreamGuard = _guard_stream(kwargs)
+        for attempt in itertools.count():
+            start: float = time.perf_counter()
+            await self._await_admission(priority, tokens)
+            SCHEDULER_WAIT.observe(time.perf_counter() - start, priority=priority)
+            try:
+                return await coroutine_fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt, guard):
+                    raise
+                delay: float = self._backoff(attempt, e)
+            finally:
+                self._release()
+            await asyncio.sleep(delay)
+
+_scheduler: RequestScheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> RequestScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+def configure_scheduler(**kwargs) -> RequestScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = RequestScheduler(**kwargs)
+        return _scheduler
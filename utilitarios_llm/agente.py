@@ -0,0 +1,318 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.agents import AgentExecutor, AgentType, initialize_agent, load_tools
+from langchain.agents.mrkl.output_parser import MRKLOutputParser, FINAL_ANSWER_ACTION
+from langchain.agents.agent import ExceptionTool
+from langchain.agents.tools import InvalidTool
+from langchain.schema import AgentAction, AgentFinish
+from langchain.tools import Tool
+
+from utilitarios_llm.calculadora import create_math_tool
+from utilitarios_llm.metricas import get_metrics_handler, record_cache
+from utilitarios_llm.streaming import copy_model
+
+#Utilitários para agents (ReAct):
+# - As tools e o agent são criados uma única vez por processo (get_agent), em vez de a cada pergunta.
+# - As observações das tools ficam num cache com TTL, indexado por (tool, input): buscas e contas repetidas não
+#   chamam a SerpAPI nem o LLM de novo enquanto o resultado não expirar.
+# - ParallelAgentExecutor executa em paralelo as ações independentes de um mesmo passo. O agent ReAct padrão só pede
+#   uma ação por passo, então com parallel_tools=True o prompt e o parser passam a aceitar vários pares
+#   Action/Action Input antes da Observation.
+AGENT_TOOL_CACHE_TTL: float = float(os.environ.get("AGENT_TOOL_CACHE_TTL", "600"))
+AGENT_TOOL_CACHE_SIZE: int = int(os.environ.get("AGENT_TOOL_CACHE_SIZE", "1024"))
+AGENT_TOOL_WORKERS: int = int(os.environ.get("AGENT_TOOL_WORKERS", "4"))
+
+class ToolResultCache:
+
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        self.ttl: float = AGENT_TOOL_CACHE_TTL if ttl is None else ttl
+        self.max_entries: int = max_entries or AGENT_TOOL_CACHE_SIZE
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def _key(tool: str, tool_input: str) -> tuple:
+        return tool, " ".join(str(tool_input).split())
+
+    def get(self, tool: str, tool_input: str):
+        key = self._key(tool, tool_input)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                record_cache("tool", False)
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            record_cache("tool", True)
+            return entry[1]
+
+    def put(self, tool: str, tool_input: str, observation):
+        key = self._key(tool, tool_input)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, observation)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+_tool_cache: ToolResultCache = ToolResultCache()
+
+def get_tool_cache() -> ToolResultCache:
+    return _tool_cache
+
+#Retorna uma tool com o mesmo nome e descrição que consulta o cache antes de executar a tool original.
+#Erros não são guardados no cache.
+def cached_tool(tool: Tool, cache: ToolResultCache = None) -> Tool:
+    cache = cache or _tool_cache
+
+    def run(tool_input: str, callbacks=None) -> str:
+        observation = cache.get(tool.name, tool_input)
+        if observation is None:
+            observation = tool.run(tool_input, callbacks=callbacks)
+            cache.put(tool.name, tool_input, observation)
+        return observation
+
+    async def arun(tool_input: str, callbacks=None) -> str:
+        observation = cache.get(tool.name, tool_input)
+        if observation is None:
+            observation = await tool.arun(tool_input, callbacks=callbacks)
+            cache.put(tool.name, tool_input, observation)
+        return observation
+
+    return Tool(name=tool.name, description=tool.description, return_direct=tool.return_direct, func=run, coroutine=arun)
+
+#Tool de busca local, com o mesmo nome e descrição da SerpAPI, para testar o agent sem chave e sem internet
+def create_stub_search_tool(latency: float = 0.5, results: dict = None) -> Tool:
+    results = results or {}
+
+    def search(query: str) -> str:
+        time.sleep(latency)
+        for term, answer in results.items():
+            if term.lower() in query.lower():
+                return answer
+        return f"Stub result {hashlib.sha256(query.encode('utf-8')).hexdigest()[:8]} for: {query}"
+
+    async def asearch(query: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(None, search, query)
+
+    return Tool(
+        name="Search",
+        description="A search engine. Useful for when you need to answer questions about current events. Input should be a search query.",
+        func=search,
+        coroutine=asearch,
+    )
+
+PARALLEL_FORMAT_INSTRUCTIONS = """Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+When you need several pieces of information that do not depend on each other, write all the Action/Action Input pairs
+one after the other before the Observation; they will be executed at the same time."""
+
+_ACTION_REGEX = re.compile(
+    r"Action\s*\d*\s*:[\s]*(.*?)[\s]*Action\s*\d*\s*Input\s*\d*\s*:[\s]*(.*?)(?=\n\s*Action\s*\d*\s*:|$)", re.DOTALL
+)
+
+#Aceita um ou mais pares Action/Action Input na mesma resposta. Cada ação recebe no log só o seu trecho do texto,
+#para que o scratchpad do agent mostre cada ação seguida da sua observação.
+class MultiActionOutputParser(MRKLOutputParser):
+
+    def get_format_instructions(self) -> str:
+        return PARALLEL_FORMAT_INSTRUCTIONS
+
+    def parse(self, text: str):
+        if FINAL_ANSWER_ACTION in text:
+            return super().parse(text)
+        matches = list(_ACTION_REGEX.finditer(text))
+        if len(matches) <= 1:
+            return super().parse(text)
+        actions: list = []
+        start: int = 0
+        for match in matches:
+            actions.append(AgentAction(match.group(1).strip(), match.group(2).strip().strip(" ").strip('"'), text[start:match.end()]))
+            start = match.end()
+        return actions
+
+_tool_pool: ThreadPoolExecutor = None
+_tool_pool_lock = threading.Lock()
+
+def _get_tool_pool() -> ThreadPoolExecutor:
+    global _tool_pool
+    with _tool_pool_lock:
+        if _tool_pool is None:
+            _tool_pool = ThreadPoolExecutor(max_workers=AGENT_TOOL_WORKERS, thread_name_prefix="agent-tool")
+        return _tool_pool
+
+#AgentExecutor que executa em paralelo as ações de um mesmo passo (com uma ação só, o comportamento é o padrão).
+#Ações repetidas (mesma tool e mesmo input) dentro do passo são executadas uma única vez.
+class ParallelAgentExecutor(AgentExecutor):
+
+    def _run_action(self, agent_action: AgentAction, name_to_tool_map: dict, color_mapping: dict, run_manager) -> str:
+        tool_run_kwargs = self.agent.tool_run_logging_kwargs()
+        callbacks = run_manager.get_child() if run_manager else None
+        if agent_action.tool not in name_to_tool_map:
+            return InvalidTool().run(agent_action.tool, verbose=self.verbose, color=None, callbacks=callbacks, **tool_run_kwargs)
+        tool = name_to_tool_map[agent_action.tool]
+        if tool.return_direct:
+            tool_run_kwargs["llm_prefix"] = ""
+        return tool.run(
+            agent_action.tool_input, verbose=self.verbose, color=color_mapping[agent_action.tool], callbacks=callbacks,
+            **tool_run_kwargs
+        )
+
+    async def _arun_action(self, agent_action: AgentAction, name_to_tool_map: dict, color_mapping: dict, run_manager) -> str:
+        tool_run_kwargs = self.agent.tool_run_logging_kwargs()
+        callbacks = run_manager.get_child() if run_manager else None
+        if agent_action.tool not in name_to_tool_map:
+            return await InvalidTool().arun(agent_action.tool, verbose=self.verbose, color=None, callbacks=callbacks, **tool_run_kwargs)
+        tool = name_to_tool_map[agent_action.tool]
+        if tool.return_direct:
+            tool_run_kwargs["llm_prefix"] = ""
+        return await tool.arun(
+            agent_action.tool_input, verbose=self.verbose, color=color_mapping[agent_action.tool], callbacks=callbacks,
+            **tool_run_kwargs
+        )
+
+    @staticmethod
+    def _unique_actions(actions: list) -> dict:
+        unique: dict = {}
+        for agent_action in actions:
+            unique.setdefault((agent_action.tool, str(agent_action.tool_input)), agent_action)
+        return unique
+
+    def _take_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        try:
+            output = self.agent.plan(intermediate_steps, callbacks=run_manager.get_child() if run_manager else None, **inputs)
+        except Exception as e:
+            if not self.handle_parsing_errors:
+                raise
+            output = AgentAction("_Exception", "Invalid or incomplete response", str(e).split("`")[1])
+            observation = ExceptionTool().run(
+                output.tool, verbose=self.verbose, color=None, callbacks=run_manager.get_child() if run_manager else None,
+                **self.agent.tool_run_logging_kwargs()
+            )
+            return [(output, observation)]
+        if isinstance(output, AgentFinish):
+            return output
+        actions: list = [output] if isinstance(output, AgentAction) else output
+        for agent_action in actions:
+            if run_manager:
+                run_manager.on_agent_action(agent_action, color="green")
+
+        unique: dict = self._unique_actions(actions)
+        if len(unique) == 1:
+            observations: dict = {key: self._run_action(action, name_to_tool_map, color_mapping, run_manager) for key, action in unique.items()}
+        else:
+            #Cada ação roda numa cópia do contexto de quem chamou, para que as tools vejam o response_cache_scope e a
+            #request_priority em vigor (as threads do pool não herdam as ContextVars)
+            futures: dict = {
+                key: _get_tool_pool().submit(
+                    contextvars.copy_context().run, self._run_action, action, name_to_tool_map, color_mapping, run_manager
+                )
+                for key, action in unique.items()
+            }
+            observations = {key: future.result() for key, future in futures.items()}
+        return [(agent_action, observations[(agent_action.tool, str(agent_action.tool_input))]) for agent_action in actions]
+
+    async def _atake_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        try:
+            output = await self.agent.aplan(intermediate_steps, callbacks=run_manager.get_child() if run_manager else None, **inputs)
+        except Exception as e:
+            if not self.handle_parsing_errors:
+                raise
+            output = AgentAction("_Exception", "Invalid or incomplete response", str(e).split("`")[1])
+            observation = await ExceptionTool().arun(
+                output.tool, verbose=self.verbose, color=None, callbacks=run_manager.get_child() if run_manager else None,
+                **self.agent.tool_run_logging_kwargs()
+            )
+            return [(output, observation)]
+        if isinstance(output, AgentFinish):
+            return output
+        actions: list = [output] if isinstance(output, AgentAction) else output
+        for agent_action in actions:
+            if run_manager:
+                await run_manager.on_agent_action(agent_action, color="green")
+
+        unique: dict = self._unique_actions(actions)
+        results = await asyncio.gather(
+            *(self._arun_action(action, name_to_tool_map, color_mapping, run_manager) for action in unique.values())
+        )
+        observations: dict = dict(zip(unique.keys(), results))
+        return [(agent_action, observations[(agent_action.tool, str(agent_action.tool_input))]) for agent_action in actions]
+
+#Cópia da tool com o handler de métricas (utilitarios_llm/metricas.py). Os callbacks do AgentExecutor não são
+#herdados pelas tools, então o handler vai direto em cada tool.
+def with_metrics(tool: Tool) -> Tool:
+    handler = get_metrics_handler()
+    callbacks = tool.callbacks if isinstance(tool.callbacks, list) else []
+    if tool.callbacks is not None and not isinstance(tool.callbacks, list) or handler in callbacks:
+        return tool
+    return tool.copy(update={"callbacks": callbacks + [handler]})
+
+def create_agent(llm, tools: list, parallel_tools: bool = True, verbose: bool = True) -> AgentExecutor:
+    agent_kwargs: dict = {}
+    if parallel_tools:
+        agent_kwargs = {"output_parser": MultiActionOutputParser(), "format_instructions": PARALLEL_FORMAT_INSTRUCTIONS}
+    executor: AgentExecutor = initialize_agent(
+        [with_metrics(tool) for tool in tools], llm, agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION, verbose=verbose,
+        agent_kwargs=agent_kwargs
+    )
+    if parallel_tools:
+        executor = ParallelAgentExecutor(
+            agent=executor.agent, tools=executor.tools, verbose=executor.verbose, callbacks=executor.callbacks
+        )
+    return executor
+
+#Igual a load_tools, mas a llm-math é trocada pela calculadora local de utilitarios_llm/calculadora.py, que só chama
+#o LLM quando não consegue avaliar a expressão
+def load_agent_tools(llm, tool_names: tuple) -> list:
+    tools: list = load_tools([name for name in tool_names if name != "llm-math"], llm=llm)
+    if "llm-math" in tool_names:
+        tools.insert(list(tool_names).index("llm-math"), create_math_tool(llm))
+    return tools
+
+_agents: dict = {}
+_agents_lock = threading.Lock()
+
+#Agent com as tools de tool_names (as mesmas de load_tools), com cache de observações, criado uma vez por processo
+#para cada llm. Com tools, usa essas tools no lugar de load_tools (por exemplo create_stub_search_tool nos testes).
+def get_agent(llm, tool_names: tuple = ("serpapi", "llm-math"), tools: list = None, parallel_tools: bool = True,
+              use_tool_cache: bool = True, verbose: bool = True, llm_params: dict = None) -> AgentExecutor:
+    key = (id(llm), tuple(tool_names), tuple(id(tool) for tool in tools or ()), parallel_tools, use_tool_cache, verbose,
+           tuple(sorted((llm_params or {}).items())))
+    with _agents_lock:
+        cached = _agents.get(key)
+        if cached is not None and cached[0] is llm:
+            return cached[1]
+        #llm_params (ex: temperature) valem para uma cópia do llm usada pelo agent e pelas tools; o llm recebido,
+        #que pode estar sendo usado por outras threads, não é alterado
+        agent_llm = copy_model(llm, **llm_params) if llm_params else llm
+        agent_tools: list = list(tools) if tools is not None else load_agent_tools(agent_llm, tool_names)
+        if use_tool_cache:
+            agent_tools = [cached_tool(tool) for tool in agent_tools]
+        agent = create_agent(agent_llm, agent_tools, parallel_tools=parallel_tools, verbose=verbose)
+        _agents[key] = (llm, agent)
+        return agent
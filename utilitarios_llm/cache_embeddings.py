@@ -0,0 +1,212 @@
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from utilitarios_llm.metricas import record_cache
+
+#Armazenamento persistente de embeddings indexado pelo hash do conteúdo (modelo + texto).
+#Os vetores ficam em um único arquivo binário de float32 (vectors.f32), lido via np.memmap, e o índice (index.txt)
+#tem um hash por linha: a linha i corresponde à linha i da matriz de vetores. Os dois arquivos são somente de append,
+#então adicionar novos embeddings não exige reescrever os existentes.
+#Vários processos podem usar o mesmo diretório (ex: os workers do modo servidor, utilitarios_llm/servidor.py): a abertura
+#e cada gravação acontecem com um lock exclusivo entre processos (<diretório>/.lock), e antes de gravar o store lê as
+#linhas que os outros processos adicionaram ao índice, para que as linhas novas entrem depois delas nos dois arquivos.
+EMBEDDING_CACHE_DIR: str = os.environ.get(
+    "EMBEDDING_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "langchain_study", "embeddings")
+)
+
+#Lock exclusivo entre processos no arquivo path (mesmo esquema do _keystore_lock de gerenciador_api_keys)
+@contextmanager
+def _process_lock(path: str):
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            #LK_LOCK tenta por 10 segundos; repete até conseguir
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class EmbeddingStore:
+
+    def __init__(self, directory: str = EMBEDDING_CACHE_DIR):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.txt")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock_path = os.path.join(directory, ".lock")
+        self.lock = threading.Lock()
+        self.dim: int = None
+        self.rows: dict = {}
+        #Linhas do índice já lidas (a linha i do índice é a linha i da matriz) e bytes do index.txt que elas ocupam
+        self.count: int = 0
+        self.index_offset: int = 0
+        self._matrix = None
+
+        os.makedirs(directory, exist_ok=True)
+        with self.lock, _process_lock(self.lock_path):
+            self._refresh()
+            self._repair()
+
+    #Lê as linhas completas adicionadas ao índice (por este ou por outro processo) desde a última leitura.
+    #Os vetores são gravados antes do índice, então toda linha completa do índice já tem o seu vetor.
+    def _refresh(self):
+        if self.dim is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) <= self.index_offset:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self.index_offset)
+            data: bytes = f.read()
+        #Uma linha sem \n ainda está sendo gravada (ou a gravação foi interrompida) e fica para a próxima leitura
+        data = data[:data.rfind(b"\n") + 1]
+        for h in data.decode().splitlines():
+            self.rows.setdefault(h, self.count)
+            self.count += 1
+        self.index_offset += len(data)
+
+    #Se um processo foi interrompido no meio de uma gravação, os arquivos podem ter linhas a mais: um trecho de linha no
+    #índice ou vetores sem linha no índice. Ambos são truncados para as linhas completas, antes que uma gravação nova
+    #as desalinhe. Chamado com o lock entre processos, logo depois do _refresh.
+    def _repair(self):
+        if self.dim is None:
+            return
+        if os.path.exists(self.index_path) and os.path.getsize(self.index_path) != self.index_offset:
+            with open(self.index_path, "r+b") as f:
+                f.truncate(self.index_offset)
+        #Um índice com mais linhas que vetores (ex: vectors.f32 truncado) é truncado para as linhas que têm vetor
+        row_bytes: int = self.dim * 4
+        vector_rows: int = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        if vector_rows < self.count:
+            with open(self.index_path, "rb") as f:
+                lines: list = f.read().splitlines(keepends=True)[:vector_rows]
+            with open(self.index_path, "wb") as f:
+                f.writelines(lines)
+            self.rows, self.count, self.index_offset = {}, 0, 0
+            self._refresh()
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != self.count * row_bytes:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(self.count * row_bytes)
+
+    def _matrix_view(self):
+        #O memmap é reaberto somente quando há linhas novas que ainda não estão mapeadas
+        if self._matrix is None or self._matrix.shape[0] < self.count:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        return self._matrix
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def get_many(self, keys: list) -> list:
+        with self.lock:
+            #Chaves que não estão no store podem ter sido adicionadas por outro processo
+            if any(key not in self.rows for key in keys):
+                self._refresh()
+            if not self.rows:
+                return [None] * len(keys)
+            matrix = self._matrix_view()
+            return [np.array(matrix[self.rows[key]]) if key in self.rows else None for key in keys]
+
+    def add_many(self, keys: list, vectors: list):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock, _process_lock(self.lock_path):
+            #As linhas gravadas pelos outros processos entram antes das novas (e as chaves que eles já gravaram não são
+            #gravadas de novo)
+            self._refresh()
+            self._repair()
+            #dict (e não lista) para que a checagem de repetidos não seja O(n²) nos lotes grandes
+            new: dict = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self.rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                #Temporário e replace: os outros processos leem o meta.json sem o lock (_refresh em get_many)
+                with open(f"{self.meta_path}.tmp", "w") as f:
+                    json.dump({"dim": self.dim, "dtype": "float32"}, f)
+                os.replace(f"{self.meta_path}.tmp", self.meta_path)
+
+            #Vetores primeiro e índice depois: um índice nunca aponta para uma linha que não foi gravada
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack(list(new.values())).tobytes())
+            lines: bytes = "".join(f"{key}\n" for key in new).encode()
+            with open(self.index_path, "ab") as f:
+                f.write(lines)
+
+            for key in new:
+                self.rows[key] = self.count
+                self.count += 1
+            self.index_offset += len(lines)
+
+#Embeddings que consulta o EmbeddingStore antes de chamar o modelo. Os textos ainda não cacheados são enviados
+#em uma única chamada a embed_documents, e somente eles são embedados; os demais vêm do disco.
+#Pode ser usado no lugar de OpenAIEmbeddings em qualquer lugar que aceite um Embeddings (FAISS, example selectors...).
+class CachedEmbeddings(Embeddings):
+
+    def __init__(self, embeddings: Embeddings, store: EmbeddingStore = None):
+        self.embeddings = embeddings
+        #EmbeddingStore tem __len__: um store vazio é falso, então a comparação é com None
+        self.store = store if store is not None else EmbeddingStore()
+        #O nome do modelo faz parte da chave, para que embeddings de modelos diferentes não se misturem
+        self.model_name: str = getattr(embeddings, "model", None) or embeddings.__class__.__name__
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def embed_documents(self, texts: list) -> list:
+        keys: list = [self._key(text) for text in texts]
+        vectors: list = self.store.get_many(keys)
+
+        missing: dict = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+        #Um texto repetido que não está no store é um único miss (é embedado uma vez), e as repetições não são hits
+        record_cache("embedding", True, sum(vector is not None for vector in vectors))
+        record_cache("embedding", False, len(missing))
+
+        if missing:
+            new_vectors: list = self.embeddings.embed_documents(list(missing.values()))
+            self.store.add_many(list(missing), new_vectors)
+            computed: dict = dict(zip(missing, new_vectors))
+            vectors = [computed[keys[i]] if vector is None else vector for i, vector in enumerate(vectors)]
+
+        return [list(map(float, vector)) for vector in vectors]
+
+    def embed_query(self, text: str) -> list:
+        key: str = self._key(text)
+        vector = self.store.get_many([key])[0]
+        record_cache("embedding", vector is not None)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.store.add_many([key], [vector])
+        return list(map(float, vector))
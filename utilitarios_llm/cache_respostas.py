@@ -0,0 +1,168 @@
+import os
+import ast
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import langchain
+from langchain.cache import BaseCache
+from langchain.schema import Generation
+
+from utilitarios_llm.metricas import record_cache
+
+#Cache persistente (SQLite) das respostas dos LLMs, compartilhado entre quickstart e cookbook_01.
+#É instalado como langchain.llm_cache, de forma que qualquer chamada a um LLM do langchain (llm(prompt), chains, agents)
+#passa por ele. A chave é o prompt junto com os parâmetros do modelo (model_name, temperature, max_tokens...),
+#e o número de entradas é limitado: ao ultrapassar max_entries, as entradas acessadas há mais tempo são removidas (LRU).
+#
+#Por padrão só são cacheadas chamadas determinísticas (temperature 0). Para chamadas com temperature > 0, o uso do cache
+#é opcional por chamada, através de response_cache_scope(use_cache=True). use_cache=False desliga o cache na chamada.
+#O response_cache_scope instala o cache somente enquanto houver algum escopo aberto, e ao final restaura o llm_cache
+#anterior. Chamadas feitas fora de um escopo (por exemplo em outra thread, enquanto um escopo está aberto) não usam o
+#cache, a não ser que ele tenha sido instalado para o processo inteiro com install_response_cache.
+LLM_CACHE_PATH: str = os.environ.get(
+    "LLM_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "langchain_study", "llm_responses.sqlite")
+)
+LLM_CACHE_MAX_ENTRIES: int = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+#Valor de _use_cache fora de um response_cache_scope
+_NO_SCOPE = object()
+_use_cache: contextvars.ContextVar = contextvars.ContextVar("use_llm_cache", default=_NO_SCOPE)
+
+def _parse_llm_string(llm_string: str) -> dict:
+    #llm_string é gerado pelo langchain como str(sorted(params.items())), onde params = llm.dict()
+    try:
+        return dict(ast.literal_eval(llm_string))
+    except (ValueError, SyntaxError):
+        return {}
+
+class LLMResponseCache(BaseCache):
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        #True quando instalado com install_response_cache: as chamadas fora de um escopo também usam o cache
+        self.installed: bool = False
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model_name TEXT,
+                temperature REAL,
+                prompt TEXT,
+                response TEXT,
+                last_access REAL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.connection.commit()
+
+    def _should_cache(self, params: dict) -> bool:
+        use_cache = _use_cache.get()
+        if use_cache is _NO_SCOPE:
+            use_cache = None if self.installed else False
+        if use_cache is not None:
+            return use_cache
+        return params.get("temperature") == 0
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str):
+        if not self._should_cache(_parse_llm_string(llm_string)):
+            return None
+
+        key = self._key(prompt, llm_string)
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            record_cache("response", row is not None)
+            if row is None:
+                return None
+            self.connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+
+        return [Generation(**generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: list) -> None:
+        params: dict = _parse_llm_string(llm_string)
+        if not self._should_cache(params):
+            return
+
+        response = json.dumps([{"text": g.text, "generation_info": g.generation_info} for g in return_val])
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(prompt, llm_string), params.get("model_name"), params.get("temperature"), prompt, response, time.time())
+            )
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        count: int = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self, **kwargs) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+
+_response_cache: LLMResponseCache = None
+_scope_lock = threading.Lock()
+_open_scopes: int = 0
+_previous_llm_cache: BaseCache = None
+
+#Cache do processo, criado na primeira chamada (sem instalá-lo como langchain.llm_cache)
+def get_response_cache(path: str = None, max_entries: int = None) -> LLMResponseCache:
+    global _response_cache
+    with _scope_lock:
+        #Idempotente: se nenhum parâmetro for informado, reaproveita a instância existente
+        if _response_cache is None or path is not None or max_entries is not None:
+            _response_cache = LLMResponseCache(path or LLM_CACHE_PATH, max_entries or LLM_CACHE_MAX_ENTRIES)
+        return _response_cache
+
+#Instala o cache como langchain.llm_cache para o processo inteiro, inclusive para as chamadas fora de um escopo
+def install_response_cache(path: str = None, max_entries: int = None) -> LLMResponseCache:
+    cache: LLMResponseCache = get_response_cache(path, max_entries)
+    cache.installed = True
+    langchain.llm_cache = cache
+    return cache
+
+#Define, para as chamadas feitas dentro do bloco with, se o cache deve ser usado:
+#None = somente chamadas determinísticas (temperature 0), True = sempre, False = nunca.
+#Os escopos podem estar abertos ao mesmo tempo em várias threads: o cache é instalado na abertura do primeiro e o
+#llm_cache anterior é restaurado no fechamento do último.
+@contextmanager
+def response_cache_scope(use_cache: bool = None):
+    global _open_scopes, _previous_llm_cache
+    cache: LLMResponseCache = get_response_cache()
+    with _scope_lock:
+        if _open_scopes == 0:
+            _previous_llm_cache = langchain.llm_cache
+            langchain.llm_cache = cache
+        _open_scopes += 1
+    token = _use_cache.set(use_cache)
+    try:
+        yield
+    finally:
+        _use_cache.reset(token)
+        with _scope_lock:
+            _open_scopes -= 1
+            #Se o llm_cache foi trocado dentro do escopo (ex: install_response_cache), a troca é mantida
+            if _open_scopes == 0 and langchain.llm_cache is cache and not cache.installed:
+                langchain.llm_cache = _previous_llm_cache
+            if _open_scopes == 0:
+                _previous_llm_cache = None
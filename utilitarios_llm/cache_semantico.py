@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import atexit
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.llms.base import BaseLLM
+from langchain.embeddings.base import Embeddings
+
+from utilitarios_llm.metricas import record_cache, record_semantic_hit
+
+#Cache semântico de respostas: encontra respostas de prompts parecidos, e não somente de prompts idênticos
+#(ex: "Rome" e "Roma", "steak" e "steaks"), que o cache exato (utilitarios_llm/cache_respostas.py) não reconhece.
+#O prompt já formatado é embedado e procurado num índice FAISS (PersistentExampleIndex, o mesmo do selector: vetores
+#normalizados e produto interno, ou seja, similaridade de cosseno). Se o prompt mais parecido tem similaridade >= threshold,
+#a resposta dele é retornada sem chamar o LLM; senão o LLM é chamado e o prompt entra no índice com a resposta.
+#Há um índice por namespace: os parâmetros do LLM (modelo, temperature...) mais o namespace informado na chamada
+#(por exemplo o template), para que um prompt nunca receba a resposta de outro modelo ou de outro template.
+#Como os prompts de um mesmo template compartilham a maior parte do texto, a similaridade entre eles é alta mesmo quando
+#os valores diferem; por isso o threshold padrão é alto e os hits são auditados:
+# - uma fração audit_rate dos hits chama o LLM de novo em segundo plano (com prioridade de lote) e grava em audit_path
+#   (JSONL) o prompt, o prompt encontrado, a similaridade, as duas respostas e a similaridade entre elas, para revisão
+#   dos falsos hits e ajuste do threshold;
+# - hits e misses vão para cache_requests_total{cache="semantic"}, e a similaridade dos hits e a latência economizada
+#   (duração da chamada original menos o tempo da consulta) para semantic_cache_hit_score e
+#   semantic_cache_saved_seconds_total (ver utilitarios_llm/metricas.py).
+#Os índices são gravados em disco a cada save_interval segundos e ao final do processo. Cada save substitui o índice
+#inteiro, então um diretório aceita um único processo escritor: no modo servidor cada worker usa o próprio diretório
+#(ver worker_directory em utilitarios_llm/servidor.py).
+#O faiss é importado somente quando o primeiro índice é aberto: as funções que aceitam o cache semântico importam
+#get_semantic_cache mesmo quando ele não está instalado.
+#Uso: cache = SemanticResponseCache(CachedEmbeddings(clients.embeddings)); cache.complete(llm, prompt, namespace=template)
+SEMANTIC_CACHE_ENABLED: bool = os.environ.get("LLM_SEMANTIC_CACHE") == "1"
+SEMANTIC_CACHE_DIR: str = os.environ.get(
+    "SEMANTIC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "langchain_study", "semantic_cache")
+)
+SEMANTIC_CACHE_THRESHOLD: float = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_AUDIT_RATE: float = float(os.environ.get("SEMANTIC_CACHE_AUDIT_RATE", "0.05"))
+SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+SEMANTIC_CACHE_SAVE_INTERVAL: float = float(os.environ.get("SEMANTIC_CACHE_SAVE_INTERVAL", "5"))
+
+#Mesma string que o langchain usa para identificar os parâmetros do LLM no llm_cache
+def llm_string(llm: BaseLLM) -> str:
+    return str(sorted(llm.dict().items()))
+
+class SemanticResponseCache:
+
+    def __init__(self, embeddings: Embeddings, directory: str = None, threshold: float = None, audit_rate: float = None,
+                 audit_path: str = None, max_entries: int = None, save_interval: float = None):
+        self.embeddings = embeddings
+        self.directory: str = directory or SEMANTIC_CACHE_DIR
+        self.threshold: float = SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.audit_rate: float = SEMANTIC_CACHE_AUDIT_RATE if audit_rate is None else audit_rate
+        self.audit_path: str = audit_path or os.path.join(self.directory, "audit.jsonl")
+        self.max_entries: int = max_entries or SEMANTIC_CACHE_MAX_ENTRIES
+        self.save_interval: float = SEMANTIC_CACHE_SAVE_INTERVAL if save_interval is None else save_interval
+        self.lock = threading.Lock()
+        self.indexes: dict = {}
+        self.dirty: set = set()
+        self.last_save: float = time.monotonic()
+        self.auditor: ThreadPoolExecutor = None
+        self.hits: int = 0
+        self.misses: int = 0
+        self.audits: int = 0
+        self.saved_seconds: float = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(self.close)
+
+    def _index(self, key: str):
+        from utilitarios_llm.indice_exemplos import PersistentExampleIndex
+
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is None:
+                #Sem mmap: o índice recebe prompts novos durante a execução
+                index = PersistentExampleIndex(os.path.join(self.directory, key), self.embeddings, input_keys=["prompt"], mmap=False)
+                self.indexes[key] = index
+            return index
+
+    @staticmethod
+    def _key(llm: BaseLLM, namespace: str) -> str:
+        return hashlib.sha256(f"{llm_string(llm)}\n{namespace}".encode()).hexdigest()[:16]
+
+    #O prompt mais parecido com similaridade >= threshold: (entrada, similaridade), ou None
+    def lookup(self, llm: BaseLLM, prompt: str, namespace: str = "") -> tuple:
+        results: list = self._index(self._key(llm, namespace)).search(prompt, k=1)
+        hit: bool = bool(results) and results[0][1] >= self.threshold
+        record_cache("semantic", hit)
+        return results[0] if hit else None
+
+    def update(self, llm: BaseLLM, prompt: str, response: str, seconds: float, namespace: str = ""):
+        key: str = self._key(llm, namespace)
+        index = self._index(key)
+        index.add_examples([{"prompt": prompt, "response": response, "seconds": seconds, "created": time.time()}])
+        #As entradas mais antigas saem do índice em blocos de 10%, para não remover uma a uma
+        if len(index) > self.max_entries:
+            with index.lock:
+                oldest: list = sorted(index.examples, key=lambda id: index.examples[id]["created"])
+                index.remove_ids(oldest[:len(index) - self.max_entries * 9 // 10])
+        with self.lock:
+            self.dirty.add(key)
+            save: bool = time.monotonic() - self.last_save >= self.save_interval
+        if save:
+            self.save()
+
+    #Retorna a resposta do prompt parecido, se houver; senão chama o LLM e guarda a resposta
+    def complete(self, llm: BaseLLM, prompt: str, namespace: str = "") -> str:
+        start: float = time.perf_counter()
+        hit: tuple = self.lookup(llm, prompt, namespace)
+        if hit is not None:
+            entry, score = hit
+            saved: float = max(entry["seconds"] - (time.perf_counter() - start), 0.0)
+            with self.lock:
+                self.hits += 1
+                self.saved_seconds += saved
+            record_semantic_hit(score, saved)
+            if self.audit_rate and random.random() < self.audit_rate:
+                self._audit(llm, prompt, entry, score, namespace)
+            return entry["response"]
+
+        with self.lock:
+            self.misses += 1
+        start = time.perf_counter()
+        response: str = llm(prompt)
+        self.update(llm, prompt, response, time.perf_counter() - start, namespace)
+        return response
+
+    def _audit(self, llm: BaseLLM, prompt: str, entry: dict, score: float, namespace: str):
+        with self.lock:
+            if self.auditor is None:
+                self.auditor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-audit")
+            self.audits += 1
+        self.auditor.submit(self._run_audit, llm, prompt, entry, score, namespace)
+
+    def _run_audit(self, llm: BaseLLM, prompt: str, entry: dict, score: float, namespace: str):
+        import numpy as np
+        from utilitarios_llm.agendador import PRIORITY_BATCH, request_priority
+        from utilitarios_llm.cache_respostas import response_cache_scope
+
+        try:
+            #A resposta nova não pode vir de nenhum cache
+            with request_priority(PRIORITY_BATCH), response_cache_scope(False):
+                fresh: str = llm(prompt)
+            vectors = np.asarray(self.embeddings.embed_documents([entry["response"], fresh]), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1)
+            agreement: float = float(vectors[0] @ vectors[1] / (norms[0] * norms[1])) if norms.all() else 0.0
+            record: dict = {
+                "timestamp": time.time(), "namespace": namespace, "model": llm.dict().get("model_name"),
+                "prompt": prompt, "matched_prompt": entry["prompt"], "score": round(score, 4),
+                "cached_response": entry["response"], "fresh_response": fresh, "response_similarity": round(agreement, 4),
+            }
+        except Exception as e:
+            record = {"timestamp": time.time(), "prompt": prompt, "matched_prompt": entry["prompt"], "error": f"{type(e).__name__}: {e}"}
+        with self.lock:
+            with open(self.audit_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def stats(self) -> dict:
+        lookups: int = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "audits": self.audits, "saved_seconds": round(self.saved_seconds, 3),
+            "entries": sum(len(index) for index in list(self.indexes.values())),
+        }
+
+    def save(self):
+        with self.lock:
+            keys: list = list(self.dirty)
+            self.dirty.clear()
+            self.last_save = time.monotonic()
+        for key in keys:
+            self.indexes[key].save()
+
+    #Espera as auditorias pendentes e grava os índices
+    def close(self):
+        if self.auditor is not None:
+            self.auditor.shutdown(wait=True)
+            self.auditor = None
+        self.save()
+
+_semantic_cache: SemanticResponseCache = None
+
+#Instala o cache semântico do processo, usado pelas funções que recebem semantic_cache=None (ver get_semantic_cache)
+def install_semantic_cache(embeddings: Embeddings, **kwargs) -> SemanticResponseCache:
+    global _semantic_cache
+    _semantic_cache = SemanticResponseCache(embeddings, **kwargs)
+    return _semantic_cache
+
+#O cache semântico instalado, ou None se ele não foi instalado (o cache semântico é opcional)
+def get_semantic_cache() -> SemanticResponseCache:
+    return _semantic_cache
+
+#Usado pelos pontos de entrada: LLM_SEMANTIC_CACHE=1 instala o cache semântico com os embeddings informados.
+#Cada prompt é embedado na consulta e de novo ao entrar no índice, então os embeddings passam pelo CachedEmbeddings.
+#kwargs são repassados ao SemanticResponseCache (ex: directory).
+def install_semantic_cache_from_env(embeddings: Embeddings, **kwargs) -> SemanticResponseCache:
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    from utilitarios_llm.cache_embeddings import CachedEmbeddings
+
+    if not isinstance(embeddings, CachedEmbeddings):
+        embeddings = CachedEmbeddings(embeddings)
+    return install_semantic_cache(embeddings, **kwargs)
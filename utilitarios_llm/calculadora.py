@@ -0,0 +1,286 @@
+import re
+import ast
+import math
+import operator
+import threading
+
+from langchain.chains import LLMMathChain
+from langchain.tools import Tool
+
+#Calculadora local para o agent: a tool llm-math padrão sempre faz uma chamada extra ao LLM para transformar a
+#pergunta em código antes de calcular. Aqui a expressão é avaliada primeiro por um avaliador seguro (só aritmética e
+#as funções de MATH_FUNCTIONS, sem eval) e o LLMMathChain só é usado quando a expressão não pode ser avaliada.
+#MathToolStats conta quantas vezes cada caminho foi usado.
+#Os limites abaixo valem para toda operação cujo custo cresce com o valor dos argumentos (potência, fatorial, comb/perm,
+#testes de primalidade, repetição de listas), para que uma expressão mal formada falhe na hora em vez de travar o agent.
+MAX_EXPONENT: int = 10000
+MAX_RESULT_BITS: int = 100000
+MAX_FACTORIAL: int = 5000
+MAX_PRIME_SEARCH: int = 10 ** 12
+#O Miller-Rabin de is_prime só é determinístico até 3.3 * 10^24 (81 bits): acima disso o teste é recusado e a
+#pergunta vai para o LLMMathChain, em vez de devolver uma resposta que pode estar errada
+MAX_PRIME_TEST_BITS: int = 81
+
+class ExpressionError(ValueError):
+    pass
+
+#Os helpers de primos só aceitam inteiros (ou floats inteiros, como o resultado de sqrt(49)): int(2.5) truncaria o valor
+def _integer(n) -> int:
+    if isinstance(n, float) and n.is_integer():
+        return int(n)
+    if not isinstance(n, int):
+        raise ExpressionError(f"Expected an integer: {n!r}")
+    return n
+
+def is_prime(n: int) -> bool:
+    n = _integer(n)
+    if n.bit_length() > MAX_PRIME_TEST_BITS:
+        raise ExpressionError(f"Number too large for primality test: {n.bit_length()} bits")
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if n % p == 0:
+            return n == p
+    #Miller-Rabin com estas bases é determinístico para n < 3.3 * 10^24 (por isso o limite de MAX_PRIME_TEST_BITS)
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+def _check_prime_search(n) -> int:
+    n = _integer(n)
+    if abs(n) > MAX_PRIME_SEARCH:
+        raise ExpressionError(f"Number too large for prime search: {n}")
+    return n
+
+#Maior primo estritamente menor que n
+def previous_prime(n: int) -> int:
+    n = _check_prime_search(n) - 1
+    while n >= 2:
+        if is_prime(n):
+            return n
+        n -= 1
+    raise ExpressionError("There is no prime number smaller than 2")
+
+#Menor primo estritamente maior que n
+def next_prime(n: int) -> int:
+    n = max(_check_prime_search(n) + 1, 2)
+    while not is_prime(n):
+        n += 1
+    return n
+
+def primes_below(n: int) -> list:
+    n = _check_prime_search(n)
+    if n > 10 ** 7:
+        raise ExpressionError(f"Too many primes to list below {n}")
+    if n < 3:
+        return []
+    sieve = bytearray([1]) * n
+    sieve[0] = sieve[1] = 0
+    for i in range(2, math.isqrt(n - 1) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytearray(len(range(i * i, n, i)))
+    return [i for i in range(n) if sieve[i]]
+
+def prime_factors(n: int) -> list:
+    n = _check_prime_search(n)
+    factors: list = []
+    p = 2
+    while p * p <= n:
+        while n % p == 0:
+            factors.append(p)
+            n //= p
+        p += 1 if p == 2 else 2
+    if n > 1:
+        factors.append(n)
+    return factors
+
+def _power(base, exponent):
+    if isinstance(exponent, (int, float)) and abs(exponent) > MAX_EXPONENT:
+        raise ExpressionError(f"Exponent too large: {exponent}")
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1 \
+            and exponent * abs(base).bit_length() > MAX_RESULT_BITS:
+        raise ExpressionError(f"Result too large: {base} ** {exponent}")
+    return operator.pow(base, exponent)
+
+def _factorial(n: int) -> int:
+    if n > MAX_FACTORIAL:
+        raise ExpressionError(f"Factorial argument too large: {n}")
+    return math.factorial(n)
+
+#log2 de n! (lgamma evita calcular o fatorial)
+def _log2_factorial(n: int) -> float:
+    return math.lgamma(n + 1) / math.log(2)
+
+#comb e perm custam proporcionalmente ao tamanho do resultado: o número de bits é estimado antes de calcular
+def _comb(n: int, k: int) -> int:
+    if isinstance(n, int) and isinstance(k, int) and 0 <= k <= n \
+            and _log2_factorial(n) - _log2_factorial(k) - _log2_factorial(n - k) > MAX_RESULT_BITS:
+        raise ExpressionError(f"Result too large: comb({n}, {k})")
+    return math.comb(n, k)
+
+def _perm(n: int, k: int = None) -> int:
+    if isinstance(n, int) and (k is None or isinstance(k, int)) and n >= 0:
+        k = n if k is None else k
+        if 0 <= k <= n and _log2_factorial(n) - _log2_factorial(n - k) > MAX_RESULT_BITS:
+            raise ExpressionError(f"Result too large: perm({n}, {k})")
+    return math.perm(n, k)
+
+#Lista * inteiro repete a lista ([0] * 10 ** 9 alocaria gigabytes), e não é uma operação matemática: é rejeitada.
+#Entre inteiros, o resultado também é limitado a MAX_RESULT_BITS.
+def _multiply(left, right):
+    if isinstance(left, list) or isinstance(right, list):
+        raise ExpressionError("Lists cannot be multiplied")
+    if isinstance(left, int) and isinstance(right, int) and left.bit_length() + right.bit_length() > MAX_RESULT_BITS:
+        raise ExpressionError(f"Result too large: {left.bit_length()}-bit * {right.bit_length()}-bit")
+    return operator.mul(left, right)
+
+MATH_FUNCTIONS: dict = {
+    "abs": abs, "round": round, "min": min, "max": max, "sum": sum, "len": len,
+    "sqrt": math.sqrt, "cbrt": lambda x: math.copysign(abs(x) ** (1 / 3), x), "exp": math.exp,
+    "log": math.log, "log10": math.log10, "log2": math.log2, "ln": math.log,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan, "asin": math.asin, "acos": math.acos, "atan": math.atan,
+    "floor": math.floor, "ceil": math.ceil, "factorial": _factorial, "gcd": math.gcd, "lcm": math.lcm,
+    "comb": _comb, "perm": _perm, "radians": math.radians, "degrees": math.degrees,
+    "is_prime": is_prime, "previous_prime": previous_prime, "next_prime": next_prime,
+    "primes_below": primes_below, "prime_factors": prime_factors,
+}
+MATH_CONSTANTS: dict = {"pi": math.pi, "e": math.e, "tau": math.tau, "True": True, "False": False}
+
+_BINARY_OPERATORS: dict = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: _multiply, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: _power,
+}
+_UNARY_OPERATORS: dict = {ast.UAdd: operator.pos, ast.USub: operator.neg, ast.Not: operator.not_}
+_COMPARE_OPERATORS: dict = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+
+def _evaluate(node):
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in MATH_CONSTANTS:
+        return MATH_CONSTANTS[node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        return _BINARY_OPERATORS[type(node.op)](_evaluate(node.left), _evaluate(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        return _UNARY_OPERATORS[type(node.op)](_evaluate(node.operand))
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE_OPERATORS for op in node.ops):
+        left = _evaluate(node.left)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate(comparator)
+            if not _COMPARE_OPERATORS[type(op)](left, right):
+                return False
+            left = right
+        return True
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_evaluate(element) for element in node.elts]
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in MATH_FUNCTIONS
+            and not node.keywords):
+        return MATH_FUNCTIONS[node.func.id](*(_evaluate(arg) for arg in node.args))
+    raise ExpressionError(f"Unsupported expression: {ast.dump(node)}")
+
+#Perguntas comuns do agent escritas em linguagem natural, traduzidas para chamadas das funções acima
+_NATURAL_LANGUAGE_PATTERNS: list = [
+    (re.compile(r"^(?:what is )?(?:the )?(?:largest|biggest|greatest) prime(?: number)? (?:that is )?(?:smaller|less|lower) than (\d+)\??$", re.I), "previous_prime({})"),
+    (re.compile(r"^(?:what is )?(?:the )?(?:smallest|next) prime(?: number)? (?:that is )?(?:larger|greater|bigger|after) than (\d+)\??$", re.I), "next_prime({})"),
+    (re.compile(r"^is (\d+) (?:a )?prime(?: number)?\??$", re.I), "is_prime({})"),
+    (re.compile(r"^(?:the )?prime factors of (\d+)\??$", re.I), "prime_factors({})"),
+    (re.compile(r"^(?:the )?square root of (.+?)\??$", re.I), "sqrt({})"),
+]
+
+def normalize_expression(expression: str) -> str:
+    expression = expression.strip().strip('"').strip("`").strip()
+    expression = re.sub(r"\s*=\s*\??$", "", expression)
+    for pattern, template in _NATURAL_LANGUAGE_PATTERNS:
+        match = pattern.match(expression)
+        if match:
+            return template.format(match.group(1))
+    return expression.replace("^", "**").replace("×", "*").replace("÷", "/")
+
+def evaluate_expression(expression: str):
+    try:
+        tree = ast.parse(normalize_expression(expression), mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Could not parse expression: {expression}") from e
+    try:
+        return _evaluate(tree)
+    except ExpressionError:
+        raise
+    except (ArithmeticError, TypeError, ValueError) as e:
+        raise ExpressionError(f"Could not evaluate expression: {expression}: {e}") from e
+
+def format_result(value) -> str:
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e16:
+        value = int(value)
+    return f"Answer: {value}"
+
+class MathToolStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local: int = 0
+        self.fallbacks: int = 0
+
+    def record(self, local: bool):
+        with self.lock:
+            if local:
+                self.local += 1
+            else:
+                self.fallbacks += 1
+
+    @property
+    def fast_path_ratio(self) -> float:
+        total: int = self.local + self.fallbacks
+        return self.local / total if total else 0.0
+
+    def __str__(self):
+        return f"math tool: {self.local} local, {self.fallbacks} LLM fallbacks ({self.fast_path_ratio:.0%} fast path)"
+
+_stats: MathToolStats = MathToolStats()
+
+def get_math_tool_stats() -> MathToolStats:
+    return _stats
+
+#Tool "Calculator" com o mesmo nome e descrição da llm-math do langchain (o prompt do agent não muda)
+def create_math_tool(llm, stats: MathToolStats = None) -> Tool:
+    stats = stats or _stats
+    math_chain: LLMMathChain = LLMMathChain.from_llm(llm=llm)
+
+    def calculate(expression: str, callbacks=None) -> str:
+        try:
+            result: str = format_result(evaluate_expression(expression))
+        except ExpressionError:
+            stats.record(local=False)
+            return math_chain.run(expression, callbacks=callbacks)
+        stats.record(local=True)
+        return result
+
+    async def acalculate(expression: str, callbacks=None) -> str:
+        try:
+            result: str = format_result(evaluate_expression(expression))
+        except ExpressionError:
+            stats.record(local=False)
+            return await math_chain.arun(expression, callbacks=callbacks)
+        stats.record(local=True)
+        return result
+
+    return Tool(
+        name="Calculator",
+        description="Useful for when you need to answer questions about math.",
+        func=calculate,
+        coroutine=acalculate,
+    )
@@ -0,0 +1,172 @@
+import os
+import time
+from contextlib import asynccontextmanager
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from langchain.llms import OpenAI
+from langchain.chat_models import ChatOpenAI
+from langchain.embeddings import OpenAIEmbeddings
+
+from utilitarios_llm.tokens import count_tokens, count_message_tokens
+from utilitarios_llm.agendador import PRIORITY_BATCH, PRIORITY_INTERACTIVE, current_priority, get_scheduler
+from utilitarios_llm.metricas import get_metrics_handler, record_embedding
+
+#Fábrica dos clients de modelo (ChatOpenAI, OpenAIEmbeddings e OpenAI) sobre uma única sessão HTTP com pool de conexões
+#keep-alive. A biblioteca openai cria, por padrão, uma sessão por thread (e uma sessão aiohttp nova por requisição
+#assíncrona), pagando um novo handshake TCP/TLS a cada sessão. Com a sessão compartilhada, todos os clients e todas as
+#threads reaproveitam as conexões já abertas.
+#Tamanho do pool e timeouts podem ser configurados por parâmetro ou pelas variáveis HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT
+#e HTTP_READ_TIMEOUT. api_base (ou OPENAI_API_BASE) permite apontar os clients para outro servidor, como o
+#servidor_stub.StubOpenAIServer.
+HTTP_POOL_SIZE: int = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+HTTP_CONNECT_TIMEOUT: float = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT: float = float(os.environ.get("HTTP_READ_TIMEOUT", "120"))
+
+#HTTPAdapter que aplica os timeouts configurados a todas as requisições (a biblioteca openai sempre envia o próprio timeout)
+class TimeoutHTTPAdapter(HTTPAdapter):
+
+    def __init__(self, timeout: tuple, *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+def create_http_session(pool_size: int = None, connect_timeout: float = None, read_timeout: float = None) -> requests.Session:
+    pool_size = pool_size or HTTP_POOL_SIZE
+    adapter = TimeoutHTTPAdapter(
+        (connect_timeout or HTTP_CONNECT_TIMEOUT, read_timeout or HTTP_READ_TIMEOUT),
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=2,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+#Instala a sessão como sessão padrão da biblioteca openai, usada por todos os clients do langchain
+def configure_shared_session(session: requests.Session = None, api_base: str = None, **session_kwargs) -> requests.Session:
+    session = session or create_http_session(**session_kwargs)
+    openai.requestssession = session
+    api_base = api_base or os.environ.get("OPENAI_API_BASE")
+    if api_base:
+        openai.api_base = api_base
+    return session
+
+#Versões dos models que passam todas as chamadas à API pelo agendador (utilitarios_llm/agendador.py).
+#Como a interceptação é feita em _generate/_agenerate, vale também para as chamadas feitas por chains, agents e pela
+#ConversationChain. A prioridade padrão é interativa para o chat e de lote para os demais, e pode ser trocada com
+#agendador.request_priority. Os tokens de cada chamada são estimados como prompt + max_tokens da resposta.
+#As repetições por rate limit ficam a cargo do agendador, então esses models são criados com max_retries=1.
+DEFAULT_COMPLETION_TOKENS: int = 256
+
+def _completion_tokens(max_tokens: int) -> int:
+    return max_tokens if max_tokens and max_tokens > 0 else DEFAULT_COMPLETION_TOKENS
+
+class ScheduledOpenAI(OpenAI):
+
+    def _estimate_tokens(self, prompts: list) -> int:
+        return sum(count_tokens(prompt, self.model_name) for prompt in prompts) + _completion_tokens(self.max_tokens) * len(prompts)
+
+    def _generate(self, prompts, stop=None, run_manager=None):
+        return get_scheduler().call(
+            super()._generate, prompts, stop=stop, run_manager=run_manager,
+            priority=current_priority(PRIORITY_BATCH), tokens=self._estimate_tokens(prompts)
+        )
+
+    async def _agenerate(self, prompts, stop=None, run_manager=None):
+        return await get_scheduler().acall(
+            super()._agenerate, prompts, stop=stop, run_manager=run_manager,
+            priority=current_priority(PRIORITY_BATCH), tokens=self._estimate_tokens(prompts)
+        )
+
+class ScheduledChatOpenAI(ChatOpenAI):
+
+    def _estimate_tokens(self, messages: list) -> int:
+        return sum(count_message_tokens(message.content, self.model_name) for message in messages) + _completion_tokens(self.max_tokens)
+
+    def _generate(self, messages, stop=None, run_manager=None):
+        return get_scheduler().call(
+            super()._generate, messages, stop=stop, run_manager=run_manager,
+            priority=current_priority(PRIORITY_INTERACTIVE), tokens=self._estimate_tokens(messages)
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None):
+        return await get_scheduler().acall(
+            super()._agenerate, messages, stop=stop, run_manager=run_manager,
+            priority=current_priority(PRIORITY_INTERACTIVE), tokens=self._estimate_tokens(messages)
+        )
+
+class ScheduledOpenAIEmbeddings(OpenAIEmbeddings):
+
+    #Embeddings não passam pelos callbacks do langchain: cada tentativa é registrada direto nas métricas
+    def _measured(self, fn, texts: list, *args):
+        start: float = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            record_embedding(self.model, time.perf_counter() - start, texts, error=True)
+            raise
+        record_embedding(self.model, time.perf_counter() - start, texts)
+        return result
+
+    def embed_documents(self, texts, chunk_size=0):
+        return get_scheduler().call(
+            self._measured, super().embed_documents, texts, texts, chunk_size,
+            priority=current_priority(PRIORITY_BATCH), tokens=sum(count_tokens(text, self.model) for text in texts)
+        )
+
+    def embed_query(self, text):
+        return get_scheduler().call(
+            self._measured, super().embed_query, [text], text,
+            priority=current_priority(PRIORITY_INTERACTIVE), tokens=count_tokens(text, self.model)
+        )
+
+class ModelClients:
+
+    def __init__(self, chat: ChatOpenAI, embeddings: OpenAIEmbeddings, llm: OpenAI, session: requests.Session):
+        self.chat = chat
+        self.embeddings = embeddings
+        self.llm = llm
+        self.session = session
+
+#scheduled=False cria os models padrão do langchain, sem passar pelo agendador
+#metrics=True registra as chamadas de chat e llm no handler de utilitarios_llm/metricas.py
+def create_model_clients(openai_api_key: str, pool_size: int = None, connect_timeout: float = None, read_timeout: float = None,
+                         api_base: str = None, chat_temperature: float = 0.7, llm_temperature: float = 0.7,
+                         llm_model_name: str = "text-davinci-003", scheduled: bool = True, metrics: bool = True) -> ModelClients:
+    session = configure_shared_session(
+        api_base=api_base, pool_size=pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout
+    )
+    timeout: float = read_timeout or HTTP_READ_TIMEOUT
+
+    if scheduled:
+        chat_cls, embeddings_cls, llm_cls, retries = ScheduledChatOpenAI, ScheduledOpenAIEmbeddings, ScheduledOpenAI, {"max_retries": 1}
+    else:
+        chat_cls, embeddings_cls, llm_cls, retries = ChatOpenAI, OpenAIEmbeddings, OpenAI, {}
+
+    callbacks: dict = {"callbacks": [get_metrics_handler()]} if metrics else {}
+
+    chat = chat_cls(temperature=chat_temperature, openai_api_key=openai_api_key, request_timeout=timeout, **retries, **callbacks)
+    embeddings = embeddings_cls(openai_api_key=openai_api_key, **retries)
+    llm = llm_cls(model_name=llm_model_name, temperature=llm_temperature, openai_api_key=openai_api_key,
+                  request_timeout=timeout, **retries, **callbacks)
+    return ModelClients(chat, embeddings, llm, session)
+
+#Equivalente assíncrono: uma sessão aiohttp com pool de conexões para todas as chamadas assíncronas feitas dentro do bloco
+#(sem ela, a biblioteca openai abre uma sessão aiohttp nova a cada requisição).
+@asynccontextmanager
+async def shared_aiohttp_session(pool_size: int = None):
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=pool_size or HTTP_POOL_SIZE)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        token = openai.aiosession.set(session)
+        try:
+            yield session
+        finally:
+            openai.aiosession.reset(token)
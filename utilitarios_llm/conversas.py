@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+#Armazenamento persistente de conversas (sessões de chat), para que uma sessão sobreviva ao processo e possa ser
+#retomada por qualquer worker.
+#As mensagens ficam em arquivos SQLite (shards), e cada sessão vai sempre para o mesmo shard (crc32 do session_id), então
+#sessões diferentes raramente disputam o mesmo arquivo. As mensagens são somente adicionadas (append-only): cada uma
+#recebe o próximo número de sequência da sessão, e a chave (session_id, seq) permite adicionar uma mensagem e ler as
+#últimas mensagens sem carregar o histórico inteiro.
+#As sessões usadas recentemente ficam em um LRU em memória, com as últimas hot_messages mensagens. Antes de usar uma
+#sessão do LRU, o último seq gravado é conferido no shard (uma consulta pela chave, sem ler mensagens): se outro
+#worker adicionou mensagens, a sessão é recarregada.
+#Este módulo não depende do langchain; o histórico para o ConversationChain fica em utilitarios_llm/historico_chat.py.
+CONVERSATION_STORE_DIR: str = os.environ.get(
+    "CONVERSATION_STORE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "langchain_study", "conversas")
+)
+CONVERSATION_SHARDS: int = int(os.environ.get("CONVERSATION_SHARDS", "16"))
+CONVERSATION_CACHE_SIZE: int = int(os.environ.get("CONVERSATION_CACHE_SIZE", "1024"))
+CONVERSATION_HOT_MESSAGES: int = int(os.environ.get("CONVERSATION_HOT_MESSAGES", "50"))
+
+#Mensagem de uma conversa. Com __slots__ cada instância ocupa bem menos memória que um objeto com __dict__, o que
+#conta quando o LRU guarda as mensagens de milhares de sessões.
+class ChatMessage:
+    __slots__ = ("who", "msg", "created")
+
+    def __init__(self, who: str, msg: str, created: float = None):
+        self.who = who
+        self.msg = msg
+        self.created = created
+
+    def __str__(self):
+        return f"{self.who}: {self.msg}"
+
+    def __repr__(self):
+        return f"ChatMessage({self.who!r}, {self.msg!r})"
+
+class _Shard:
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        #isolation_level=None: as transações são abertas explicitamente (BEGIN IMMEDIATE) em cada escrita
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                who TEXT NOT NULL,
+                msg TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID
+        """)
+
+    def last_seq(self, session_id: str) -> int:
+        return self.connection.execute("SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0] or 0
+
+#Sessão no LRU: as últimas mensagens e o seq da última delas
+class _Session:
+    __slots__ = ("messages", "last_seq")
+
+    def __init__(self, messages: deque, last_seq: int):
+        self.messages = messages
+        self.last_seq = last_seq
+
+class ConversationStore:
+
+    #shards: número de arquivos SQLite. É gravado em store.json na criação, e as próximas aberturas usam o mesmo valor
+    #(mudar o número de shards mudaria o shard de cada sessão)
+    #cache_size: sessões mantidas em memória; hot_messages: mensagens mantidas por sessão
+    def __init__(self, directory: str = None, shards: int = None, cache_size: int = None, hot_messages: int = None):
+        self.directory: str = directory or CONVERSATION_STORE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.cache_size: int = cache_size or CONVERSATION_CACHE_SIZE
+        self.hot_messages: int = hot_messages or CONVERSATION_HOT_MESSAGES
+        self.shard_count: int = self._load_shard_count(shards)
+        self.shards: list = [
+            _Shard(os.path.join(self.directory, f"shard-{i:03d}.sqlite")) for i in range(self.shard_count)
+        ]
+        self.sessions: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _load_shard_count(self, shards: int) -> int:
+        path: str = os.path.join(self.directory, "store.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                stored: int = json.load(f)["shards"]
+            if shards is not None and shards != stored:
+                raise ValueError(f"O diretório {self.directory} foi criado com {stored} shards, não {shards}")
+            return stored
+        shards = shards or CONVERSATION_SHARDS
+        with open(path, "w") as f:
+            json.dump({"shards": shards}, f)
+        return shards
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self.shards[zlib.crc32(session_id.encode("utf-8")) % self.shard_count]
+
+    def _cache(self, session_id: str, session: _Session):
+        with self.lock:
+            self.sessions[session_id] = session
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.cache_size:
+                self.sessions.popitem(last=False)
+
+    #Adiciona as mensagens ao fim da sessão, em uma única transação. Retorna as mensagens gravadas.
+    def extend(self, session_id: str, messages: list) -> list:
+        messages = [message if isinstance(message, ChatMessage) else ChatMessage(*message) for message in messages]
+        created: float = time.time()
+        for message in messages:
+            if message.created is None:
+                message.created = created
+        shard: _Shard = self._shard(session_id)
+        with shard.lock:
+            #BEGIN IMMEDIATE reserva a escrita no arquivo, então o último seq lido não muda até o COMMIT,
+            #mesmo com outros processos escrevendo na mesma sessão
+            shard.connection.execute("BEGIN IMMEDIATE")
+            try:
+                last: int = shard.last_seq(session_id)
+                shard.connection.executemany(
+                    "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                    [(session_id, last + i, message.who, message.msg, message.created) for i, message in enumerate(messages, start=1)]
+                )
+                shard.connection.execute("COMMIT")
+            except BaseException:
+                shard.connection.execute("ROLLBACK")
+                raise
+
+        with self.lock:
+            session: _Session = self.sessions.get(session_id)
+            if session is not None:
+                if session.last_seq == last:
+                    session.messages.extend(messages)
+                    session.last_seq = last + len(messages)
+                else:
+                    del self.sessions[session_id]
+        return messages
+
+    def append(self, session_id: str, who: str, msg: str) -> ChatMessage:
+        return self.extend(session_id, [ChatMessage(who, msg)])[0]
+
+    def _load_tail(self, shard: _Shard, session_id: str, limit: int) -> list:
+        rows: list = shard.connection.execute(
+            "SELECT who, msg, created FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?", (session_id, limit)
+        ).fetchall()
+        return [ChatMessage(who, msg, created) for who, msg, created in reversed(rows)]
+
+    #As últimas limit mensagens da sessão (por padrão hot_messages), da mais antiga para a mais recente
+    def recent(self, session_id: str, limit: int = None) -> list:
+        limit = self.hot_messages if limit is None else limit
+        if limit <= 0:
+            return []
+        shard: _Shard = self._shard(session_id)
+        if limit > self.hot_messages:
+            with shard.lock:
+                return self._load_tail(shard, session_id, limit)
+
+        with shard.lock:
+            last: int = shard.last_seq(session_id)
+        with self.lock:
+            session: _Session = self.sessions.get(session_id)
+            if session is not None and session.last_seq == last:
+                self.sessions.move_to_end(session_id)
+                self.hits += 1
+                messages: list = list(session.messages)
+                return messages[max(len(messages) - limit, 0):]
+            self.misses += 1
+
+        with shard.lock:
+            messages = self._load_tail(shard, session_id, self.hot_messages)
+            last = shard.last_seq(session_id)
+        self._cache(session_id, _Session(deque(messages, maxlen=self.hot_messages), last))
+        return messages[max(len(messages) - limit, 0):]
+
+    #Todas as mensagens da sessão, lidas do disco em blocos de batch_size (sem passar pelo LRU)
+    def history(self, session_id: str, batch_size: int = 500):
+        shard: _Shard = self._shard(session_id)
+        after: int = 0
+        while True:
+            with shard.lock:
+                rows: list = shard.connection.execute(
+                    "SELECT seq, who, msg, created FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (session_id, after, batch_size)
+                ).fetchall()
+            for _, who, msg, created in rows:
+                yield ChatMessage(who, msg, created)
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
+
+    #Número de mensagens da sessão (as mensagens nunca são removidas individualmente, então é o último seq)
+    def count(self, session_id: str) -> int:
+        shard: _Shard = self._shard(session_id)
+        with shard.lock:
+            return shard.last_seq(session_id)
+
+    def delete(self, session_id: str):
+        shard: _Shard = self._shard(session_id)
+        with shard.lock:
+            shard.connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def close(self):
+        for shard in self.shards:
+            with shard.lock:
+                shard.connection.close()
+
+_store: ConversationStore = None
+_store_lock = threading.Lock()
+
+#Store compartilhado pelo processo, em CONVERSATION_STORE_DIR
+def get_conversation_store() -> ConversationStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore()
+        return _store
@@ -0,0 +1,144 @@
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import AIMessage, BaseChatMessageHistory, BaseMessage, HumanMessage, SystemMessage
+from langchain.schema import ChatMessage as RoleMessage
+
+from utilitarios_llm.conversas import ConversationStore
+from utilitarios_llm.tokens import TOKENS_PER_REPLY, count_message_tokens
+
+#Histórico de chat com orçamento de tokens.
+#Reenviar o histórico inteiro a cada turno faz o prompt (e com ele a latência e o custo) crescer sem limite.
+#O ChatHistoryManager mantém todas as mensagens, mas envia ao modelo somente uma janela que cabe em max_tokens:
+# - "window": as mensagens mais antigas simplesmente saem da janela (sliding window).
+# - "summarize": as mensagens que saem da janela são resumidas pelo summarizer, e o resumo é enviado no lugar delas.
+#A primeira SystemMessage (o contexto inicial do bot) é sempre mantida.
+#Cada mensagem é tokenizada uma única vez, ao ser adicionada, e o total da janela é mantido incrementalmente,
+#então cada turno custa O(1) em tokenização, independentemente do tamanho do histórico.
+class ChatHistoryManager:
+
+    def __init__(self, max_tokens: int = 3000, strategy: str = "window", summarizer: ChatOpenAI = None,
+                 model: str = "gpt-3.5-turbo", messages: list = None):
+        if strategy not in ("window", "summarize"):
+            raise ValueError(f"Estratégia inválida: {strategy}")
+        if strategy == "summarize" and summarizer is None:
+            raise ValueError("A estratégia summarize precisa de um summarizer")
+
+        self.max_tokens = max_tokens
+        self.strategy = strategy
+        self.summarizer = summarizer
+        self.model = model
+
+        self.messages: list = []
+        self.token_counts: list = []
+        self.system_message: SystemMessage = None
+        self.system_tokens: int = 0
+        self.summary: SystemMessage = None
+        self.summary_tokens: int = 0
+        #Índice da primeira mensagem dentro da janela e total de tokens das mensagens da janela
+        self.start: int = 0
+        self.window_tokens: int = 0
+
+        for message in messages or []:
+            self.append(message)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    @property
+    def context_tokens(self) -> int:
+        return self.system_tokens + self.summary_tokens + self.window_tokens + TOKENS_PER_REPLY
+
+    def append(self, message: BaseMessage):
+        if self.system_message is None and not self.messages and isinstance(message, SystemMessage):
+            self.system_message = message
+            self.system_tokens = count_message_tokens(message.content, self.model)
+            self.messages.append(message)
+            self.token_counts.append(self.system_tokens)
+            self.start = 1
+            return
+
+        tokens: int = count_message_tokens(message.content, self.model)
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self.window_tokens += tokens
+        self._trim()
+
+    def _evict_until(self, limit: int) -> list:
+        evicted: list = []
+        #A última mensagem nunca sai da janela, mesmo que sozinha ultrapasse o orçamento
+        while self.context_tokens > limit and self.start < len(self.messages) - 1:
+            evicted.append(self.messages[self.start])
+            self.window_tokens -= self.token_counts[self.start]
+            self.start += 1
+        return evicted
+
+    def _trim(self):
+        if self.context_tokens <= self.max_tokens:
+            return
+
+        if self.strategy == "window":
+            self._evict_until(self.max_tokens)
+            return
+
+        #No summarize a janela é reduzida a 3/4 do orçamento, para que o resumo não precise ser refeito a cada turno.
+        #Se com o resumo novo o contexto ainda passar do orçamento, as mensagens que saem da janela também são resumidas:
+        #nenhuma mensagem sai da janela sem entrar no resumo
+        evicted: list = self._evict_until(self.max_tokens * 3 // 4)
+        while evicted:
+            self._summarize(evicted)
+            evicted = self._evict_until(self.max_tokens)
+
+    def _summarize(self, evicted: list):
+        transcript: str = "\n".join(f"{message.type}: {message.content}" for message in evicted)
+        if self.summary is not None:
+            transcript = f"Previous summary: {self.summary.content}\n{transcript}"
+
+        response = self.summarizer([
+            SystemMessage(content=f"Summarize the following conversation in at most {self.max_tokens // 8} words, "
+                                  "keeping names, facts and decisions."),
+            HumanMessage(content=transcript)
+        ])
+        self.summary = SystemMessage(content=f"Summary of the earlier conversation: {response.content}")
+        self.summary_tokens = count_message_tokens(self.summary.content, self.model)
+
+    #Mensagens que devem ser enviadas ao modelo no próximo turno
+    def context(self) -> list:
+        pinned: list = [message for message in (self.system_message, self.summary) if message is not None]
+        return pinned + self.messages[self.start:]
+
+#Histórico de chat do langchain gravado no ConversationStore (utilitarios_llm/conversas.py), para usar como chat_memory
+#do ConversationBufferMemory: cada mensagem é adicionada ao fim da sessão no disco, e o modelo recebe somente as
+#últimas max_messages mensagens, sem carregar o histórico inteiro. A sessão pode ser retomada por qualquer processo que
+#use o mesmo diretório do store.
+#As mensagens são gravadas com os nomes human_name e ai_name (os mesmos do ChatMessage do quickstart).
+class StoredChatMessageHistory(BaseChatMessageHistory):
+
+    def __init__(self, store: ConversationStore, session_id: str, max_messages: int = None,
+                 human_name: str = "Me", ai_name: str = "Bot"):
+        self.store = store
+        self.session_id = session_id
+        self.max_messages = max_messages
+        self.human_name = human_name
+        self.ai_name = ai_name
+
+    def _to_message(self, message) -> BaseMessage:
+        if message.who == self.human_name:
+            return HumanMessage(content=message.msg)
+        if message.who == self.ai_name:
+            return AIMessage(content=message.msg)
+        return RoleMessage(role=message.who, content=message.msg)
+
+    @property
+    def messages(self) -> list:
+        return [self._to_message(message) for message in self.store.recent(self.session_id, self.max_messages)]
+
+    def add_user_message(self, message: str):
+        self.store.append(self.session_id, self.human_name, message)
+
+    def add_ai_message(self, message: str):
+        self.store.append(self.session_id, self.ai_name, message)
+
+    def clear(self):
+        self.store.delete(self.session_id)
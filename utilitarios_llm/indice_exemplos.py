@@ -0,0 +1,309 @@
+import os
+import json
+import random
+import hashlib
+import threading
+
+import faiss
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.prompts.example_selector.base import BaseExampleSelector
+
+#Índice FAISS persistente para a base de exemplos usada pelos example selectors.
+#Diferente de SemanticSimilarityExampleSelector.from_examples, que embeda todos os exemplos e monta um índice novo a cada
+#execução, aqui o índice é construído uma vez e salvo em disco (index.faiss + examples.json); as próximas execuções
+#somente o carregam. Exemplos podem ser adicionados e removidos incrementalmente: somente os novos são embedados.
+#Com mmap=True o índice é aberto com IO_FLAG_MMAP. No faiss 1.7.4 isso só tem efeito nas listas invertidas dos índices
+#ivf e ivfpq, que passam a ser lidas do disco sob demanda; os índices flat (e hnsw) são sempre lidos inteiros para a memória.
+#As listas mapeadas são somente leitura, então antes da primeira alteração o índice é recarregado sem mmap (ver _writable).
+#Cada exemplo recebe um id estável derivado do seu conteúdo, então adicionar o mesmo exemplo duas vezes não o duplica.
+#Os vetores são normalizados e comparados por produto interno, o que equivale à similaridade de cosseno.
+
+def example_id(example: dict) -> int:
+    digest: bytes = hashlib.sha256(json.dumps(example, sort_keys=True).encode()).digest()
+    #faiss usa ids int64 com sinal; os 63 bits menos significativos garantem um id positivo
+    return int.from_bytes(digest[:8], "little") & 0x7FFFFFFFFFFFFFFF
+
+#Mesmo texto usado pelo SemanticSimilarityExampleSelector do langchain: os valores do exemplo ordenados pela chave
+def example_text(example: dict, input_keys: list = None) -> str:
+    if input_keys:
+        example = {key: example[key] for key in input_keys}
+    return " ".join(example[key] for key in sorted(example))
+
+#Tipos de índice suportados:
+# flat  - busca exata (força bruta). Latência e memória crescem linearmente com o número de exemplos.
+# ivf   - IVF-Flat: agrupa os vetores em nlist clusters e busca somente nos nprobe clusters mais próximos.
+# ivfpq - IVF com product quantization: como o ivf, mas guarda cada vetor comprimido em pq_m códigos de pq_bits bits.
+# hnsw  - grafo HNSW com hnsw_m vizinhos por nó. Não suporta remoção no faiss: exemplos removidos viram "tombstones"
+#         filtrados na busca, até que rebuild() seja chamado.
+#ivf e ivfpq precisam de um passo de treino (ver PersistentExampleIndex.train).
+#Parâmetros de recall x velocidade: nprobe (ivf/ivfpq) e hnsw_ef_search (hnsw); quanto maiores, maior o recall e a latência.
+INDEX_KINDS: tuple = ("flat", "ivf", "ivfpq", "hnsw")
+
+DEFAULT_INDEX_PARAMS: dict = {
+    "nlist": 100,
+    "nprobe": 8,
+    "pq_m": 16,
+    "pq_bits": 8,
+    "hnsw_m": 32,
+    "hnsw_ef_construction": 40,
+    "hnsw_ef_search": 64,
+}
+
+def create_faiss_index(dim: int, kind: str = "flat", params: dict = None):
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    elif kind == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, params["nlist"], faiss.METRIC_INNER_PRODUCT)
+    elif kind == "ivfpq":
+        index = faiss.IndexIVFPQ(
+            faiss.IndexFlatIP(dim), dim, params["nlist"], params["pq_m"], params["pq_bits"], faiss.METRIC_INNER_PRODUCT
+        )
+    elif kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = params["hnsw_ef_construction"]
+        index = faiss.IndexIDMap2(hnsw)
+    else:
+        raise ValueError(f"Tipo de índice inválido: {kind}. Opções: {', '.join(INDEX_KINDS)}")
+
+    set_search_params(index, kind, params)
+    return index
+
+def set_search_params(index, kind: str, params: dict):
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    if kind in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    elif kind == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = params["hnsw_ef_search"]
+
+#Tipo e parâmetros de um índice lido do disco, para os diretórios gravados antes do meta.json
+def infer_index_kind(index) -> tuple:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq", {"nlist": index.nlist, "pq_m": index.pq.M, "pq_bits": index.pq.nbits}
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf", {"nlist": index.nlist}
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSWFlat):
+        return "hnsw", {}
+    if isinstance(inner, faiss.IndexFlat):
+        return "flat", {}
+    raise ValueError(f"Tipo de índice não suportado: {type(inner).__name__}")
+
+def _normalized(vectors: list) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(matrix)
+    return matrix
+
+class PersistentExampleIndex:
+
+    #index_kind e index_params só são usados na criação de um índice novo; um índice existente mantém o tipo
+    #com que foi criado (gravado em meta.json). Para trocar o tipo de um índice existente, use rebuild().
+    def __init__(self, directory: str, embeddings: Embeddings, input_keys: list = None, mmap: bool = True,
+                 index_kind: str = "flat", index_params: dict = None):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.input_keys = input_keys
+        self.index_path = os.path.join(directory, "index.faiss")
+        self.examples_path = os.path.join(directory, "examples.json")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock = threading.RLock()
+        self.index = None
+        self.examples: dict = {}
+        self.index_kind: str = index_kind
+        self.index_params: dict = {**DEFAULT_INDEX_PARAMS, **(index_params or {})}
+        #mmapped: o índice em memória ainda usa as listas mapeadas do arquivo (ver _writable)
+        #modified: há alterações que ainda não foram gravadas por save()
+        self.mmapped: bool = False
+        self.modified: bool = False
+
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.index_path):
+            self.index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP if mmap else 0)
+            #Somente as listas invertidas dos ivf/ivfpq são de fato mapeadas pelo IO_FLAG_MMAP
+            self.mmapped = mmap and isinstance(faiss.downcast_index(self.index), faiss.IndexIVF)
+            if os.path.exists(self.meta_path):
+                with open(self.meta_path) as f:
+                    meta: dict = json.load(f)
+                self.index_kind = meta["index_kind"]
+                self.index_params = {**meta["index_params"], **(index_params or {})}
+            else:
+                #Índice gravado antes do meta.json: o tipo vem do próprio índice, e o meta.json é gravado no próximo save
+                self.index_kind, inferred = infer_index_kind(self.index)
+                self.index_params = {**DEFAULT_INDEX_PARAMS, **inferred, **(index_params or {})}
+                self.modified = True
+            set_search_params(self.index, self.index_kind, self.index_params)
+            with open(self.examples_path) as f:
+                self.examples = {int(id): example for id, example in json.load(f).items()}
+
+    def __len__(self) -> int:
+        return len(self.examples)
+
+    #As listas mapeadas são somente leitura (o faiss aborta o processo ao adicionar nelas), e gravar um índice mapeado
+    #gera um arquivo que aponta para as listas do arquivo antigo. Antes da primeira alteração o índice é recarregado
+    #inteiro para a memória.
+    def _writable(self):
+        if self.mmapped:
+            self.index = faiss.read_index(self.index_path, 0)
+            set_search_params(self.index, self.index_kind, self.index_params)
+            self.mmapped = False
+
+    #Vetores presentes no faiss mas cujos exemplos já foram removidos (somente no hnsw)
+    @property
+    def tombstones(self) -> int:
+        return self.index.ntotal - len(self.examples) if self.index is not None else 0
+
+    def _create_index(self, dim: int):
+        return create_faiss_index(dim, self.index_kind, self.index_params)
+
+    def min_training_size(self) -> int:
+        if self.index_kind == "ivfpq":
+            return max(self.index_params["nlist"], 2 ** self.index_params["pq_bits"])
+        return self.index_params["nlist"]
+
+    def _train(self, vectors: np.ndarray):
+        if len(vectors) < self.min_training_size():
+            raise ValueError(
+                f"O índice {self.index_kind} precisa de pelo menos {self.min_training_size()} vetores para treino, "
+                f"recebeu {len(vectors)}. Use train() com uma amostra maior ou um índice flat."
+            )
+        self.index.train(vectors)
+
+    #Treina os índices ivf/ivfpq com uma amostra aleatória dos exemplos. Deve ser chamado antes do primeiro
+    #add_examples quando o primeiro lote adicionado não for representativo (ou for pequeno demais para o treino).
+    def train(self, examples: list, sample_size: int = 10000):
+        with self.lock:
+            sample: list = random.sample(examples, min(sample_size, len(examples)))
+            vectors = _normalized(self.embeddings.embed_documents([example_text(e, self.input_keys) for e in sample]))
+            if self.index is None:
+                self.index = self._create_index(vectors.shape[1])
+            if not self.index.is_trained:
+                self._writable()
+                self._train(vectors)
+                self.modified = True
+
+    def set_search_params(self, **params):
+        with self.lock:
+            self.index_params.update(params)
+            if self.index is not None:
+                set_search_params(self.index, self.index_kind, self.index_params)
+
+    #Recria o índice a partir dos exemplos atuais (os embeddings vêm do cache), opcionalmente com outro tipo/parâmetros.
+    #Também elimina os tombstones do hnsw.
+    def rebuild(self, index_kind: str = None, index_params: dict = None):
+        with self.lock:
+            examples: list = list(self.examples.values())
+            self.index_kind = index_kind or self.index_kind
+            self.index_params.update(index_params or {})
+            self.index = None
+            self.mmapped = False
+            self.modified = True
+            self.examples = {}
+            if examples and self.index_kind in ("ivf", "ivfpq"):
+                self.train(examples)
+            self.add_examples(examples)
+
+    def add_examples(self, examples: list) -> list:
+        with self.lock:
+            ids: list = [example_id(example) for example in examples]
+            new: dict = {id: example for id, example in zip(ids, examples) if id not in self.examples}
+            #No hnsw, um exemplo removido continua no faiss com o mesmo id (o id vem do conteúdo, então o vetor é o mesmo):
+            #ele volta a valer sem ser adicionado de novo, o que duplicaria o id no IndexIDMap2
+            revived: dict = {id: example for id, example in new.items() if id in self._tombstone_ids()}
+            if revived:
+                self.examples.update(revived)
+                self.modified = True
+                new = {id: example for id, example in new.items() if id not in revived}
+            if new:
+                #Com CachedEmbeddings, mesmo exemplos removidos e adicionados novamente não são embedados de novo
+                vectors = _normalized(self.embeddings.embed_documents([example_text(e, self.input_keys) for e in new.values()]))
+                if self.index is None:
+                    self.index = self._create_index(vectors.shape[1])
+                self._writable()
+                if not self.index.is_trained:
+                    self._train(vectors)
+                self.index.add_with_ids(vectors, np.array(list(new), dtype=np.int64))
+                self.examples.update(new)
+                self.modified = True
+            return ids
+
+    #Ids dos tombstones do hnsw: presentes no faiss, mas sem exemplo
+    def _tombstone_ids(self) -> set:
+        if self.index_kind != "hnsw" or not self.tombstones:
+            return set()
+        return {int(id) for id in faiss.vector_to_array(self.index.id_map)} - set(self.examples)
+
+    def remove_examples(self, examples: list) -> int:
+        return self.remove_ids([example_id(example) for example in examples])
+
+    def remove_ids(self, ids: list) -> int:
+        with self.lock:
+            ids = [id for id in ids if id in self.examples]
+            if ids:
+                #O hnsw do faiss não suporta remoção: o vetor fica no índice e é ignorado na busca
+                if self.index_kind != "hnsw":
+                    self._writable()
+                    self.index.remove_ids(np.array(ids, dtype=np.int64))
+                for id in ids:
+                    del self.examples[id]
+                self.modified = True
+            return len(ids)
+
+    #Deixa o índice com exatamente os exemplos informados, adicionando os novos e removendo os que saíram da lista
+    def sync(self, examples: list):
+        with self.lock:
+            self.add_examples(examples)
+            wanted: set = {example_id(example) for example in examples}
+            self.remove_ids([id for id in self.examples if id not in wanted])
+
+    def search(self, query: str, k: int = 4) -> list:
+        return [(example, score) for _, example, score in self.search_with_ids(query, k)]
+
+    #Como search, mas retorna também o id de cada exemplo: [(id, exemplo, score)]
+    def search_with_ids(self, query: str, k: int = 4) -> list:
+        with self.lock:
+            if not self.examples:
+                return []
+            vector = _normalized([self.embeddings.embed_query(query)])
+            scores, ids = self.index.search(vector, min(k + self.tombstones, self.index.ntotal))
+            return [(int(id), self.examples[id], float(score)) for id, score in zip(ids[0], scores[0]) if id in self.examples][:k]
+
+    def save(self):
+        #Grava em arquivos temporários e substitui, para que um processo lendo o índice nunca veja um arquivo pela metade.
+        #Sem alterações desde a abertura (ou desde o último save) não há o que gravar.
+        with self.lock:
+            if self.index is None or not self.modified:
+                return
+            self._writable()
+            faiss.write_index(self.index, f"{self.index_path}.tmp")
+            with open(f"{self.examples_path}.tmp", "w") as f:
+                json.dump({str(id): example for id, example in self.examples.items()}, f)
+            with open(f"{self.meta_path}.tmp", "w") as f:
+                json.dump({"index_kind": self.index_kind, "index_params": self.index_params}, f)
+            os.replace(f"{self.index_path}.tmp", self.index_path)
+            os.replace(f"{self.examples_path}.tmp", self.examples_path)
+            os.replace(f"{self.meta_path}.tmp", self.meta_path)
+            self.modified = False
+
+#Example selector do langchain apoiado no PersistentExampleIndex. Pode ser usado no FewShotPromptTemplate
+#no lugar do SemanticSimilarityExampleSelector.
+class PersistentSemanticExampleSelector(BaseExampleSelector):
+
+    def __init__(self, index: PersistentExampleIndex, k: int = 4, example_keys: list = None):
+        self.index = index
+        self.k = k
+        self.example_keys = example_keys
+
+    def add_example(self, example: dict) -> int:
+        return self.index.add_examples([example])[0]
+
+    def select_examples(self, input_variables: dict) -> list:
+        if self.index.input_keys:
+            input_variables = {key: input_variables[key] for key in self.index.input_keys}
+        query: str = " ".join(input_variables[key] for key in sorted(input_variables))
+        examples: list = [dict(example) for example, _ in self.index.search(query, self.k)]
+        if self.example_keys:
+            examples = [{key: example[key] for key in self.example_keys} for example in examples]
+        return examples
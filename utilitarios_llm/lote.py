@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+#Execução em lote (não interativa) das funções de quickstart, cookbook01 e selector.
+#Cada linha da entrada (JSONL, de um arquivo ou do stdin) é um registro: {"id": ..., "op": "nome", ...parâmetros}.
+#"op" escolhe a operação no dicionário de operações do script (nome -> função) e os demais campos são passados à
+#função como argumentos nomeados. Sem "id", o número da linha é usado; sem "op", vale a operação padrão (--op).
+#Os registros são executados por um pool de workers, com prioridade de lote no agendador (as chamadas interativas
+#continuam passando na frente), e os resultados são gravados em JSONL à medida que terminam (fora de ordem):
+#{"id": ..., "op": ..., "ok": true, "result": ..., "seconds": ...} ou {"id": ..., "op": ..., "ok": false, "error": ...}.
+#O checkpoint guarda os ids já concluídos com sucesso, um por linha; ao rodar de novo com o mesmo checkpoint, esses
+#registros são pulados (os que falharam são executados de novo). A vazão é mostrada no stderr a cada report_interval.
+#Exemplo: python quickstart/quickstart.py --batch entradas.jsonl --output saida.jsonl --workers 8
+BATCH_WORKERS: int = int(os.environ.get("BATCH_WORKERS", "8"))
+BATCH_REPORT_INTERVAL: float = float(os.environ.get("BATCH_REPORT_INTERVAL", "10"))
+
+class BatchStats:
+
+    def __init__(self):
+        self.start: float = time.perf_counter()
+        self.done: int = 0
+        self.errors: int = 0
+        self.skipped: int = 0
+        self.busy_seconds: float = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    @property
+    def throughput(self) -> float:
+        elapsed: float = self.elapsed
+        return (self.done + self.errors) / elapsed if elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        processed: int = self.done + self.errors
+        return {
+            "done": self.done, "errors": self.errors, "skipped": self.skipped, "elapsed_s": round(self.elapsed, 3),
+            "throughput_per_s": round(self.throughput, 3),
+            "mean_seconds": round(self.busy_seconds / processed, 4) if processed else 0.0,
+        }
+
+    def __str__(self):
+        return (
+            f"{self.done} ok, {self.errors} erros, {self.skipped} pulados em {self.elapsed:.1f}s "
+            f"({self.throughput:.2f} registros/s)"
+        )
+
+#Lê os registros da entrada, retornando (id, registro ou None, erro de parse)
+def read_records(lines) -> iter:
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("o registro deve ser um objeto JSON")
+        except ValueError as e:
+            yield str(number), None, f"{type(e).__name__}: {e}"
+            continue
+        yield str(record.pop("id", number)), record, None
+
+def load_checkpoint(path: str) -> set:
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.rstrip("\n") for line in f if line.endswith("\n")}
+
+class BatchRunner:
+
+    #operations: nome da operação -> função chamada com os campos do registro
+    def __init__(self, operations: dict, default_op: str = None, workers: int = None, checkpoint_path: str = None,
+                 report_interval: float = None, report_stream=None):
+        self.operations = operations
+        self.default_op = default_op
+        self.workers: int = workers or BATCH_WORKERS
+        self.checkpoint_path = checkpoint_path
+        self.report_interval: float = BATCH_REPORT_INTERVAL if report_interval is None else report_interval
+        self.report_stream = report_stream or sys.stderr
+        self.stats = BatchStats()
+
+    def _execute(self, op: str, params: dict):
+        #Importado aqui: o agendador carrega o langchain (via metricas), e add_batch_arguments é usado antes do menu
+        from utilitarios_llm.agendador import PRIORITY_BATCH, request_priority
+
+        function = self.operations.get(op)
+        if function is None:
+            raise ValueError(f"Operação desconhecida: {op!r} (disponíveis: {', '.join(sorted(self.operations))})")
+        with request_priority(PRIORITY_BATCH):
+            return function(**params)
+
+    def _run_record(self, op: str, params: dict) -> tuple:
+        start: float = time.perf_counter()
+        try:
+            return self._execute(op, params), None, time.perf_counter() - start
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+    def _write(self, output, checkpoint, id: str, op: str, result, error: str, seconds: float):
+        if error is None:
+            line: dict = {"id": id, "op": op, "ok": True, "result": result, "seconds": round(seconds, 4)}
+            self.stats.done += 1
+        else:
+            line = {"id": id, "op": op, "ok": False, "error": error, "seconds": round(seconds, 4)}
+            self.stats.errors += 1
+        self.stats.busy_seconds += seconds
+        output.write(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+        output.flush()
+        #O id só entra no checkpoint depois que o resultado foi gravado
+        if checkpoint is not None and error is None:
+            checkpoint.write(f"{id}\n")
+            checkpoint.flush()
+
+    def _report(self, final: bool = False):
+        print(f"{'concluído' if final else 'lote'}: {self.stats}", file=self.report_stream, flush=True)
+
+    def run(self, lines, output) -> BatchStats:
+        completed: set = load_checkpoint(self.checkpoint_path)
+        checkpoint = open(self.checkpoint_path, "a") if self.checkpoint_path else None
+        #Limita os registros lidos e ainda não concluídos, para não carregar uma entrada grande inteira na memória
+        max_pending: int = self.workers * 2
+        pending: dict = {}
+        last_report: float = time.perf_counter()
+
+        def collect(timeout: float = None):
+            nonlocal last_report
+            finished, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in finished:
+                id, op = pending.pop(future)
+                self._write(output, checkpoint, id, op, *future.result())
+            if self.report_interval and time.perf_counter() - last_report >= self.report_interval:
+                self._report()
+                last_report = time.perf_counter()
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch")
+        try:
+            for id, record, error in read_records(lines):
+                if id in completed:
+                    self.stats.skipped += 1
+                    continue
+                if error is not None:
+                    self._write(output, checkpoint, id, None, None, error, 0.0)
+                    continue
+                op: str = record.pop("op", self.default_op)
+                while len(pending) >= max_pending:
+                    collect()
+                pending[pool.submit(self._run_record, op, record)] = (id, op)
+            while pending:
+                collect()
+        except KeyboardInterrupt:
+            #Os registros em execução terminam e são gravados; os demais ficam para a próxima execução
+            print("interrompido, aguardando os registros em execução...", file=self.report_stream, flush=True)
+            for future in pending:
+                future.cancel()
+            for future in list(pending):
+                if future.cancelled():
+                    del pending[future]
+            while pending:
+                collect()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            if checkpoint is not None:
+                checkpoint.close()
+        self._report(final=True)
+        return self.stats
+
+def add_batch_arguments(parser: argparse.ArgumentParser, operations: dict):
+    parser.add_argument("--batch", metavar="ENTRADA", help="executa em lote os registros JSONL do arquivo (- para stdin)")
+    parser.add_argument("--output", default="-", help="arquivo JSONL de saída (padrão: stdout)")
+    parser.add_argument("--op", choices=sorted(operations), help="operação dos registros sem o campo op")
+    parser.add_argument("--workers", type=int, default=None, help=f"workers em paralelo (padrão: {BATCH_WORKERS})")
+    parser.add_argument("--checkpoint", help="arquivo de checkpoint (padrão: <output>.checkpoint quando output é um arquivo)")
+
+#Executa o lote descrito pelos argumentos de add_batch_arguments.
+#As funções imprimem o progresso no stdout; durante o lote esses prints vão para o stderr, para não misturar com o JSONL.
+def run_batch_from_args(args, operations: dict) -> BatchStats:
+    checkpoint_path: str = args.checkpoint or (f"{args.output}.checkpoint" if args.output != "-" else None)
+    runner = BatchRunner(operations, default_op=args.op, workers=args.workers, checkpoint_path=checkpoint_path)
+
+    stdout = sys.stdout
+    output = stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    lines = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    sys.stdout = sys.stderr
+    try:
+        return runner.run(lines, output)
+    finally:
+        sys.stdout = stdout
+        if lines is not sys.stdin:
+            lines.close()
+        if output is not stdout:
+            output.close()
@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import bisect
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from utilitarios_llm.tokens import count_tokens
+
+#Métricas das chamadas aos modelos, num registro em memória do processo:
+# - duração, tokens (prompt e completion) e custo estimado de cada chamada de LLM, chat e embeddings
+# - chamadas e duração das tools do agent
+# - acertos e falhas dos caches (respostas, embeddings, tools) e repetições feitas pelo agendador
+#As chamadas de LLM, chat e tools são medidas por um callback handler (MetricsCallbackHandler), que os models de
+#utilitarios_llm/clientes.py e o agent de utilitarios_llm/agente.py já recebem; embeddings, caches e repetições
+#registram direto no registro. O registro pode ser exportado no formato texto do Prometheus ou em JSON, e
+#start_metrics_server expõe os dois por HTTP (/metrics e /metrics.json).
+DEFAULT_BUCKETS: tuple = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+#Preço em dólares por 1000 tokens: (prompt, completion)
+MODEL_PRICES: dict = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "text-davinci-003": (0.02, 0.02),
+    "text-davinci-002": (0.02, 0.02),
+    "text-embedding-ada-002": (0.0001, 0.0),
+}
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int = 0) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        #Versões datadas (ex: gpt-3.5-turbo-0613) usam o preço do modelo base
+        prices = next((price for name, price in sorted(MODEL_PRICES.items(), key=lambda item: -len(item[0])) if model.startswith(name)), None)
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1000
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+class Counter:
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> list:
+        with self.lock:
+            return [(self.name, dict(key), value) for key, value in self.values.items()]
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets: tuple = tuple(buckets)
+        #labels -> [contagem por bucket, soma, contagem]
+        self.values: dict = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index: int = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> list:
+        samples: list = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                labels: dict = dict(key)
+                cumulative: int = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", {**labels, "le": str(bound)}, cumulative))
+                samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, count))
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+    def summary(self) -> list:
+        with self.lock:
+            return [
+                {"labels": dict(key), "count": count, "sum": round(total, 6), "mean": round(total / count, 6) if count else 0.0}
+                for key, (_, total, count) in self.values.items()
+            ]
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics: dict = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Counter(name, help)
+            return self.metrics[name]
+
+    def histogram(self, name: str, help: str = "", buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Histogram(name, help, buckets)
+            return self.metrics[name]
+
+    def reset(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                with metric.lock:
+                    metric.values.clear()
+
+_registry: MetricsRegistry = MetricsRegistry()
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items())) + "}"
+
+def export_prometheus(registry: MetricsRegistry = None) -> str:
+    registry = registry or _registry
+    lines: list = []
+    for metric in list(registry.metrics.values()):
+        kind: str = "histogram" if isinstance(metric, Histogram) else "counter"
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def export_json(registry: MetricsRegistry = None) -> str:
+    registry = registry or _registry
+    data: dict = {}
+    for metric in list(registry.metrics.values()):
+        if isinstance(metric, Histogram):
+            data[metric.name] = metric.summary()
+        else:
+            data[metric.name] = [{"labels": labels, "value": value} for _, labels, value in metric.samples()]
+    return json.dumps(data, indent=2)
+
+#Métricas usadas pelos módulos de utilitarios_llm
+LLM_CALLS = _registry.counter("llm_calls_total", "Chamadas a modelos de LLM e chat")
+LLM_DURATION = _registry.histogram("llm_call_duration_seconds", "Duração das chamadas a modelos de LLM e chat")
+LLM_PROMPT_TOKENS = _registry.counter("llm_prompt_tokens_total", "Tokens de prompt enviados")
+LLM_COMPLETION_TOKENS = _registry.counter("llm_completion_tokens_total", "Tokens gerados")
+LLM_COST = _registry.counter("llm_cost_usd_total", "Custo estimado em dólares")
+EMBEDDING_CALLS = _registry.counter("embedding_calls_total", "Chamadas à API de embeddings")
+EMBEDDING_DURATION = _registry.histogram("embedding_call_duration_seconds", "Duração das chamadas à API de embeddings")
+EMBEDDING_TEXTS = _registry.counter("embedding_texts_total", "Textos enviados para embedding")
+TOOL_CALLS = _registry.counter("tool_calls_total", "Chamadas às tools do agent")
+TOOL_DURATION = _registry.histogram("tool_call_duration_seconds", "Duração das chamadas às tools do agent")
+CACHE_REQUESTS = _registry.counter("cache_requests_total", "Consultas aos caches, por resultado (hit ou miss)")
+RETRIES = _registry.counter("llm_retries_total", "Repetições de chamadas feitas pelo agendador")
+SCHEDULER_WAIT = _registry.histogram("scheduler_wait_seconds", "Tempo de espera na fila do agendador")
+SEMANTIC_CACHE_SCORE = _registry.histogram(
+    "semantic_cache_hit_score", "Similaridade entre o prompt e o prompt encontrado nos hits do cache semântico",
+    buckets=(0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0)
+)
+SEMANTIC_CACHE_SAVED = _registry.counter("semantic_cache_saved_seconds_total", "Latência economizada pelos hits do cache semântico")
+
+def record_cache(cache: str, hit: bool, amount: int = 1):
+    if amount:
+        CACHE_REQUESTS.inc(amount, cache=cache, result="hit" if hit else "miss")
+
+#Hit do cache semântico: a similaridade do prompt encontrado e os segundos economizados (duração da chamada original
+#menos o tempo da consulta)
+def record_semantic_hit(score: float, saved_seconds: float):
+    SEMANTIC_CACHE_SCORE.observe(score)
+    SEMANTIC_CACHE_SAVED.inc(saved_seconds)
+
+def record_retry(reason: str):
+    RETRIES.inc(reason=reason)
+
+def record_embedding(model: str, seconds: float, texts: list, error: bool = False):
+    status: str = "error" if error else "ok"
+    EMBEDDING_CALLS.inc(model=model, status=status)
+    EMBEDDING_DURATION.observe(seconds, model=model)
+    if not error:
+        tokens: int = sum(count_tokens(text, model) for text in texts)
+        EMBEDDING_TEXTS.inc(len(texts), model=model)
+        LLM_PROMPT_TOKENS.inc(tokens, model=model)
+        LLM_COST.inc(estimate_cost(model, tokens), model=model)
+
+#Callback handler que mede cada chamada de LLM, chat e tool.
+#O mesmo handler pode receber o mesmo evento mais de uma vez (quando está tanto no model quanto no agent/chain que o
+#chama); os eventos são identificados pelo run_id, então cada chamada é contada uma única vez.
+#recent guarda as últimas chamadas, para inspeção.
+class MetricsCallbackHandler(BaseCallbackHandler):
+
+    def __init__(self, recent_size: int = 1000):
+        self.starts: dict = {}
+        self.lock = threading.Lock()
+        self.recent: deque = deque(maxlen=recent_size)
+
+    def _start(self, run_id, **data):
+        with self.lock:
+            if run_id not in self.starts:
+                self.starts[run_id] = {"start": time.perf_counter(), **data}
+
+    def _finish(self, run_id) -> dict:
+        with self.lock:
+            return self.starts.pop(run_id, None)
+
+    def on_llm_start(self, serialized: dict, prompts: list, run_id=None, **kwargs):
+        name: str = (serialized or {}).get("name", "")
+        self._start(run_id, kind="chat" if "Chat" in name else "completion", prompts=prompts)
+
+    def on_llm_end(self, response, run_id=None, **kwargs):
+        started: dict = self._finish(run_id)
+        if started is None:
+            return
+        seconds: float = time.perf_counter() - started["start"]
+        llm_output: dict = response.llm_output or {}
+        model: str = llm_output.get("model_name", "unknown")
+        usage: dict = llm_output.get("token_usage") or {}
+        #Com streaming a API não informa o uso de tokens; nesse caso os tokens são contados com o tiktoken
+        prompt_tokens: int = usage.get("prompt_tokens") or sum(count_tokens(prompt, model) for prompt in started["prompts"])
+        completion_tokens: int = usage.get("completion_tokens") or sum(
+            count_tokens(generation.text, model) for generations in response.generations for generation in generations
+        )
+        cost: float = estimate_cost(model, prompt_tokens, completion_tokens)
+        LLM_CALLS.inc(model=model, kind=started["kind"], status="ok")
+        LLM_DURATION.observe(seconds, model=model, kind=started["kind"])
+        LLM_PROMPT_TOKENS.inc(prompt_tokens, model=model)
+        LLM_COMPLETION_TOKENS.inc(completion_tokens, model=model)
+        LLM_COST.inc(cost, model=model)
+        self.recent.append({
+            "type": started["kind"], "model": model, "seconds": round(seconds, 6), "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens, "cost_usd": cost,
+        })
+
+    def on_llm_error(self, error, run_id=None, **kwargs):
+        started: dict = self._finish(run_id)
+        if started is None:
+            return
+        seconds: float = time.perf_counter() - started["start"]
+        LLM_CALLS.inc(model="unknown", kind=started["kind"], status="error")
+        LLM_DURATION.observe(seconds, model="unknown", kind=started["kind"])
+        self.recent.append({"type": started["kind"], "seconds": round(seconds, 6), "error": f"{type(error).__name__}: {error}"})
+
+    def on_tool_start(self, serialized: dict, input_str: str, run_id=None, **kwargs):
+        self._start(run_id, tool=(serialized or {}).get("name", "unknown"))
+
+    def _tool_finished(self, run_id, status: str):
+        started: dict = self._finish(run_id)
+        if started is None:
+            return
+        seconds: float = time.perf_counter() - started["start"]
+        TOOL_CALLS.inc(tool=started["tool"], status=status)
+        TOOL_DURATION.observe(seconds, tool=started["tool"])
+        self.recent.append({"type": "tool", "tool": started["tool"], "seconds": round(seconds, 6), "status": status})
+
+    def on_tool_end(self, output: str, run_id=None, **kwargs):
+        self._tool_finished(run_id, "ok")
+
+    def on_tool_error(self, error, run_id=None, **kwargs):
+        self._tool_finished(run_id, "error")
+
+_handler: MetricsCallbackHandler = MetricsCallbackHandler()
+
+def get_metrics_handler() -> MetricsCallbackHandler:
+    return _handler
+
+class _MetricsHTTPHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            payload, content_type = export_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            payload, content_type = export_json().encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+#Servidor HTTP em uma thread daemon com /metrics (Prometheus) e /metrics.json
+def start_metrics_server(port: int = None, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    port = int(os.environ.get("LLM_METRICS_PORT", "9464")) if port is None else port
+    server = ThreadingHTTPServer((host, port), _MetricsHTTPHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="llm-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+
+from langchain.prompts import PromptTemplate
+from langchain.prompts.example_selector.base import BaseExampleSelector
+
+from utilitarios_llm.indice_exemplos import PersistentExampleIndex, example_id, example_text
+from utilitarios_llm.templates import EXAMPLE_BLOCK_CACHE_SIZE
+from utilitarios_llm.tokens import count_tokens
+
+#Seleção de exemplos few-shot por orçamento de tokens, em vez de um k fixo.
+#Os exemplos candidatos são buscados por similaridade (no PersistentExampleIndex ou em uma vector store do langchain) e
+#adicionados em ordem de similaridade enquanto couberem no orçamento; um exemplo grande demais é pulado e a seleção
+#continua com o próximo. O tamanho de cada exemplo é medido com o tiktoken sobre o texto já formatado com o
+#example_prompt, e esse texto fica em cache por id de exemplo (ExampleBlockCache): com o CachedFewShotPromptTemplate
+#(utilitarios_llm/templates.py) a montagem do prompt passa a ser só a concatenação de blocos já prontos.
+class ExampleBlockCache:
+
+    def __init__(self, example_prompt: PromptTemplate, model: str = "text-davinci-003", max_entries: int = None):
+        self.example_prompt = example_prompt
+        self.model = model
+        self.max_entries: int = max_entries or EXAMPLE_BLOCK_CACHE_SIZE
+        self.blocks: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    #Retorna (texto formatado, tokens) do exemplo
+    def get(self, example: dict, id: int = None) -> tuple:
+        id = example_id(example) if id is None else id
+        with self.lock:
+            block = self.blocks.get(id)
+            if block is not None:
+                self.blocks.move_to_end(id)
+                return block
+        text: str = self.example_prompt.format(**example)
+        block = (text, count_tokens(text, self.model))
+        with self.lock:
+            self.blocks[id] = block
+            while len(self.blocks) > self.max_entries:
+                self.blocks.popitem(last=False)
+        return block
+
+class TokenBudgetExampleSelector(BaseExampleSelector):
+
+    #store: PersistentExampleIndex ou VectorStore (ex: SemanticSimilarityExampleSelector.from_examples(...).vectorstore)
+    #max_tokens: orçamento para os exemplos, incluindo os separadores entre eles
+    #max_candidates: quantos exemplos mais similares são considerados antes de aplicar o orçamento
+    def __init__(self, store, example_prompt: PromptTemplate, max_tokens: int = 256, max_candidates: int = 20,
+                 input_keys: list = None, example_keys: list = None, example_separator: str = "\n\n",
+                 model: str = "text-davinci-003", blocks: ExampleBlockCache = None):
+        self.store = store
+        self.max_tokens = max_tokens
+        self.max_candidates = max_candidates
+        self.input_keys = input_keys
+        self.example_keys = example_keys
+        self.model = model
+        self.blocks: ExampleBlockCache = blocks or ExampleBlockCache(example_prompt, model)
+        self.separator_tokens: int = count_tokens(example_separator, model) if example_separator else 0
+
+    def add_example(self, example: dict):
+        if isinstance(self.store, PersistentExampleIndex):
+            return self.store.add_examples([example])[0]
+        return self.store.add_texts([example_text(example, self.input_keys)], metadatas=[example])[0]
+
+    #[(id, exemplo)] em ordem de similaridade
+    def _candidates(self, query: str) -> list:
+        if isinstance(self.store, PersistentExampleIndex):
+            return [(id, example) for id, example, _ in self.store.search_with_ids(query, self.max_candidates)]
+        documents: list = self.store.similarity_search(query, k=self.max_candidates)
+        return [(example_id(document.metadata), document.metadata) for document in documents]
+
+    def _query(self, input_variables: dict) -> str:
+        if self.input_keys:
+            input_variables = {key: input_variables[key] for key in self.input_keys}
+        return " ".join(input_variables[key] for key in sorted(input_variables))
+
+    #Retorna [(exemplo, texto formatado)] dos exemplos selecionados
+    def _select(self, input_variables: dict) -> list:
+        selected: list = []
+        used: int = 0
+        for id, example in self._candidates(self._query(input_variables)):
+            if self.example_keys:
+                example = {key: example[key] for key in self.example_keys}
+            text, tokens = self.blocks.get(example, id if not self.example_keys else None)
+            cost: int = tokens + (self.separator_tokens if selected else 0)
+            if used + cost > self.max_tokens:
+                continue
+            selected.append((example, text))
+            used += cost
+        return selected
+
+    def select_examples(self, input_variables: dict) -> list:
+        return [example for example, _ in self._select(input_variables)]
+
+    #Textos já formatados dos exemplos selecionados (usado pelo CachedFewShotPromptTemplate)
+    def select_blocks(self, input_variables: dict) -> list:
+        return [text for _, text in self._select(input_variables)]
@@ -0,0 +1,350 @@
+import io
+import os
+import json
+import inspect
+import math
+import time
+import signal
+import argparse
+import itertools
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import wait as wait_futures
+
+#Modo servidor (API HTTP local) de quickstart e cookbook01.
+#Cada operação do modo lote e cada LangChainTest.test_* vira um endpoint: POST /<operação> com os parâmetros em um
+#objeto JSON (os test_* não têm parâmetros; o que eles imprimem volta no campo "output").
+#As requisições são atendidas por um pool de processos criado (fork) na inicialização: cada worker chama a factory uma
+#única vez e reaproveita os clients, a sessão HTTP e os caches em memória que ela cria em todas as requisições que
+#atende, e executa uma requisição por vez. Com processos, as requisições não disputam o GIL nem o stdout.
+#O processo principal só recebe as requisições HTTP e as repassa aos workers (ele não importa o langchain).
+#Contrapressão: no máximo workers + queue_size requisições ficam em andamento (executando ou na fila); acima disso a
+#resposta é 503 com Retry-After, estimado pelo tempo médio das requisições e pelo tamanho da fila.
+#Encerramento (SIGTERM ou Ctrl+C): o servidor para de aceitar requisições (503), espera as que estão em andamento
+#terminarem por até drain_timeout segundos e então encerra os workers.
+#Se um worker morre, a requisição que ele executava recebe 502 e um worker novo é criado no lugar.
+#Cada worker ocupa uma posição fixa do pool (0 a workers - 1, herdada pelo worker que o substitui), informada em
+#SERVER_WORKER_SLOT: os caches em disco que aceitam um único processo escritor (ex: o cache semântico) usam
+#worker_directory para ter um diretório por worker.
+#Endpoints: GET /health (estado do pool), GET /operations, POST /<operação> (ver utilitarios_llm/servidor_http.py).
+#multiprocessing e o servidor HTTP são importados somente ao iniciar o servidor, já que add_server_arguments é usado
+#antes do menu (ver benchmarks/benchmark_importacao.py).
+#Exemplo: python quickstart/quickstart.py --serve 8080 --server-workers 4
+#         curl -X POST localhost:8080/answer_simple_question -d '{"question": "..."}'
+SERVER_PORT: int = int(os.environ.get("SERVER_PORT", "8080"))
+SERVER_WORKERS: int = int(os.environ.get("SERVER_WORKERS", str(min(os.cpu_count() or 1, 8))))
+SERVER_QUEUE_SIZE: int = int(os.environ.get("SERVER_QUEUE_SIZE", "32"))
+SERVER_REQUEST_TIMEOUT: float = float(os.environ.get("SERVER_REQUEST_TIMEOUT", "300"))
+SERVER_DRAIN_TIMEOUT: float = float(os.environ.get("SERVER_DRAIN_TIMEOUT", "30"))
+WORKER_SLOT_VARIABLE: str = "SERVER_WORKER_SLOT"
+
+class Overloaded(Exception):
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class WorkerCrashed(Exception):
+    pass
+
+#Operação desconhecida ou parâmetros que não correspondem à assinatura da operação (faltando ou desconhecidos)
+class InvalidRequest(Exception):
+    pass
+
+#Operações dos métodos test_* de um LangChainTest (nome do método -> método)
+def test_operations(instance) -> dict:
+    return {name: getattr(instance, name) for name in dir(instance) if name.startswith("test_")}
+
+#Confere os parâmetros com a assinatura da operação antes de executá-la: um TypeError levantado dentro da operação é um
+#erro dela (500), e não da requisição (400)
+def _check_params(operations: dict, op: str, params: dict):
+    if op not in operations:
+        raise InvalidRequest(f"Operação desconhecida: {op!r}")
+    try:
+        signature: inspect.Signature = inspect.signature(operations[op])
+    except (TypeError, ValueError):
+        #Sem assinatura (ex: funções em C) os parâmetros não são conferidos
+        return
+    try:
+        signature.bind(**params)
+    except TypeError as e:
+        raise InvalidRequest(f"Parâmetros inválidos para {op}: {e}")
+
+#Subdiretório de directory exclusivo do worker atual (directory fora dos workers do pool)
+def worker_directory(directory: str) -> str:
+    slot: str = os.environ.get(WORKER_SLOT_VARIABLE)
+    return directory if slot is None else os.path.join(directory, f"worker-{slot}")
+
+def _worker_main(factory, connection, slot: int):
+    os.environ[WORKER_SLOT_VARIABLE] = str(slot)
+    #Ctrl+C no terminal chega a todo o grupo de processos; quem decide o encerramento é o processo principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        operations: dict = factory()
+    except Exception as e:
+        connection.send(("failed", f"{type(e).__name__}: {e}"))
+        return
+    connection.send(("ready", sorted(operations)))
+
+    parent: int = os.getppid()
+    while True:
+        #Os workers herdam (fork) as pontas dos pipes dos outros workers, então o EOF não basta para saber que o
+        #processo principal morreu
+        if not connection.poll(1.0):
+            if os.getppid() != parent:
+                return
+            continue
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        id, op, params = task
+        try:
+            _check_params(operations, op, params)
+        except InvalidRequest as e:
+            connection.send(("invalid", id, str(e)))
+            continue
+        output = io.StringIO()
+        start: float = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(output):
+                result = operations[op](**params)
+            #O resultado é convertido para JSON aqui: um objeto que não pode ser serializado viraria um erro no processo
+            #principal, longe da operação que o gerou
+            message: tuple = ("done", id, True, json.loads(json.dumps(result, ensure_ascii=False, default=str)))
+        except Exception as e:
+            message = ("done", id, False, f"{type(e).__name__}: {e}")
+        connection.send(message + (output.getvalue(), time.perf_counter() - start))
+
+#Worker do pool, visto pelo processo principal: o processo, a ponta do pipe, a posição no pool e a requisição em execução
+class _Worker:
+
+    def __init__(self, process, connection, slot: int):
+        self.process = process
+        self.connection = connection
+        self.slot = slot
+        self.ready: bool = False
+        self.task: int = None
+
+class WorkerPool:
+
+    #factory: função sem argumentos, chamada uma vez em cada worker, que retorna as operações (nome -> função)
+    def __init__(self, factory, workers: int = None, queue_size: int = None):
+        self.factory = factory
+        self.size: int = workers or SERVER_WORKERS
+        self.queue_size: int = SERVER_QUEUE_SIZE if queue_size is None else queue_size
+        import multiprocessing
+
+        #fork: os workers herdam o que o processo principal já carregou (api keys, sys.path) sem reimportar os scripts
+        methods: list = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        self.slots = threading.BoundedSemaphore(self.size + self.queue_size)
+        #Cada worker tem o próprio pipe e as requisições são distribuídas pelo processo principal (e não por uma fila
+        #compartilhada): um worker que morre não deixa travas presas, e sabe-se qual requisição ele executava
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.pending: dict = {}
+        self.backlog: deque = deque()
+        self.workers: list = []
+        self.operations: list = None
+        self.ready = threading.Event()
+        self.startup_error: str = None
+        self.draining: bool = False
+        self.closing: bool = False
+        #Tempo médio das requisições (média móvel exponencial), usado no Retry-After
+        self.mean_seconds: float = 1.0
+        self.done: int = 0
+        self.errors: int = 0
+        self.rejected: int = 0
+        self.crashed: int = 0
+
+        for slot in range(self.size):
+            self._start_worker(slot)
+        self.dispatcher = threading.Thread(target=self._dispatch, name="server-dispatcher", daemon=True)
+        self.dispatcher.start()
+
+    def _start_worker(self, slot: int):
+        connection, child_connection = self.context.Pipe()
+        process = self.context.Process(target=_worker_main, args=(self.factory, child_connection, slot), daemon=True)
+        process.start()
+        #Sem a ponta do worker aberta aqui, o pipe dá EOF quando o worker morre
+        child_connection.close()
+        self.workers.append(_Worker(process, connection, slot))
+
+    #Espera os workers carregarem as operações
+    def wait_ready(self, timeout: float = None) -> list:
+        if not self.ready.wait(timeout):
+            raise TimeoutError("Os workers não ficaram prontos a tempo")
+        if self.startup_error is not None:
+            raise RuntimeError(f"Falha ao iniciar os workers: {self.startup_error}")
+        return self.operations
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.mean_seconds * self.in_flight / self.size))
+
+    def submit(self, op: str, params: dict) -> Future:
+        if self.draining:
+            raise Overloaded("O servidor está sendo encerrado", self.retry_after())
+        if not self.slots.acquire(blocking=False):
+            self.rejected += 1
+            raise Overloaded("Fila cheia", self.retry_after())
+        future = Future()
+        future.add_done_callback(lambda _: self.slots.release())
+        with self.lock:
+            id: int = next(self.ids)
+            self.pending[id] = future
+            self.backlog.append((id, op, params))
+            self._assign()
+        return future
+
+    #Envia as requisições da fila aos workers livres (chamado com self.lock)
+    def _assign(self):
+        for worker in self.workers:
+            if not self.backlog:
+                return
+            if not worker.ready or worker.task is not None:
+                continue
+            task: tuple = self.backlog.popleft()
+            try:
+                worker.connection.send(task)
+                worker.task = task[0]
+            except OSError:
+                #O worker morreu; a requisição volta para a fila e o dispatcher substitui o worker
+                self.backlog.appendleft(task)
+                worker.ready = False
+
+    def _dispatch(self):
+        from multiprocessing.connection import wait as wait_connections
+
+        while True:
+            with self.lock:
+                workers: dict = {worker.connection: worker for worker in self.workers}
+            if self.closing and not workers:
+                return
+            for connection in wait_connections(list(workers), timeout=0.5):
+                worker: _Worker = workers[connection]
+                try:
+                    message: tuple = connection.recv()
+                except (EOFError, OSError):
+                    self._replace(worker)
+                    continue
+                self._handle(worker, message)
+
+    def _handle(self, worker: _Worker, message: tuple):
+        kind: str = message[0]
+        if kind == "failed":
+            self.startup_error = message[1]
+            self.ready.set()
+            return
+        if kind == "ready":
+            self.operations = message[1]
+            self.ready.set()
+            with self.lock:
+                worker.ready = True
+                self._assign()
+            return
+        if kind == "invalid":
+            self.errors += 1
+            with self.lock:
+                worker.task = None
+                future: Future = self.pending.pop(message[1], None)
+                self._assign()
+            if future is not None:
+                future.set_exception(InvalidRequest(message[2]))
+            return
+
+        id, ok, result, output, seconds = message[1:]
+        self.mean_seconds = 0.8 * self.mean_seconds + 0.2 * seconds
+        if ok:
+            self.done += 1
+        else:
+            self.errors += 1
+        with self.lock:
+            worker.task = None
+            future: Future = self.pending.pop(id, None)
+            self._assign()
+        if future is not None:
+            key: str = "result" if ok else "error"
+            future.set_result({"ok": ok, key: result, "output": output, "seconds": round(seconds, 4), "worker": worker.process.pid})
+
+    #O worker terminou: a requisição que ele executava falha (502) e, se o pool não está sendo encerrado, outro worker
+    #é criado no lugar, na mesma posição (e com os mesmos diretórios de worker_directory)
+    def _replace(self, worker: _Worker):
+        worker.process.join(timeout=1)
+        worker.connection.close()
+        with self.lock:
+            self.workers.remove(worker)
+            future: Future = self.pending.pop(worker.task, None) if worker.task is not None else None
+            #Um worker que falhou na inicialização falharia de novo
+            if not self.closing and self.startup_error is None:
+                self._start_worker(worker.slot)
+        if future is not None:
+            self.crashed += 1
+            future.set_exception(WorkerCrashed(f"O worker {worker.process.pid} terminou com código {worker.process.exitcode}"))
+
+    def stats(self) -> dict:
+        with self.lock:
+            workers: list = list(self.workers)
+        return {
+            "workers": self.size,
+            "alive": sum(worker.process.is_alive() for worker in workers),
+            "busy": sum(worker.task is not None for worker in workers),
+            "in_flight": self.in_flight,
+            "capacity": self.size + self.queue_size,
+            "draining": self.draining,
+            "done": self.done, "errors": self.errors, "rejected": self.rejected, "crashed": self.crashed,
+            "mean_seconds": round(self.mean_seconds, 4),
+        }
+
+    #Encerramento gracioso: recusa requisições novas, espera as em andamento por até timeout segundos e encerra os workers
+    def shutdown(self, timeout: float = None):
+        timeout = SERVER_DRAIN_TIMEOUT if timeout is None else timeout
+        self.draining = True
+        with self.lock:
+            pending: list = list(self.pending.values())
+        wait_futures(pending, timeout=timeout)
+
+        with self.lock:
+            self.closing = True
+            workers: list = list(self.workers)
+            for worker in workers:
+                try:
+                    worker.connection.send(None)
+                except OSError:
+                    pass
+        deadline: float = time.monotonic() + 5
+        for worker in workers:
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self.dispatcher.join(timeout=5)
+        with self.lock:
+            pending = list(self.pending.values())
+            self.pending.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(WorkerCrashed("O servidor foi encerrado antes do fim da requisição"))
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--serve", type=int, nargs="?", const=SERVER_PORT, metavar="PORTA",
+                        help=f"inicia a API HTTP local (padrão: porta {SERVER_PORT})")
+    parser.add_argument("--host", default="127.0.0.1", help="endereço da API HTTP")
+    parser.add_argument("--server-workers", type=int, default=None, help=f"processos do pool (padrão: {SERVER_WORKERS})")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help=f"requisições na fila além das em execução, antes de responder 503 (padrão: {SERVER_QUEUE_SIZE})")
+
+#Inicia o servidor descrito pelos argumentos de add_server_arguments e atende até SIGTERM/Ctrl+C
+def run_server_from_args(args, factory):
+    from utilitarios_llm.servidor_http import ApiServer
+
+    server = ApiServer(factory, port=args.serve, host=args.host, workers=args.server_workers, queue_size=args.queue_size)
+    server.serve()
@@ -0,0 +1,112 @@
+import sys
+import json
+import signal
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utilitarios_llm.servidor import (
+    SERVER_PORT, SERVER_REQUEST_TIMEOUT, InvalidRequest, Overloaded, WorkerCrashed, WorkerPool
+)
+
+#API HTTP do modo servidor: recebe as requisições e as repassa ao WorkerPool (ver utilitarios_llm/servidor.py).
+#Respostas: 200 (operação executada), 500 (a operação levantou uma exceção), 400 (JSON inválido ou parâmetros faltando ou
+#desconhecidos para a operação), 404 (operação desconhecida), 503 + Retry-After (fila cheia ou servidor sendo encerrado),
+#502 (o worker morreu) e 504 (a operação passou de request_timeout segundos).
+class _ApiHTTPHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload: bytes = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        pool: WorkerPool = self.server.pool
+        if self.path == "/health":
+            self._send_json(503 if pool.draining else 200, pool.stats())
+        elif self.path == "/operations":
+            self._send_json(200, {"operations": pool.operations})
+        else:
+            self._send_json(404, {"ok": False, "error": f"Caminho desconhecido: {self.path}"})
+
+    def do_POST(self):
+        pool: WorkerPool = self.server.pool
+        op: str = self.path.strip("/")
+        if op not in pool.operations:
+            self._send_json(404, {"ok": False, "error": f"Operação desconhecida: {op!r}"})
+            return
+        try:
+            body: bytes = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            params = json.loads(body) if body.strip() else {}
+            if not isinstance(params, dict):
+                raise ValueError("os parâmetros devem ser um objeto JSON")
+        except ValueError as e:
+            self._send_json(400, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+            return
+
+        try:
+            future: Future = pool.submit(op, params)
+        except Overloaded as e:
+            self._send_json(503, {"ok": False, "error": str(e)}, {"Retry-After": str(e.retry_after)})
+            return
+        try:
+            response: dict = future.result(timeout=self.server.request_timeout)
+        except FutureTimeoutError:
+            #A requisição continua no worker; somente o cliente deixa de esperar
+            self._send_json(504, {"ok": False, "error": "Tempo esgotado"})
+            return
+        except InvalidRequest as e:
+            self._send_json(400, {"ok": False, "error": str(e)})
+            return
+        except WorkerCrashed as e:
+            self._send_json(502, {"ok": False, "error": str(e)})
+            return
+        self._send_json(200 if response["ok"] else 500, response)
+
+class ApiServer:
+
+    def __init__(self, factory, port: int = None, host: str = "127.0.0.1", workers: int = None, queue_size: int = None,
+                 request_timeout: float = None, drain_timeout: float = None):
+        #A porta é reservada antes de criar os workers, para falhar logo se ela estiver em uso
+        self.httpd = ThreadingHTTPServer((host, SERVER_PORT if port is None else port), _ApiHTTPHandler)
+        self.httpd.daemon_threads = True
+        self.pool = WorkerPool(factory, workers, queue_size)
+        self.drain_timeout = drain_timeout
+        self.httpd.pool = self.pool
+        self.httpd.request_timeout = SERVER_REQUEST_TIMEOUT if request_timeout is None else request_timeout
+        self.stopping = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    #Atende até stop() (chamado por SIGTERM/SIGINT quando o servidor roda na thread principal) e então drena o pool
+    def serve(self, ready_timeout: float = None):
+        operations: list = self.pool.wait_ready(ready_timeout)
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda *_: self.stop())
+        thread = threading.Thread(target=self.httpd.serve_forever, name="api-server", daemon=True)
+        thread.start()
+        print(f"servindo {len(operations)} operações em {self.base_url} com {self.pool.size} workers", file=sys.stderr, flush=True)
+        self.stopping.wait()
+
+        print("encerrando, aguardando as requisições em andamento...", file=sys.stderr, flush=True)
+        self.pool.shutdown(self.drain_timeout)
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        print(f"encerrado: {self.pool.stats()}", file=sys.stderr, flush=True)
+
+    def stop(self):
+        self.stopping.set()
+
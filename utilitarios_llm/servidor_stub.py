@@ -0,0 +1,283 @@
+import json
+import time
+import random
+import hashlib
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#Servidor HTTP local que imita os endpoints da OpenAI usados pelo langchain (completions, chat/completions e embeddings).
+#Serve para testar e medir o código sem chaves e sem acesso à internet: basta apontar openai.api_base para server.api_base.
+#As respostas são determinísticas (derivadas do hash do prompt) e cada requisição pode ter uma latência artificial.
+#O servidor usa HTTP/1.1 com keep-alive e conta quantas conexões TCP foram abertas, o que permite verificar o reuso de conexões.
+#Para testar o tratamento de rate limit, o servidor pode responder 429 (com Retry-After) quando recebe mais que
+#max_requests_per_second requisições em um segundo, ou aleatoriamente em uma fração rate_limit_rate das requisições.
+#error_rate injeta erros 503 (servidor sobrecarregado) numa fração das requisições.
+#tokens_per_second simula a geração da resposta: a resposta demora completion_tokens / tokens_per_second além da latência
+#e, com stream=True, os tokens são enviados um a um (server-sent events), como na API real.
+#Prompts de agent ReAct e do LLMMathChain recebem respostas no formato que esses parsers esperam, e GET /search imita a
+#SerpAPI (basta apontar serpapi.SerpApiClient.BACKEND para server.base_url).
+#Exemplo:
+#   with StubOpenAIServer(latency=0.05) as server:
+#       openai.api_base = server.api_base
+#       ...
+EMBEDDING_DIM: int = 1536
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list:
+    seed: bytes = hashlib.sha256(text.encode()).digest()
+    values: list = [(seed[i % len(seed)] ^ (i * 31 % 256)) / 255.0 - 0.5 for i in range(dim)]
+    norm: float = sum(v * v for v in values) ** 0.5
+    return [v / norm for v in values]
+
+def fake_completion(prompt: str, extra_tokens: int = 0) -> str:
+    text: str = f" Stub answer {hashlib.sha256(prompt.encode()).hexdigest()[:8]}"
+    return text + "".join(f" token{i}" for i in range(extra_tokens))
+
+#Resposta no formato esperado pelo agent ReAct (zero-shot) e pelo LLMMathChain, ou None para os demais prompts
+def fake_structured_completion(prompt: str, extra_tokens: int = 0):
+    if "```text" in prompt and "numexpr" in prompt:
+        return "```text\n2 + 2\n```"
+    if "Action Input:" in prompt and "Final Answer:" in prompt and "Question:" in prompt:
+        question: str = prompt.rsplit("Question:", 1)[1]
+        if "Observation:" in question:
+            return f" I now know the final answer\nFinal Answer:{fake_completion(prompt, extra_tokens)}"
+        query: str = question.split("\n", 1)[0].strip()
+        return f" I should search for this.\nAction: Search\nAction Input: {query}"
+    return None
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    #Cabeçalhos e corpo saem em um único write (o handler faz flush ao final de cada requisição) e sem o algoritmo de
+    #Nagle; sem isso, em conexões keep-alive o ACK atrasado do cliente adiciona ~40ms a cada resposta.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.stub.on_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload: bytes = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    #Eventos enviados com Transfer-Encoding chunked, um token a cada delay segundos
+    def _send_events(self, events: list, delay: float):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in events + ["[DONE]"]:
+            data: bytes = f"data: {event if isinstance(event, str) else json.dumps(event)}\n\n".encode()
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        length: int = int(self.headers.get("Content-Length", 0))
+        request: dict = json.loads(self.rfile.read(length) or b"{}")
+        status, body, headers = self.server.stub.handle(self.path, request)
+        if isinstance(body, list):
+            self._send_events(body, self.server.stub.token_delay)
+        else:
+            self._send_json(status, body, headers)
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        status, body, headers = self.server.stub.handle_get(path, parse_qs(query))
+        self._send_json(status, body, headers)
+
+class StubOpenAIServer:
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0, ssl_context=None,
+                 max_requests_per_second: float = None, rate_limit_rate: float = 0.0, retry_after: float = None,
+                 error_rate: float = 0.0, tokens_per_second: float = None, completion_tokens: int = 0,
+                 search_latency: float = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.search_latency = latency if search_latency is None else search_latency
+        self.max_requests_per_second = max_requests_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.connections: int = 0
+        self.requests: int = 0
+        self.rate_limited: int = 0
+        self.errors: int = 0
+        self.searches: int = 0
+        self.recent: list = []
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.scheme: str = "http"
+        if ssl_context is not None:
+            self.httpd.socket = ssl_context.wrap_socket(self.httpd.socket, server_side=True)
+            self.scheme = "https"
+        self.thread: threading.Thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"{self.scheme}://{host}:{port}"
+
+    @property
+    def api_base(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def on_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def _is_rate_limited(self) -> bool:
+        now: float = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            self.recent = [t for t in self.recent if now - t < 1.0]
+            limited: bool = self.random.random() < self.rate_limit_rate
+            if self.max_requests_per_second is not None and len(self.recent) >= self.max_requests_per_second:
+                limited = True
+            if limited:
+                self.rate_limited += 1
+            else:
+                self.recent.append(now)
+            return limited
+
+    def _is_server_error(self) -> bool:
+        with self.lock:
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return True
+            return False
+
+    def handle(self, path: str, request: dict) -> tuple:
+        if self._is_rate_limited():
+            headers: dict = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+            return 429, {"error": {"message": "Rate limit reached for requests", "type": "requests", "param": None, "code": None}}, headers
+        if self._is_server_error():
+            return 503, {"error": {"message": "The server is overloaded or not ready yet.", "type": "server_error", "param": None, "code": None}}, {}
+        if self.latency:
+            time.sleep(self.latency)
+
+        if path.endswith("/chat/completions"):
+            body: dict = self.chat_completion(request)
+            if request.get("stream"):
+                return 200, self._chat_events(body), {}
+            self._generation_delay(body)
+            return 200, body, {}
+        if path.endswith("/completions"):
+            body = self.completion(request)
+            if request.get("stream"):
+                return 200, self._completion_events(body), {}
+            self._generation_delay(body)
+            return 200, body, {}
+        if path.endswith("/embeddings"):
+            return 200, self.embeddings(request), {}
+        return 404, {"error": {"message": f"Unknown path {path}", "type": "invalid_request_error"}}, {}
+
+    def handle_get(self, path: str, query: dict) -> tuple:
+        if path != "/search":
+            return 404, {"error": f"Unknown path {path}"}, {}
+        with self.lock:
+            self.requests += 1
+            self.searches += 1
+        if self.search_latency:
+            time.sleep(self.search_latency)
+        q: str = query.get("q", [""])[0]
+        return 200, {"search_metadata": {"status": "Success"}, "answer_box": {"answer": f"Stub search result for {q}"}}, {}
+
+    def _text(self, prompt: str) -> str:
+        return fake_structured_completion(prompt, self.completion_tokens) or fake_completion(prompt, self.completion_tokens)
+
+    #Sem streaming, o tempo de geração dos tokens é simulado antes de enviar a resposta inteira
+    def _generation_delay(self, body: dict):
+        if self.tokens_per_second:
+            time.sleep(body["usage"]["completion_tokens"] / self.tokens_per_second)
+
+    @staticmethod
+    def _tokens(text: str) -> list:
+        words: list = text.split(" ")
+        return [words[0]] + [f" {word}" for word in words[1:]]
+
+    def _completion_events(self, body: dict) -> list:
+        events: list = []
+        for choice in body["choices"]:
+            for token in self._tokens(choice["text"]):
+                events.append({"id": body["id"], "object": "text_completion", "created": body["created"], "model": body["model"],
+                               "choices": [{"text": token, "index": choice["index"], "logprobs": None, "finish_reason": None}]})
+        return events
+
+    def _chat_events(self, body: dict) -> list:
+        header: dict = {"id": body["id"], "object": "chat.completion.chunk", "created": body["created"], "model": body["model"]}
+        events: list = [{**header, "choices": [{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}]}]
+        for token in self._tokens(body["choices"][0]["message"]["content"]):
+            events.append({**header, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+        events.append({**header, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        return events
+
+    def completion(self, request: dict) -> dict:
+        prompts = request.get("prompt", "")
+        prompts = prompts if isinstance(prompts, list) else [prompts]
+        texts: list = [self._text(prompt) for prompt in prompts]
+        return {
+            "id": "cmpl-stub", "object": "text_completion", "created": int(time.time()), "model": request.get("model"),
+            "choices": [{"text": text, "index": i, "logprobs": None, "finish_reason": "stop"} for i, text in enumerate(texts)],
+            "usage": self._usage(prompts, texts),
+        }
+
+    def chat_completion(self, request: dict) -> dict:
+        prompt: str = "\n".join(message.get("content", "") for message in request.get("messages", []))
+        text: str = self._text(prompt)
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": self._usage([prompt], [text]),
+        }
+
+    def embeddings(self, request: dict) -> dict:
+        inputs = request.get("input", [])
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        #O langchain envia os textos já tokenizados (listas de inteiros)
+        texts: list = [text if isinstance(text, str) else " ".join(map(str, text)) for text in inputs]
+        return {
+            "object": "list", "model": request.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text)} for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": sum(len(t.split()) for t in texts), "total_tokens": sum(len(t.split()) for t in texts)},
+        }
+
+    @staticmethod
+    def _usage(prompts: list, texts: list) -> dict:
+        prompt_tokens: int = sum(len(p.split()) for p in prompts)
+        completion_tokens: int = sum(len(t.split()) for t in texts)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,104 @@
+import sys
+import time
+import queue
+import threading
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+#Suporte a streaming das respostas dos modelos (OpenAI e ChatOpenAI).
+#Com streaming=True o langchain chama on_llm_new_token a cada token recebido da API; o handler abaixo repassa cada token
+#(por padrão imprime no terminal) e mede, por chamada, o tempo até o primeiro token (TTFT) e o tempo total.
+#O usuário passa a ver a resposta começando a aparecer após o TTFT, em vez de esperar a resposta inteira.
+
+def print_token(token: str):
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+class StreamingTimingHandler(BaseCallbackHandler):
+
+    def __init__(self, on_token=print_token):
+        self.on_token = on_token
+        #Uma entrada por chamada ao modelo: {"ttft": segundos até o 1º token, "total": segundos, "tokens": quantidade}
+        self.calls: list = []
+        self._start: float = None
+        self._first_token: float = None
+        self._tokens: int = 0
+
+    def on_llm_start(self, serialized: dict, prompts: list, **kwargs):
+        self._start = time.perf_counter()
+        self._first_token = None
+        self._tokens = 0
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+        self._tokens += 1
+        if self.on_token is not None:
+            self.on_token(token)
+
+    def _finish(self):
+        if self._start is None:
+            return
+        end: float = time.perf_counter()
+        self.calls.append({
+            "ttft": (self._first_token or end) - self._start,
+            "total": end - self._start,
+            "tokens": self._tokens,
+        })
+        self._start = None
+
+    def on_llm_end(self, response, **kwargs):
+        self._finish()
+
+    def on_llm_error(self, error, **kwargs):
+        self._finish()
+
+    def report(self) -> str:
+        return "\n".join(
+            f"[streaming] chamada {i + 1}: primeiro token em {call['ttft']:.2f}s, total {call['total']:.2f}s, {call['tokens']} tokens"
+            for i, call in enumerate(self.calls)
+        )
+
+#Cópia rasa do modelo (OpenAI/ChatOpenAI) com os campos de update alterados, que reaproveita o client.
+#Usada para mudar parâmetros (temperature, batch_size, streaming...) de uma chamada sem mudar o modelo compartilhado,
+#que pode estar sendo usado por outras threads.
+def copy_model(model, **update):
+    copied = model.copy(update=update)
+    #copy() não copia os campos marcados com exclude=True (callbacks, callback_manager), que os models ainda acessam
+    for name in model.__fields__:
+        if name not in copied.__dict__:
+            copied.__dict__[name] = model.__dict__.get(name)
+    return copied
+
+#Cópia do modelo com streaming ligado. Evita mudar o modelo compartilhado, já que streaming não funciona em chamadas
+#com vários prompts (ex: chain.apply).
+def streaming_model(model, **update):
+    return copy_model(model, streaming=True, **update)
+
+#Versão em generator: executa call(handler) em uma thread e devolve os tokens à medida que chegam.
+#call deve fazer a chamada ao modelo passando o handler recebido em callbacks. Ao final, o generator retorna
+#(StopIteration.value) o resultado de call; exceções da chamada são relançadas no consumidor.
+def iter_stream(call):
+    tokens: queue.Queue = queue.Queue()
+    done = object()
+    handler = StreamingTimingHandler(on_token=tokens.put)
+    outcome: dict = {}
+
+    def run():
+        try:
+            outcome["result"] = call(handler)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            tokens.put(done)
+
+    threading.Thread(target=run, daemon=True).start()
+    while True:
+        token = tokens.get()
+        if token is done:
+            break
+        yield token
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
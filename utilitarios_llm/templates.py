@@ -0,0 +1,146 @@
+import string
+import threading
+from collections import OrderedDict
+
+from pydantic import PrivateAttr
+from langchain.prompts import FewShotPromptTemplate, PromptTemplate
+
+#Templates de prompt compilados, para uso em loops.
+#Criar um PromptTemplate valida as variáveis e faz o parse do template, e o format do langchain usa um Formatter escrito
+#em Python. Aqui cada template é validado uma vez (get_prompt_template guarda os templates já criados) e, quando só
+#tem campos simples ({nome}, sem conversões ou formatação), o format vira um str.format_map, feito em C.
+#CachedFewShotPromptTemplate também guarda os blocos dos exemplos já renderizados.
+#Ver benchmarks/benchmark_templates.py.
+EXAMPLE_BLOCK_CACHE_SIZE: int = 4096
+
+#Retorna os campos do template se todos forem simples, ou None se o template precisar do Formatter completo
+def _simple_fields(template: str) -> frozenset:
+    fields: set = set()
+    try:
+        parsed: list = list(string.Formatter().parse(template))
+    except ValueError:
+        return None
+    for _, field_name, format_spec, conversion in parsed:
+        if field_name is None:
+            continue
+        if not field_name.isidentifier() or format_spec or conversion:
+            return None
+        fields.add(field_name)
+    return frozenset(fields)
+
+class CompiledPromptTemplate(PromptTemplate):
+
+    _fields: frozenset = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.template_format == "f-string":
+            self._fields = _simple_fields(self.template)
+
+    def format(self, **kwargs) -> str:
+        if self._fields is None:
+            return super().format(**kwargs)
+        if self.partial_variables:
+            kwargs = self._merge_partial_and_user_variables(**kwargs)
+        #Mesma regra do StrictFormatter do langchain: variáveis a mais são erro
+        if len(kwargs) != len(self._fields) and kwargs.keys() - self._fields:
+            raise KeyError(set(kwargs.keys() - self._fields))
+        return self.template.format_map(kwargs)
+
+    def format_many(self, inputs: list) -> list:
+        if self._fields is None or self.partial_variables:
+            return [self.format(**values) for values in inputs]
+        template: str = self.template
+        fields: frozenset = self._fields
+        results: list = []
+        for values in inputs:
+            if len(values) != len(fields) and values.keys() - fields:
+                raise KeyError(set(values.keys() - fields))
+            results.append(template.format_map(values))
+        return results
+
+_registry: dict = {}
+_registry_lock = threading.Lock()
+
+#Registro dos templates: o mesmo (template, input_variables, template_format) retorna sempre o mesmo objeto já validado
+def get_prompt_template(template: str, input_variables: list = None, template_format: str = "f-string") -> CompiledPromptTemplate:
+    key = (template, tuple(input_variables) if input_variables is not None else None, template_format)
+    prompt: CompiledPromptTemplate = _registry.get(key)
+    if prompt is None:
+        with _registry_lock:
+            prompt = _registry.get(key)
+            if prompt is None:
+                if input_variables is None:
+                    prompt = CompiledPromptTemplate.from_template(template)
+                else:
+                    prompt = CompiledPromptTemplate(input_variables=list(input_variables), template=template, template_format=template_format)
+                _registry[key] = prompt
+    return prompt
+
+def format_many(prompt: PromptTemplate, inputs: list) -> list:
+    if isinstance(prompt, CompiledPromptTemplate):
+        return prompt.format_many(inputs)
+    return [prompt.format(**values) for values in inputs]
+
+#FewShotPromptTemplate que guarda o texto de cada exemplo renderizado (pelo conteúdo do exemplo) e formata prefix e
+#suffix com templates compilados. Diferente do FewShotPromptTemplate do langchain, o texto dos exemplos entra no prompt
+#como está, sem passar de novo pelo format (chaves dentro de um exemplo não são tratadas como variáveis).
+class CachedFewShotPromptTemplate(FewShotPromptTemplate):
+
+    _blocks: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    #O template é compartilhado entre threads (ex: chain.apply com max_concurrency): _blocks só é acessado com o lock
+    _blocks_lock = PrivateAttr(default_factory=threading.Lock)
+    _prefix: CompiledPromptTemplate = PrivateAttr(default=None)
+    _suffix: CompiledPromptTemplate = PrivateAttr(default=None)
+    _fields: frozenset = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.template_format == "f-string":
+            prefix_fields, suffix_fields = _simple_fields(self.prefix), _simple_fields(self.suffix)
+            if prefix_fields is not None and suffix_fields is not None:
+                self._prefix = get_prompt_template(self.prefix, sorted(prefix_fields))
+                self._suffix = get_prompt_template(self.suffix, sorted(suffix_fields))
+                self._fields = prefix_fields | suffix_fields
+
+    def _render_example(self, example: dict) -> str:
+        try:
+            key = tuple(sorted(example.items()))
+            hash(key)
+        except TypeError:
+            return self.example_prompt.format(**example)
+        with self._blocks_lock:
+            block: str = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+                return block
+        block = self.example_prompt.format(**example)
+        with self._blocks_lock:
+            self._blocks[key] = block
+            while len(self._blocks) > EXAMPLE_BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return block
+
+    #Um selector que já guarda os exemplos formatados com o mesmo example_prompt (ex: TokenBudgetExampleSelector)
+    #fornece os blocos prontos; nos demais casos os exemplos são renderizados aqui
+    def _example_blocks(self, kwargs: dict) -> list:
+        selector = self.example_selector
+        if self.examples is None and hasattr(selector, "select_blocks") and selector.blocks.example_prompt is self.example_prompt:
+            return selector.select_blocks(kwargs)
+        return [self._render_example(example) for example in self._get_examples(**kwargs)]
+
+    def format(self, **kwargs) -> str:
+        if self._fields is None:
+            return super().format(**kwargs)
+        kwargs = self._merge_partial_and_user_variables(**kwargs)
+        if kwargs.keys() - self._fields:
+            raise KeyError(set(kwargs.keys() - self._fields))
+        pieces: list = [
+            self._prefix.format(**{name: kwargs[name] for name in self._prefix._fields}),
+            *self._example_blocks(kwargs),
+            self._suffix.format(**{name: kwargs[name] for name in self._suffix._fields}),
+        ]
+        return self.example_separator.join(piece for piece in pieces if piece)
+
+    def format_many(self, inputs: list) -> list:
+        return [self.format(**values) for values in inputs]
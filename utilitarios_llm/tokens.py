@@ -0,0 +1,29 @@
+import functools
+
+import tiktoken
+
+#Contagem de tokens com o tiktoken, compartilhada pelos módulos que precisam respeitar um orçamento de tokens.
+#O encoding de cada modelo é carregado uma única vez por processo. Se o arquivo do encoding não puder ser obtido
+#(ex: máquina sem acesso à internet e sem o cache do tiktoken), usa-se a aproximação de ~4 caracteres por token.
+
+#Overhead de cada mensagem no formato de chat da OpenAI (papel, separadores) e dos tokens que iniciam a resposta
+TOKENS_PER_MESSAGE: int = 4
+TOKENS_PER_REPLY: int = 3
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-3.5-turbo"):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(content: str, model: str = "gpt-3.5-turbo") -> int:
+    return count_tokens(content, model) + TOKENS_PER_MESSAGE